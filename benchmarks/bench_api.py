@@ -0,0 +1,113 @@
+# bench_api.py
+# HTTP接口压测：并发请求 /sankey，统计吞吐量、延迟分位数、缓存命中与304比例
+# 用法：
+#   python benchmarks/bench_api.py                                   # 进程内启动接口（合成数据），完全离线
+#   python benchmarks/bench_api.py --url http://127.0.0.1:8765       # 压测已启动的接口
+#   python benchmarks/bench_api.py --requests 2000 --concurrency 16 --ranges 50 --revalidate 0.5
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+KEYWORDS = ["", "dsp", "shopify", "us", "自然"]
+
+
+def start_local_server(days, workers):
+    # 合成数据 + 临时端口，返回 (server, base_url)
+    from sankey_api import dataset_from_facts, make_server
+    from sankey_core import prepare_dates, build_fact_table
+    from synthetic import make_traffic_frame
+
+    dataset = dataset_from_facts(build_fact_table(prepare_dates(make_traffic_frame(days, rows_per_day=5))))
+    server = make_server(dataset, port=0, workers=workers)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def make_queries(base_url, n_ranges, seed):
+    # 随机日期区间 × 关键词，模拟门户中反复查看的少量视图
+    with urllib.request.urlopen(f"{base_url}/dataset") as response:
+        info = json.load(response)
+    days = pd.date_range(info["first_day"], info["last_day"], freq="D")
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(n_ranges):
+        lo, hi = sorted(rng.sample(range(len(days)), 2)) if len(days) > 1 else (0, 0)
+        params = {"start": f"{days[lo]:%Y-%m-%d}", "end": f"{days[hi]:%Y-%m-%d}", "q": rng.choice(KEYWORDS)}
+        queries.append(f"{base_url}/sankey?{urlencode(params)}")
+    return queries
+
+
+def fetch(url, etags, revalidate, rng_lock, rng):
+    headers = {"Accept-Encoding": "gzip"}
+    with rng_lock:
+        use_etag = url in etags and rng.random() < revalidate
+    if use_etag:
+        headers["If-None-Match"] = etags[url]
+    begin = time.perf_counter()
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers)) as response:
+            body = response.read()
+            status = response.status
+            etags[url] = response.headers.get("ETag")
+    except urllib.error.HTTPError as e:
+        body, status = b"", e.code
+    return status, time.perf_counter() - begin, len(body)
+
+
+def main(args):
+    server = None
+    base_url = args.url
+    if not base_url:
+        server, base_url = start_local_server(args.days, args.workers)
+    try:
+        queries = make_queries(base_url, args.ranges, args.seed)
+        rng = random.Random(args.seed)
+        rng_lock = threading.Lock()
+        urls = [rng.choice(queries) for _ in range(args.requests)]
+        etags = {}
+        begin = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(lambda url: fetch(url, etags, args.revalidate, rng_lock, rng), urls))
+        elapsed = time.perf_counter() - begin
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    latencies = sorted(seconds * 1000 for _, seconds, _ in results)
+    statuses = {}
+    for status, _, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    print(f"请求数 {len(results)}，并发 {args.concurrency}，不同视图 {len(queries)}，总耗时 {elapsed:.2f}s")
+    print(f"吞吐量 {len(results) / elapsed:.1f} 请求/秒")
+    print(f"延迟(ms) p50 {statistics.median(latencies):.2f}  p95 {latencies[int(len(latencies) * 0.95) - 1]:.2f}  "
+          f"max {latencies[-1]:.2f}")
+    print(f"状态码 {statuses}，平均响应 {statistics.mean(size for _, _, size in results) / 1024:.1f} KB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="桑基图HTTP接口压测")
+    parser.add_argument("--url", help="已启动接口的地址，不指定时在进程内用合成数据启动")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--ranges", type=int, default=30, help="随机日期区间（视图）数量")
+    parser.add_argument("--revalidate", type=float, default=0.5, help="已拿到ETag时带If-None-Match的概率")
+    parser.add_argument("--days", type=int, default=365, help="进程内启动时合成数据的天数")
+    parser.add_argument("--workers", type=int, default=8, help="进程内启动时接口的线程数")
+    parser.add_argument("--seed", type=int, default=0)
+    logging.basicConfig(level=logging.ERROR)
+    main(parser.parse_args())
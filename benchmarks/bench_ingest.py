@@ -0,0 +1,94 @@
+# bench_ingest.py
+# 链路展开耗时对比：旧版 iterrows 逐行循环 vs 向量化 build_edge_frame
+# 用法：python benchmarks/bench_ingest.py [行数 ...]   默认 100000 1000000 5000000
+import logging
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sankey_config import SITE_CONFIG, TRAFFIC_MAPPING, INVALID_TRAFFIC_TYPES  # noqa: E402
+from sankey_core import prepare_dates, build_edge_frame  # noqa: E402
+from synthetic import make_traffic_frame  # noqa: E402
+
+DEFAULT_SIZES = [100_000, 1_000_000, 5_000_000]
+
+
+# ===================== 1. 旧版实现（对照组） =====================
+def legacy_build_edge_frame(df):
+    data_raw = []
+    for _, row in df.iterrows():
+        if pd.isna(row["date"]):
+            continue
+
+        traffic_type = row["流量类型"]
+        if traffic_type in INVALID_TRAFFIC_TYPES:
+            continue
+
+        if traffic_type not in TRAFFIC_MAPPING:
+            continue
+
+        cfg = TRAFFIC_MAPPING[traffic_type]
+        if cfg["site"] not in SITE_CONFIG:
+            continue
+
+        date = row["date"].strftime("%Y-%m-%d")
+        exposure = pd.to_numeric(row["曝光"], errors="coerce") if pd.notna(row["曝光"]) else 0.0
+        click = pd.to_numeric(row["点击"], errors="coerce") if pd.notna(row["点击"]) else 0.0
+        sales = pd.to_numeric(row["销量"], errors="coerce") if pd.notna(row["销量"]) else 0.0
+
+        data_raw.extend([
+            [traffic_type, cfg["nodes"]["exposure"], float(exposure), date, cfg["group_id"], traffic_type],
+            [cfg["nodes"]["exposure"], cfg["nodes"]["level2_exposure"], float(exposure), date, cfg["group_id"], traffic_type],
+            [cfg["nodes"]["level2_exposure"], "总曝光", float(exposure), date, cfg["group_id"], traffic_type],
+            ["总曝光", cfg["nodes"]["click"], float(click), date, cfg["group_id"], traffic_type],
+            [cfg["nodes"]["click"], cfg["nodes"]["level2_click"], float(click), date, cfg["group_id"], traffic_type],
+            [cfg["nodes"]["level2_click"], "总点击", float(click), date, cfg["group_id"], traffic_type],
+            ["总点击", cfg["nodes"]["sales"], float(sales), date, cfg["group_id"], traffic_type],
+            [cfg["nodes"]["sales"], cfg["nodes"]["level2_sales"], float(sales), date, cfg["group_id"], traffic_type],
+            [cfg["nodes"]["level2_sales"], "总销量", float(sales), date, cfg["group_id"], traffic_type]
+        ])
+
+    result_df = pd.DataFrame(data_raw, columns=["source", "target", "value", "date", "group", "traffic_type"])
+    if not result_df.empty:
+        result_df["date"] = pd.to_datetime(result_df["date"])
+        result_df["value"] = pd.to_numeric(result_df["value"], errors="coerce").fillna(0.0)
+    return result_df
+
+
+# ===================== 2. 测试数据 =====================
+def make_input_frame(n_rows, seed=0):
+    # 一年的合成数据，另含1个未配置流量类型；已完成日期预处理
+    n_types = len(TRAFFIC_MAPPING) + 1
+    rows_per_day = max(1, round(n_rows / (365 * n_types)))
+    return prepare_dates(make_traffic_frame(365, n_types, rows_per_day=rows_per_day, seed=seed))
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+# ===================== 3. 主流程 =====================
+def main(sizes):
+    print(f"{'行数':>10} {'旧版(s)':>10} {'向量化(s)':>10} {'加速比':>8}  结果一致")
+    for n_rows in sizes:
+        df = make_input_frame(n_rows)
+        n_rows = len(df)
+        new_df, new_time = _timed(build_edge_frame, df)
+        old_df, old_time = _timed(legacy_build_edge_frame, df)
+        try:
+            pd.testing.assert_frame_equal(old_df, new_df)
+            same = "是"
+        except AssertionError:
+            same = "否"
+        print(f"{n_rows:>10} {old_time:>10.2f} {new_time:>10.3f} {old_time / new_time:>8.1f}x  {same}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.ERROR)
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,224 @@
+# bench_pipeline.py
+# 分阶段性能基准：Excel读取（pandas整表 vs 各解析引擎）/列式读取、事实表构建、日期筛选聚合、节点统计、链路构建、Figure构建
+# 结果写入JSON，可与历史结果对比发现性能回退
+# 用法：
+#   python benchmarks/bench_pipeline.py --days 365 --rows-per-day 20
+#   python benchmarks/bench_pipeline.py --compare benchmarks/results/上次结果.json
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import sankey_cache  # noqa: E402
+from sankey_core import (  # noqa: E402
+    prepare_dates, build_fact_table, build_daily_cube, aggregate_range, build_node_list,
+    compute_node_flows, build_node_customdata, match_traffic_types,
+    build_node_colors, build_links, build_figure, make_title, compute_sankey
+)
+from sankey_io import read_table, available_engines  # noqa: E402
+from synthetic import make_traffic_frame, write_workbook  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+# ===================== 1. 计时工具 =====================
+def time_stage(results, name, func, repeat, rows_in=None, rows_out=None):
+    # 重复执行取最小值/中位数，rows_out 可为根据返回值计算行数的函数
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    results[name] = {
+        "min_s": round(min(timings), 6),
+        "median_s": round(statistics.median(timings), 6),
+        "repeat": repeat,
+        "rows_in": rows_in,
+        "rows_out": rows_out(result) if callable(rows_out) else rows_out,
+    }
+    logging.info(f"{name:<18} min={min(timings):.4f}s median={statistics.median(timings):.4f}s")
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ===================== 2. 基准流程 =====================
+def run_benchmark(args):
+    raw_df = make_traffic_frame(
+        args.days, args.traffic_types, args.sites, args.rows_per_day, args.invalid_ratio, seed=args.seed
+    )
+    logging.info(f"合成数据行数：{len(raw_df)}")
+    stages = {}
+    repeat = args.repeat
+
+    if len(raw_df) <= args.excel_max_rows:
+        # 真实导出通常带有大量应用不使用的列，用填充列模拟宽表
+        wide_df = raw_df.assign(**{f"备注{i + 1}": "-" for i in range(args.extra_columns)})
+        buffer = io.BytesIO()
+        write_workbook(wide_df, buffer)
+        file_bytes = buffer.getvalue()
+        time_stage(stages, "excel_parse_pandas", lambda: pd.read_excel(io.BytesIO(file_bytes)), 1,
+                   rows_in=len(raw_df), rows_out=len)
+        for engine in available_engines():
+            time_stage(stages, f"excel_parse_{engine}", lambda: read_table(file_bytes, engine=engine), 1,
+                       rows_in=len(raw_df), rows_out=len)
+    else:
+        logging.info(f"行数超过 --excel-max-rows={args.excel_max_rows}，跳过Excel解析阶段")
+
+    dated_df = time_stage(stages, "date_parse", lambda: prepare_dates(raw_df.copy()), repeat,
+                          rows_in=len(raw_df), rows_out=len)
+    facts = time_stage(stages, "fact_build", lambda: build_fact_table(dated_df), repeat,
+                       rows_in=len(dated_df), rows_out=len)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        sankey_cache.CACHE_DIR = cache_dir
+        sankey_cache.store_cached("bench", facts)
+        time_stage(stages, "columnar_load", lambda: sankey_cache.load_cached("bench"), repeat,
+                   rows_out=len)
+
+    cube = time_stage(stages, "cube_build", lambda: build_daily_cube(facts), repeat,
+                      rows_in=len(facts), rows_out=lambda c: int(c["prefix"].size))
+    days = cube["days"]
+    start_date, end_date = days[0], days[-1]
+    aggregated_df = time_stage(stages, "filter_aggregate", lambda: aggregate_range(cube, start_date, end_date),
+                               repeat, rows_in=len(facts), rows_out=len)
+
+    all_nodes = build_node_list()
+
+    def node_stats():
+        incoming, outgoing = compute_node_flows(aggregated_df, all_nodes)
+        return build_node_customdata(all_nodes, incoming, outgoing)
+
+    node_customdata = time_stage(stages, "node_stats", node_stats, repeat,
+                                 rows_in=len(aggregated_df), rows_out=len)
+    matched_traffic_types = match_traffic_types(args.search)
+    links = time_stage(
+        stages, "link_build",
+        lambda: build_links(aggregated_df, all_nodes, matched_traffic_types, 0.5, 5.0), repeat,
+        rows_in=len(aggregated_df), rows_out=lambda r: len(r["value"])
+    )
+    sankey = {
+        "aggregated_df": aggregated_df,
+        "all_nodes": all_nodes,
+        "node_customdata": node_customdata,
+        "node_colors": build_node_colors(matched_traffic_types),
+        "matched_traffic_types": matched_traffic_types,
+        "links": links,
+    }
+    # 日期区间结果已缓存时，只改变搜索词/缩放系数的交互延迟
+    compute_sankey(cube, start_date, end_date)
+    time_stage(
+        stages, "restyle",
+        lambda: compute_sankey(cube, start_date, end_date, args.search, 0.3, 7.0), repeat,
+        rows_out=lambda r: len(r["links"]["value"])
+    )
+    title_text = make_title(start_date.date(), end_date.date(), args.search)
+    time_stage(stages, "figure_build", lambda: build_figure(sankey, title_text), repeat,
+               rows_in=len(links["value"]))
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+        },
+        "params": {
+            "days": args.days,
+            "traffic_types": args.traffic_types,
+            "sites": args.sites,
+            "rows_per_day": args.rows_per_day,
+            "invalid_ratio": args.invalid_ratio,
+            "extra_columns": args.extra_columns,
+            "seed": args.seed,
+            "input_rows": len(raw_df),
+        },
+        "stages": stages,
+    }
+
+
+# ===================== 3. 结果对比 =====================
+def compare_results(current, previous, threshold):
+    # 以 min_s 对比，超过阈值视为回退
+    regressions = []
+    if current["params"] != previous.get("params"):
+        logging.warning("两次运行的参数不同，对比结果仅供参考")
+    print(f"{'阶段':<18} {'上次(s)':>10} {'本次(s)':>10} {'变化':>8}")
+    for name, stage in current["stages"].items():
+        old = previous.get("stages", {}).get(name)
+        if not old or not old["min_s"]:
+            continue
+        change = stage["min_s"] / old["min_s"] - 1
+        flag = "  ⚠️ 回退" if change > threshold else ""
+        print(f"{name:<18} {old['min_s']:>10.4f} {stage['min_s']:>10.4f} {change:>+8.1%}{flag}")
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="桑基图数据流程分阶段性能基准")
+    parser.add_argument("--days", type=int, default=365, help="天数")
+    parser.add_argument("--traffic-types", type=int, default=None, help="流量类型数量，默认全部已配置类型")
+    parser.add_argument("--sites", nargs="*", default=None, help="仅生成指定站点的流量类型")
+    parser.add_argument("--rows-per-day", type=int, default=10, help="每天每个流量类型的记录数")
+    parser.add_argument("--invalid-ratio", type=float, default=0.05, help="无效行比例")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--search", default="", help="高亮关键词")
+    parser.add_argument("--repeat", type=int, default=3, help="每阶段重复次数")
+    parser.add_argument("--extra-columns", type=int, default=20, help="Excel解析阶段额外写入的无关列数")
+    parser.add_argument("--excel-max-rows", type=int, default=50_000, help="超过该行数时跳过Excel解析阶段")
+    parser.add_argument("--output", help="结果JSON路径，默认写入 benchmarks/results/")
+    parser.add_argument("--compare", help="与之前的结果JSON对比")
+    parser.add_argument("--threshold", type=float, default=0.2, help="回退判定阈值（相对变化）")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    logging.getLogger("sankey_core").setLevel(logging.ERROR)
+    logging.getLogger("sankey_cache").setLevel(logging.ERROR)
+
+    result = run_benchmark(args)
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"bench_{stamp}_{result['meta']['commit'] or 'nogit'}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    logging.info(f"结果已写入：{output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)
+        if compare_results(result, previous, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
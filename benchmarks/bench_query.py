@@ -0,0 +1,70 @@
+# bench_query.py
+# 事实库查询后端对比：memory（全部载入 + 前缀和）vs arrow / duckdb（条件下推、按需读取）
+# 测量：首次可用耗时、常驻内存增量、一个月/一个季度/全部历史区间的单次聚合耗时，并校验结果一致
+# 用法：python benchmarks/bench_query.py [--days 730] [--rows-per-day 20]
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sankey_core import prepare_dates, build_fact_table, build_daily_cube, aggregate_type_totals  # noqa: E402
+from sankey_io import facts_to_daily  # noqa: E402
+from sankey_perf import current_rss  # noqa: E402
+from sankey_query import available_backends, store_query_cube  # noqa: E402
+from sankey_store import ingest_daily, load_store_facts  # noqa: E402
+from synthetic import make_traffic_frame  # noqa: E402
+
+
+def open_backend(backend, store_dir):
+    if backend == "memory":
+        return build_daily_cube(load_store_facts(store_dir))
+    return store_query_cube(store_dir, backend)
+
+
+def main(args):
+    store_dir = tempfile.mkdtemp(prefix="sankey_bench_store_")
+    try:
+        raw_df = make_traffic_frame(args.days, rows_per_day=args.rows_per_day, invalid_ratio=0.0, seed=args.seed)
+        ingest_daily(facts_to_daily(build_fact_table(prepare_dates(raw_df))), store_dir)
+        del raw_df
+        windows = {"一个月": 30, "一个季度": 91, "全部": args.days}
+        reference = None
+        print(f"{'后端':<8} {'打开(s)':>8} {'内存增量(MB)':>12} " + " ".join(f"{name:>10}" for name in windows))
+        for backend in available_backends():
+            rss_before = current_rss() or 0
+            begin = time.perf_counter()
+            cube = open_backend(backend, store_dir)
+            opened = time.perf_counter() - begin
+            rss_delta = ((current_rss() or 0) - rss_before) / 1024 / 1024
+            timings, results = [], []
+            for length in windows.values():
+                end_date = cube["days"][-1]
+                start_date = end_date - pd.Timedelta(days=length - 1)
+                begin = time.perf_counter()
+                results.append(aggregate_type_totals(cube, start_date, end_date))
+                timings.append(time.perf_counter() - begin)
+            if reference is None:
+                reference = results
+            same = all(np.array_equal(a, b) for a, b in zip(reference, results))
+            print(f"{backend:<8} {opened:>8.3f} {rss_delta:>12.1f} "
+                  + " ".join(f"{seconds * 1000:>8.1f}ms" for seconds in timings)
+                  + ("" if same else "  结果不一致！"))
+    finally:
+        shutil.rmtree(store_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="事实库查询后端对比")
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--rows-per-day", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    logging.basicConfig(level=logging.ERROR)
+    main(parser.parse_args())
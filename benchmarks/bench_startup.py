@@ -0,0 +1,230 @@
+# bench_startup.py
+# 冷启动基准：每轮启动一个全新的Python进程，用 Streamlit AppTest 运行页面，测量首张图表渲染完成的时间
+# - 首个会话：新进程中的第一次运行（导入、拓扑编译、读取数据、plotly首次建图）
+# - 第二个会话：同一进程中新开的会话（模块和共享数据已载入）
+# 各轮进程使用不同的 PYTHONHASHSEED，并比较节点顺序指纹，确认节点顺序跨进程一致
+# 用法：
+#   python benchmarks/bench_startup.py --runs 5
+#   python benchmarks/bench_startup.py --cold-cache            # 每轮使用空的磁盘缓存（含Excel解析）
+#   python benchmarks/bench_startup.py --compare benchmarks/results/上次结果.json
+import argparse
+import hashlib
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+SESSIONS = ["first_session", "second_session"]
+
+
+# ===================== 1. 子进程：运行页面 =====================
+class _RunCollector(logging.Handler):
+    # 收集 sankey_perf 每次运行输出的JSON日志（阶段耗时、阶段结束时间）
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        try:
+            self.records.append(json.loads(record.getMessage()))
+        except ValueError:
+            pass
+
+
+def _node_order_digest():
+    # 节点名称、颜色及链路端点编号的指纹：各进程一致时，按节点编号缓存的图表可跨进程复用
+    from sankey_config import TOPOLOGY
+
+    payload = json.dumps([
+        list(TOPOLOGY["nodes"]), TOPOLOGY["node_colors"].tolist(),
+        TOPOLOGY["edge_source"].tolist(), TOPOLOGY["edge_target"].tolist(),
+    ], ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _run_session(collector, timeout):
+    from streamlit.testing.v1 import AppTest
+
+    collector.records.clear()
+    begin = time.perf_counter()
+    app = AppTest.from_file(os.path.join(ROOT, "sankey.py"), default_timeout=timeout).run()
+    wall = time.perf_counter() - begin
+    if app.exception:
+        raise RuntimeError(f"页面运行出错：{app.exception[0].value}")
+    stages = [record for record in collector.records if record.get("event") == "stage"]
+    run = next((record for record in collector.records if record.get("event") == "run"), {})
+    chart = next((record for record in stages if record["stage"] == "chart_render"), None)
+    return {
+        "first_chart_s": chart["finished_at"] if chart else None,
+        "run_s": run.get("seconds"),
+        # AppTest 按0.1秒间隔轮询运行状态，wall_s 只作参考
+        "wall_s": round(wall, 6),
+        "charts": len(app.get("plotly_chart")),
+        "stages": {record["stage"]: record["seconds"] for record in stages},
+    }
+
+
+def run_child(timeout):
+    begin = time.perf_counter()
+    import streamlit.testing.v1  # noqa: F401
+    import_s = time.perf_counter() - begin
+
+    collector = _RunCollector()
+    # sankey_perf 的日志器自带处理器且不向根日志传播，这里追加收集器
+    logging.getLogger("sankey_perf").addHandler(collector)
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+    result = {"import_s": round(import_s, 6)}
+    for session in SESSIONS:
+        result[session] = _run_session(collector, timeout)
+    result["node_order"] = _node_order_digest()
+    print(json.dumps(result, ensure_ascii=False))
+
+
+# ===================== 2. 主进程：多轮汇总 =====================
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True, cwd=ROOT
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def spawn_child(index, args):
+    env = {**os.environ, "PYTHONHASHSEED": str(index + 1)}
+    with tempfile.TemporaryDirectory() as cache_dir:
+        if args.cold_cache:
+            env["SANKEY_CACHE_DIR"] = cache_dir
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", "--timeout", str(args.timeout)],
+            cwd=ROOT, env=env, capture_output=True, text=True
+        )
+    if completed.returncode != 0:
+        raise RuntimeError(f"第 {index + 1} 轮运行失败：\n{completed.stderr[-2000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def _summary(values):
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    return {"min_s": round(min(values), 6), "median_s": round(statistics.median(values), 6)}
+
+
+def run_benchmark(args):
+    runs = []
+    for index in range(args.runs):
+        child = spawn_child(index, args)
+        runs.append(child)
+        logging.info(
+            f"第 {index + 1} 轮：导入 {child['import_s']:.3f}s，首个会话首图 {child['first_session']['first_chart_s']:.3f}s"
+            f"（整次运行 {child['first_session']['run_s']:.3f}s），第二个会话首图 "
+            f"{child['second_session']['first_chart_s']:.3f}s"
+        )
+
+    metrics = {"import": _summary([run["import_s"] for run in runs])}
+    for session in SESSIONS:
+        for key in ("first_chart_s", "run_s"):
+            metrics[f"{session}_{key[:-2]}"] = _summary([run[session][key] for run in runs])
+    stage_names = list(dict.fromkeys(name for run in runs for name in run["first_session"]["stages"]))
+    first_stages = {
+        name: _summary([run["first_session"]["stages"].get(name) for run in runs]) for name in stage_names
+    }
+    node_orders = sorted({run["node_order"] for run in runs})
+    return {
+        "meta": {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "params": {"runs": args.runs, "cold_cache": args.cold_cache},
+        "metrics": metrics,
+        "first_session_stages": first_stages,
+        "node_order_stable": len(node_orders) == 1,
+        "node_order": node_orders,
+    }
+
+
+def print_report(result):
+    print(f"{'指标':<30} {'最小(s)':>10} {'中位数(s)':>10}")
+    for name, summary in result["metrics"].items():
+        if summary:
+            print(f"{name:<30} {summary['min_s']:>10.4f} {summary['median_s']:>10.4f}")
+    print("首个会话各阶段（中位数）：")
+    for name, summary in sorted(result["first_session_stages"].items(), key=lambda item: -item[1]["median_s"]):
+        print(f"  {name:<28} {summary['median_s'] * 1000:>10.1f} ms")
+    stable = "一致" if result["node_order_stable"] else "不一致 ⚠️"
+    print(f"节点顺序（{result['params']['runs']} 个进程，不同 PYTHONHASHSEED）：{stable}")
+
+
+# ===================== 3. 结果对比 =====================
+def compare_results(current, previous, threshold):
+    # 以 median_s 对比，超过阈值视为回退
+    regressions = []
+    if current["params"] != previous.get("params"):
+        logging.warning("两次运行的参数不同，对比结果仅供参考")
+    print(f"{'指标':<30} {'上次(s)':>10} {'本次(s)':>10} {'变化':>8}")
+    for name, summary in current["metrics"].items():
+        old = previous.get("metrics", {}).get(name)
+        if not summary or not old or not old["median_s"]:
+            continue
+        change = summary["median_s"] / old["median_s"] - 1
+        flag = "  ⚠️ 回退" if change > threshold else ""
+        print(f"{name:<30} {old['median_s']:>10.4f} {summary['median_s']:>10.4f} {change:>+8.1%}{flag}")
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="页面冷启动基准：新进程中首张图表渲染完成的时间")
+    parser.add_argument("--runs", type=int, default=5, help="启动的进程数")
+    parser.add_argument("--cold-cache", action="store_true", help="每轮使用空的磁盘缓存，计入Excel解析")
+    parser.add_argument("--timeout", type=float, default=120, help="单次页面运行超时（秒）")
+    parser.add_argument("--output", help="结果JSON路径，默认写入 benchmarks/results/")
+    parser.add_argument("--compare", help="与之前的结果JSON对比")
+    parser.add_argument("--threshold", type=float, default=0.2, help="回退判定阈值（相对变化）")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.child:
+        sys.path.insert(0, ROOT)
+        run_child(args.timeout)
+        return 0
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    result = run_benchmark(args)
+    print_report(result)
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"startup_{stamp}_{result['meta']['commit'] or 'nogit'}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    logging.info(f"结果已写入：{output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)
+        if compare_results(result, previous, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
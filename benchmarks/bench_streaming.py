@@ -0,0 +1,49 @@
+# bench_streaming.py
+# 整表读取 vs 流式读取 的峰值内存对比（tracemalloc，不含文件本身的字节）
+# 用法：python benchmarks/bench_streaming.py [行数 ...]   默认 100000 500000 1000000
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import sankey_io  # noqa: E402
+from sankey_io import load_fact_table  # noqa: E402
+from synthetic import make_traffic_frame  # noqa: E402
+
+DEFAULT_SIZES = [100_000, 500_000, 1_000_000]
+
+
+def make_csv_bytes(n_rows, seed=0):
+    rows_per_day = max(1, round(n_rows / (365 * 8)))
+    return make_traffic_frame(365, rows_per_day=rows_per_day, seed=seed).to_csv(index=False).encode("utf-8-sig")
+
+
+def measure(file_bytes, streaming):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result_df, _ = load_fact_table(file_bytes, streaming)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024 / 1024, elapsed, len(result_df)
+
+
+def main(sizes):
+    # 禁用本地缓存，保证每次都真实解析
+    sankey_io.load_cached = lambda key: None
+    sankey_io.store_cached = lambda key, df: None
+    print(f"{'行数':>10} {'文件(MB)':>9} {'整表峰值(MB)':>13} {'流式峰值(MB)':>13} {'整表(s)':>8} {'流式(s)':>8}")
+    for n_rows in sizes:
+        file_bytes = make_csv_bytes(n_rows)
+        full_peak, full_time, _ = measure(file_bytes, False)
+        stream_peak, stream_time, _ = measure(file_bytes, True)
+        print(f"{n_rows:>10} {len(file_bytes) / 1024 / 1024:>9.1f} {full_peak:>13.1f} {stream_peak:>13.1f} "
+              f"{full_time:>8.2f} {stream_time:>8.2f}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.ERROR)
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
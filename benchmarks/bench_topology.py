@@ -0,0 +1,105 @@
+# bench_topology.py
+# 大规模拓扑基准：生成 N个站点 × 每站点M个流量类型 的合成配置，测量编译、聚合、节点统计、链路构建耗时，
+# 以及不同小链路折叠阈值下的图表JSON大小
+# 用法：python benchmarks/bench_topology.py [--sites 12] [--types-per-site 40] [--days 365] [--min-share 0 1 5]
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+def make_topology_config(n_sites, types_per_site):
+    # 每个站点独立的二级节点，每个流量类型独立的曝光/点击/销量节点
+    sites = {f"Site-{s + 1:02d}": {"cn_name": f"站点{s + 1}", "color": f"#{(s * 2654435761) % 0xFFFFFF:06X}"}
+             for s in range(n_sites)}
+    mapping = {}
+    for site in sites:
+        for i in range(types_per_site):
+            name = f"{site}-流量{i + 1}"
+            mapping[name] = {
+                "group_id": f"组{len(mapping) + 1}",
+                "site": site,
+                "nodes": {
+                    "exposure": f"{name}曝光",
+                    "level2_exposure": f"{site}曝光",
+                    "click": f"{name}点击",
+                    "level2_click": f"{site}点击",
+                    "sales": f"{name}销量",
+                    "level2_sales": f"{site}销量",
+                },
+            }
+    return {
+        "sites": sites,
+        "traffic_order": list(mapping),
+        "traffic_mapping": mapping,
+        "group_colors": {cfg["group_id"]: f"#{(i * 40503) % 0xFFFFFF:06X}" for i, cfg in enumerate(mapping.values())},
+        "total_color": "lightgray",
+        "invalid_traffic_types": ["总曝光", "总点击", "总销量"],
+    }
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    print(f"{label:<16} {time.perf_counter() - start:>8.4f}s")
+    return result
+
+
+def main(args):
+    config = make_topology_config(args.sites, args.types_per_site)
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False, encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False)
+        config_path = f.name
+    # 必须在导入 sankey_config 之前指定配置文件
+    os.environ["SANKEY_TOPOLOGY_CONFIG"] = config_path
+    try:
+        from sankey_topology import compile_topology
+        from sankey_core import (
+            prepare_dates, build_fact_table, build_daily_cube, aggregate_range, build_node_list,
+            compute_node_flows, build_node_customdata, match_traffic_types, build_node_colors, build_links,
+            compute_sankey, build_figure
+        )
+        import plotly.utils
+        from synthetic import make_traffic_frame
+
+        topology = timed("compile", lambda: compile_topology(config))
+        print(f"站点 {args.sites}，流量类型 {len(topology['traffic_types'])}，"
+              f"节点 {len(topology['nodes'])}，链路 {len(topology['edges'])}")
+        raw_df = make_traffic_frame(args.days, invalid_ratio=0.0, seed=args.seed)
+        facts = build_fact_table(prepare_dates(raw_df))
+        cube = timed("cube_build", lambda: build_daily_cube(facts))
+        days = cube["days"]
+        aggregated_df = timed("filter_aggregate", lambda: aggregate_range(cube, days[0], days[-1]))
+        all_nodes = build_node_list()
+        incoming, outgoing = timed("node_flows", lambda: compute_node_flows(aggregated_df, all_nodes))
+        timed("node_customdata", lambda: build_node_customdata(all_nodes, incoming, outgoing))
+        matched = match_traffic_types(args.search)
+        timed("node_colors", lambda: build_node_colors(matched))
+        timed("link_build", lambda: build_links(aggregated_df, all_nodes, matched, 0.5, 5.0))
+        timed("sankey_cold", lambda: compute_sankey(cube, days[0], days[-1], args.search))
+        timed("sankey_restyle", lambda: compute_sankey(cube, days[0], days[-1], "site-01", 0.3, 7.0))
+        for min_share in args.min_share:
+            sankey = timed(f"lod_{min_share:g}%", lambda: compute_sankey(cube, days[0], days[-1], args.search,
+                                                                         min_share=min_share))
+            payload = json.dumps(build_figure(sankey, "bench"), cls=plotly.utils.PlotlyJSONEncoder)
+            print(f"{'':<16} 链路 {len(sankey['links']['value'])}，节点 {len(sankey['all_nodes'])}，"
+                  f"JSON {len(payload.encode()) / 1024:.1f} KB")
+    finally:
+        os.remove(config_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="大规模拓扑（多站点、多流量类型）基准")
+    parser.add_argument("--sites", type=int, default=12)
+    parser.add_argument("--types-per-site", type=int, default=40)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--search", default="site-03")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-share", type=float, nargs="*", default=[0, 1, 5], help="小链路折叠阈值（%%）")
+    logging.basicConfig(level=logging.ERROR)
+    main(parser.parse_args())
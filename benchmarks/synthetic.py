@@ -0,0 +1,88 @@
+# synthetic.py
+# 合成流量数据：与真实导出表相同的列结构（时间/流量类型/曝光/点击/销量 等）
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sankey_config import TRAFFIC_ORDER, TRAFFIC_MAPPING, INVALID_TRAFFIC_TYPES  # noqa: E402
+
+EXPORT_COLUMNS = ["时间", "时间段", "Target平台", "流量类型", "曝光", "点击", "销量", "曝光占比", "点击占比", "销量占比"]
+
+
+def pick_traffic_types(traffic_types=None, sites=None):
+    # traffic_types 可为数量或名称列表；超出配置的数量以"合成流量N"补足（属于未配置流量类型）
+    if isinstance(traffic_types, (list, tuple)):
+        names = list(traffic_types)
+    else:
+        candidates = [t for t in TRAFFIC_ORDER if sites is None or TRAFFIC_MAPPING[t]["site"] in sites]
+        count = len(candidates) if traffic_types is None else int(traffic_types)
+        names = candidates[:count] + [f"合成流量{i + 1}" for i in range(max(0, count - len(candidates)))]
+    return names
+
+
+def make_traffic_frame(days=15, traffic_types=None, sites=None, rows_per_day=1,
+                       invalid_ratio=0.05, start_date="2026-01-01", seed=0):
+    # 每天 × 每个流量类型 生成 rows_per_day 条记录，并按 invalid_ratio 混入
+    # INVALID_TRAFFIC_TYPES 汇总行、空日期行和非数值单元格
+    rng = np.random.default_rng(seed)
+    names = pick_traffic_types(traffic_types, sites)
+    dates = pd.date_range(start_date, periods=days, freq="D")
+
+    n_valid = days * len(names) * rows_per_day
+    day_idx = np.repeat(np.arange(days), len(names) * rows_per_day)
+    type_idx = np.tile(np.repeat(np.arange(len(names)), rows_per_day), days)
+
+    n_invalid = int(n_valid * invalid_ratio)
+    invalid_names = np.asarray(INVALID_TRAFFIC_TYPES, dtype=object)[rng.integers(0, len(INVALID_TRAFFIC_TYPES), n_invalid)]
+    traffic = np.concatenate([np.asarray(names, dtype=object)[type_idx], invalid_names])
+    when = np.concatenate([dates[day_idx].to_numpy(), dates[rng.integers(0, days, n_invalid)].to_numpy()])
+
+    n_rows = n_valid + n_invalid
+    exposure = rng.gamma(2.0, 20_000, n_rows).round()
+    click = (exposure * rng.uniform(0.005, 0.05, n_rows)).round()
+    sales = (click * rng.uniform(0.02, 0.2, n_rows)).round()
+    platforms = np.array([TRAFFIC_MAPPING[t]["site"] if t in TRAFFIC_MAPPING else "" for t in names] + [""], dtype=object)
+
+    df = pd.DataFrame({
+        "时间": when,
+        "时间段": np.asarray(["0-FB", "50-FB", "550-FB"], dtype=object)[rng.integers(0, 3, n_rows)],
+        "Target平台": platforms[np.concatenate([type_idx, np.full(n_invalid, len(names))])],
+        "流量类型": traffic,
+        "曝光": exposure,
+        "点击": click,
+        "销量": sales,
+    })
+    for col in ["曝光", "点击", "销量"]:
+        df[f"{col}占比"] = "0.00%"
+
+    if invalid_ratio > 0:
+        df.loc[rng.random(n_rows) < invalid_ratio / 5, "时间"] = pd.NaT
+        df["点击"] = df["点击"].astype(object)
+        df.loc[rng.random(n_rows) < invalid_ratio / 5, "点击"] = "-"
+    return df.sample(frac=1.0, random_state=seed).reset_index(drop=True)[EXPORT_COLUMNS]
+
+
+def write_workbook(df, path):
+    df.to_excel(path, index=False, sheet_name="数据表 2")
+    return path
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="生成合成流量工作簿")
+    parser.add_argument("path", help="输出xlsx路径")
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--traffic-types", type=int, default=None)
+    parser.add_argument("--sites", nargs="*", default=None)
+    parser.add_argument("--rows-per-day", type=int, default=1)
+    parser.add_argument("--invalid-ratio", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    frame = make_traffic_frame(args.days, args.traffic_types, args.sites, args.rows_per_day, args.invalid_ratio, seed=args.seed)
+    write_workbook(frame, args.path)
+    print(f"已写入 {args.path}，行数：{len(frame)}")
@@ -1,9 +1,12 @@
 # sankey_traffic_streamlit.py
+import os
 import pandas as pd
-import plotly.graph_objects as go
 import logging
 import streamlit as st
 from datetime import datetime
+from functools import partial
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 # ===================== 1. 页面配置 =====================
 st.set_page_config(
@@ -17,225 +20,215 @@ st.set_page_config(
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 性能记录：每次rerun记录各阶段耗时/行数/内存；点击“采集性能剖析”按钮触发的这次rerun会被完整剖析
+from sankey_perf import start_run, finish_run, stage, stage_table, start_profile, stop_profile
+
+perf_profile = start_profile() if st.session_state.get("perf_profile_button", False) else None
+perf_run = start_run("rerun", trace_memory=st.session_state.get("perf_trace_memory", False))
+
 # ===================== 2. 全局配置 =====================
-SITE_CONFIG = {
-    "Amazon-US": {"cn_name": "亚马逊美国站", "color": "#87CEEB"},
-    "Amazon-JP": {"cn_name": "亚马逊日本站", "color": "#FF6B6B"},
-    "Amazon-UK": {"cn_name": "亚马逊英国站", "color": "#4ECDC4"},
-    "Shopify": {"cn_name": "Shopify独立站", "color": "#DDA0DD"}
-}
-
-TRAFFIC_ORDER = [
-    "Amazon站内广告",   # 1
-    "Amazon-DSP",       # 2
-    "Amazon自然流量",   # 3
-    "Amazon-FB",        # 4
-    "SP-GG",            # 5
-    "SP-FB",            # 6
-    "SP-自然",          # 7
-    "SP-其他"           # 8
-]
-
-TRAFFIC_MAPPING = {
-    "Amazon站内广告": {
-        "group_id": "组1",
-        "site": "Amazon-US",
-        "nodes": {
-            "exposure": "站内曝光",
-            "level2_exposure": "Amazon-US曝光",
-            "click": "站内点击",
-            "level2_click": "Amazon-US点击",
-            "sales": "站内销量",
-            "level2_sales": "Amazon-US销量"
-        }
-    },
-    "Amazon-DSP": {
-        "group_id": "组2",
-        "site": "Amazon-US",
-        "nodes": {
-            "exposure": "DSP曝光",
-            "level2_exposure": "Amazon-US曝光",
-            "click": "DSP点击",
-            "level2_click": "Amazon-US点击",
-            "sales": "DSP销量",
-            "level2_sales": "Amazon-US销量"
-        }
-    },
-    "Amazon自然流量": {
-        "group_id": "组3",
-        "site": "Amazon-US",
-        "nodes": {
-            "exposure": "Amazon自然曝光",
-            "level2_exposure": "Amazon-US曝光",
-            "click": "Amazon自然点击",
-            "level2_click": "Amazon-US点击",
-            "sales": "Amazon自然销量",
-            "level2_sales": "Amazon-US销量"
-        }
-    },
-    "Amazon-FB": {
-        "group_id": "组4",
-        "site": "Amazon-US",
-        "nodes": {
-            "exposure": "FB曝光",
-            "level2_exposure": "Amazon-US曝光",
-            "click": "FB点击",
-            "level2_click": "Amazon-US点击",
-            "sales": "FB销量",
-            "level2_sales": "Amazon-US销量"
-        }
-    },
-    "SP-GG": {
-        "group_id": "组5",
-        "site": "Shopify",
-        "nodes": {
-            "exposure": "SP-GG曝光",
-            "level2_exposure": "Shopify曝光",
-            "click": "SP-GG点击",
-            "level2_click": "Shopify点击",
-            "sales": "SP-GG销量",
-            "level2_sales": "Shopify销量"
-        }
-    },
-    "SP-FB": {
-        "group_id": "组6",
-        "site": "Shopify",
-        "nodes": {
-            "exposure": "SP-FB曝光",
-            "level2_exposure": "Shopify曝光",
-            "click": "SP-FB点击",
-            "level2_click": "Shopify点击",
-            "sales": "SP-FB销量",
-            "level2_sales": "Shopify销量"
-        }
-    },
-    "SP-自然": {
-        "group_id": "组7",
-        "site": "Shopify",
-        "nodes": {
-            "exposure": "SP-自然曝光",
-            "level2_exposure": "Shopify曝光",
-            "click": "SP-自然点击",
-            "level2_click": "Shopify点击",
-            "sales": "SP-自然销量",
-            "level2_sales": "Shopify销量"
-        }
-    },
-    "SP-其他": {
-        "group_id": "组8",
-        "site": "Shopify",
-        "nodes": {
-            "exposure": "SP-其他曝光",
-            "level2_exposure": "Shopify曝光",
-            "click": "SP-其他点击",
-            "level2_click": "Shopify点击",
-            "sales": "SP-其他销量",
-            "level2_sales": "Shopify销量"
-        }
-    }
-}
-
-GROUP_COLORS = {
-    "组1": "#9290E6",  # 站内广告
-    "组2": "#4ECDC4",  # DSP
-    "组3": "#45B7D1",  # 自然流量
-    "组4": "#96CEB4",  # FB
-    "组5": "#FFA726",  # SP-GG
-    "组6": "#AB47BC",  # SP-FB
-    "组7": "#1C363F",  # SP-自然
-    "组8": "#F00B0B",  # SP-其他
-    **{site: SITE_CONFIG[site]["color"] for site in SITE_CONFIG},
-    "总节点": "lightgray"
-}
-
-# 动态生成level2节点列表
-LEVEL2_NODES = []
-for traffic_type in TRAFFIC_MAPPING:
-    cfg = TRAFFIC_MAPPING[traffic_type]
-    LEVEL2_NODES.extend([
-        cfg["nodes"]["level2_exposure"],
-        cfg["nodes"]["level2_click"],
-        cfg["nodes"]["level2_sales"]
-    ])
-LEVEL2_NODES = list(set(LEVEL2_NODES))
-
-# 节点→流量类型映射
-NODE_TO_TRAFFIC = {}
-for traffic_type in TRAFFIC_MAPPING:
-    cfg = TRAFFIC_MAPPING[traffic_type]
-    unique_nodes = [
-        traffic_type,
-        cfg["nodes"]["exposure"],
-        cfg["nodes"]["click"],
-        cfg["nodes"]["sales"]
-    ]
-    for node in unique_nodes:
-        NODE_TO_TRAFFIC[node] = traffic_type
-
-# 无效流量类型过滤列表
-INVALID_TRAFFIC_TYPES = ["Amazon 页面总点击", "总曝光", "总点击", "总销量"]
+from sankey_config import SITE_CONFIG, TRAFFIC_ORDER
+from sankey_core import (
+    build_daily_cube, compute_sankey, FACT_MEASURES, build_figure, make_title, split_windows,
+    compute_sankey_frames, build_animated_figure, compute_delta_sankey, build_delta_figure,
+    ROLLUP_FREQS, compute_rollups, compute_funnel, funnel_frame, build_funnel_figure, match_traffic_types,
+    VALID_TRAFFIC_TYPES
+)
+from sankey_io import load_fact_table, load_sources, prepare_sources, STREAMING_THRESHOLD_BYTES
+from sankey_cache import read_file_bytes, clear_cache, cache_stats
+from sankey_store import ingest_sources, load_store_facts, store_version, store_stats, clear_store
+from sankey_query import (
+    QUERY_BACKENDS, available_backends, store_query_cube, is_query_cube, query_summary, query_traffic_summary
+)
+from sankey_registry import acquire, release_holder, prune_holders, registry_stats
+from sankey_export import EXPORT_TABLES, EXPORT_FORMATS, page_frame, iter_fact_chunks, links_frame, nodes_frame, export_bytes
 
 # ===================== 3. 读取Excel函数 =====================
-@st.cache_data
-def read_excel_generate_data(excel_path):
+# 数据集在进程内登记表中共享（不经 st.cache_data 按会话复制），本次运行用到的数据集键
+run_datasets = set()
+
+
+def session_holder():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else "local"
+
+
+def use_dataset(key, load):
+    # 同一数据集全部会话共享一份只读数据；本会话登记为持有者，运行结束时释放其余数据集
+    run_datasets.add(key)
+    return acquire(key, load, session_holder())
+
+
+def release_unused_datasets():
+    release_holder(session_holder(), keep=run_datasets)
+    if Runtime.exists():
+        prune_holders(Runtime.instance().is_active_session)
+
+
+def _load_excel(excel_path, streaming):
+    facts, from_cache = load_fact_table(read_file_bytes(excel_path), streaming)
+    # 同时返回按日前缀和立方体，日期区间聚合不再扫描全表
+    return {"facts": facts, "cube": build_cube(facts), "from_cache": from_cache}
+
+
+def read_excel_generate_data(excel_path, streaming=None):
+    # 本地文件按 路径 + 修改时间 + 大小 建键，避免每次运行都读取并哈希整个文件
+    stat = os.stat(excel_path)
+    key = f"file:{os.path.abspath(excel_path)}:{stat.st_mtime_ns}:{stat.st_size}:{streaming}"
     try:
-        df = pd.read_excel(excel_path)
-        logger.info(f"成功读取Excel文件，数据行数：{len(df)}")
-        st.success(f"✅ 成功读取Excel文件，数据行数：{len(df)}")
+        dataset = use_dataset(key, partial(_load_excel, excel_path, streaming))
     except Exception as e:
         logger.error(f"读取Excel失败：{str(e)}")
         st.error(f"❌ 读取Excel失败：{str(e)}")
-        return pd.DataFrame()  # 修改：返回空DataFrame，方便后续处理
-    
-    # 数据预处理
-    df["时间_str"] = df["时间"].astype(str)
-    df["date"] = df["时间_str"].str.split(" ").str[0].str.replace("/", "-")
-    df["date"] = df["date"].replace(["nan", "NaT", ""], pd.NaT)
-    df["date"] = pd.to_datetime(df["date"], errors="coerce")  # 保留datetime类型，方便后续提取最值
-    
-    data_raw = []
-    for _, row in df.iterrows():
-        if pd.isna(row["date"]):
-            continue
-        
-        traffic_type = row["流量类型"]
-        if traffic_type in INVALID_TRAFFIC_TYPES:
-            logger.debug(f"过滤无效流量类型：{traffic_type}")
-            continue
-        
-        if traffic_type not in TRAFFIC_MAPPING:
-            logger.warning(f"未配置的流量类型：{traffic_type}（已跳过）")
-            continue
-        
-        cfg = TRAFFIC_MAPPING[traffic_type]
-        if cfg["site"] not in SITE_CONFIG:
-            logger.warning(f"非法站点：{cfg['site']}（流量类型：{traffic_type}，已跳过）")
-            continue
-        
-        date = row["date"].strftime("%Y-%m-%d")  # 后续存储用字符串格式
-        exposure = pd.to_numeric(row["曝光"], errors="coerce") if pd.notna(row["曝光"]) else 0.0
-        click = pd.to_numeric(row["点击"], errors="coerce") if pd.notna(row["点击"]) else 0.0
-        sales = pd.to_numeric(row["销量"], errors="coerce") if pd.notna(row["销量"]) else 0.0
-        
-        data_raw.extend([
-            [traffic_type, cfg["nodes"]["exposure"], float(exposure), date, cfg["group_id"], traffic_type],
-            [cfg["nodes"]["exposure"], cfg["nodes"]["level2_exposure"], float(exposure), date, cfg["group_id"], traffic_type],
-            [cfg["nodes"]["level2_exposure"], "总曝光", float(exposure), date, cfg["group_id"], traffic_type],
-            ["总曝光", cfg["nodes"]["click"], float(click), date, cfg["group_id"], traffic_type],
-            [cfg["nodes"]["click"], cfg["nodes"]["level2_click"], float(click), date, cfg["group_id"], traffic_type],
-            [cfg["nodes"]["level2_click"], "总点击", float(click), date, cfg["group_id"], traffic_type],
-            ["总点击", cfg["nodes"]["sales"], float(sales), date, cfg["group_id"], traffic_type],
-            [cfg["nodes"]["sales"], cfg["nodes"]["level2_sales"], float(sales), date, cfg["group_id"], traffic_type],
-            [cfg["nodes"]["level2_sales"], "总销量", float(sales), date, cfg["group_id"], traffic_type]
-        ])
-    
-    # 转换为DataFrame返回，方便同时获取原始数据和日期范围
-    result_df = pd.DataFrame(data_raw, columns=["source", "target", "value", "date", "group", "traffic_type"])
-    if not result_df.empty:
-        result_df["date"] = pd.to_datetime(result_df["date"])
-        result_df["value"] = pd.to_numeric(result_df["value"], errors="coerce").fillna(0.0)
-    logger.info(f"生成链路数据条数：{len(result_df)}")
-    return result_df
+        return pd.DataFrame(), None  # 修改：返回空DataFrame，方便后续处理
+
+    if dataset["from_cache"]:
+        st.success(f"✅ 命中本地缓存，有效记录数：{len(dataset['facts'])}")
+    else:
+        st.success(f"✅ 成功读取Excel文件，有效记录数：{len(dataset['facts'])}")
+    return dataset["facts"], dataset["cube"]
+
+
+def build_cube(facts):
+    with stage("cube_build", rows_in=len(facts)):
+        cube = build_daily_cube(facts)
+    # 天/周/月汇总随数据集一起预先计算（按数据指纹缓存），漏斗视图切换粒度时无需重新汇总
+    compute_rollups(cube)
+    return cube
+
+
+@st.cache_data(max_entries=32)
+def dataset_summary(dataset_key, _df, _cube=None):
+    # 每个数据集只计算一次；以数据集键缓存（不对DataFrame本身做哈希），所有会话共享
+    # 查询后端时由事实库直接汇总，不载入明细；度量按float64累加（与查询后端结果一致）
+    if is_query_cube(_cube):
+        return query_summary(_cube)
+    return {
+        "records": len(_df),
+        "traffic_types": int(_df["traffic_type"].nunique()),
+        "exposure": float(_df["exposure"].to_numpy(dtype="float64").sum()),
+        "sales": float(_df["sales"].to_numpy(dtype="float64").sum()),
+    }
+
+
+@st.cache_data(max_entries=128)
+def traffic_summary_table(dataset_key, start_date, end_date, _df, _cube=None):
+    # 日期区间内按流量类型汇总，按 (数据集, 日期区间) 缓存；明细改为分页读取，不再整体筛选复制
+    if is_query_cube(_cube):
+        return with_rates(query_traffic_summary(_cube, pd.Timestamp(start_date), pd.Timestamp(end_date)))
+    in_window = (_df["date"] >= pd.Timestamp(start_date)) & (_df["date"] <= pd.Timestamp(end_date))
+    traffic_summary = _df.loc[in_window, ["date", "traffic_type", *FACT_MEASURES]].astype(
+        {col: "float64" for col in FACT_MEASURES}
+    ).groupby("traffic_type", observed=True).agg(
+        曝光=("exposure", "sum"),
+        点击=("click", "sum"),
+        销量=("sales", "sum"),
+        记录数=("date", "count")
+    ).round(2)
+    return with_rates(traffic_summary)
+
+
+def with_rates(traffic_summary):
+    # 按流量类型的 CTR（点击/曝光）、CVR（销量/点击），分母为0时为空
+    return traffic_summary.assign(
+        CTR=(traffic_summary["点击"] / traffic_summary["曝光"].where(traffic_summary["曝光"] > 0)).round(4),
+        CVR=(traffic_summary["销量"] / traffic_summary["点击"].where(traffic_summary["点击"] > 0)).round(4),
+    )
+
+
+def _task_line(report):
+    sheet = f" / {report['sheet']}" if report["sheet"] is not None else ""
+    if report["status"] == "完成":
+        return f"✅ {report['file']}{sheet}：{report['rows']} 行，{report['seconds']:.1f}s"
+    if report["status"] == "缓存":
+        return f"⚡ {report['file']}{sheet}：命中本地缓存"
+    return f"⚠️ {report['file']}{sheet}：{report['status']}"
+
+
+def upload_progress():
+    # 侧边栏进度条；返回 (进度回调, 关闭函数)
+    progress_bar = st.sidebar.progress(0.0, text="正在解析上传文件…")
+    status = st.sidebar.empty()
+    lines = {}
+
+    def on_progress(done, total, report):
+        lines[(report["file"], report["sheet"])] = _task_line(report)
+        progress_bar.progress(done / total, text=f"已完成 {done}/{total} 个工作表")
+        status.markdown("  \n".join(lines.values()))
+
+    def close():
+        progress_bar.empty()
+        status.empty()
+
+    return on_progress, close
+
+
+def _upload_sources(uploaded_files, streaming):
+    # 读取上传文件内容，按内容去重并建键（每个文件只哈希一次）
+    return prepare_sources([(f.name, read_file_bytes(f)) for f in uploaded_files], streaming)
+
+
+def _load_upload(uploaded_files, streaming, sources=None, key=None):
+    # sources/key 为本次运行已读取的内容；数据集被淘汰后重新读取时为None
+    if sources is None:
+        sources, key = _upload_sources(uploaded_files, streaming)
+    on_progress, close = upload_progress()
+    try:
+        facts, reports, from_cache = load_sources(sources, streaming, progress=on_progress, key=key)
+    finally:
+        close()
+    return {"facts": facts, "cube": build_cube(facts), "reports": reports, "from_cache": from_cache}
+
+
+def parse_uploaded_files(uploaded_files, streaming=None, incremental=False):
+    # 全部文件的全部工作表在进程池中并行解析，侧边栏逐个显示进度
+    # 解析结果登记在进程内共享表中：其他会话上传同一批文件时直接复用，本会话只保存数据集键
+    # 每次运行只比较上传对象的标识（file_id、文件名、大小），不读取也不哈希文件内容；标识变化时才读取并按内容建键
+    memo_key = (tuple((f.file_id, f.name, f.size) for f in uploaded_files), streaming, incremental)
+    memo = st.session_state.get("parsed_upload")
+    sources, content_key = None, None
+    if memo is None or memo["key"] != memo_key:
+        sources, content_key = _upload_sources(uploaded_files, streaming)
+        memo = {"key": memo_key, "dataset_key": None if incremental else f"upload:{content_key}",
+                "reports": [], "store_report": None, "from_cache": False, "error": None}
+        if incremental:
+            # 只有新增或内容变化的日期会写入事实库
+            on_progress, close = upload_progress()
+            try:
+                memo["store_report"], memo["reports"] = ingest_sources(
+                    sources, streaming, progress=on_progress, key=content_key
+                )
+            except Exception as e:
+                logger.error(f"读取上传文件失败：{str(e)}")
+                memo["error"] = str(e)
+            close()
+        st.session_state["parsed_upload"] = memo
+
+    if memo["dataset_key"] is None:
+        return {**memo, "facts": pd.DataFrame(), "cube": None}
+    try:
+        # 已登记时直接取共享数据；被淘汰后（如内存预算调小）重新读取
+        dataset = use_dataset(
+            memo["dataset_key"], partial(_load_upload, uploaded_files, streaming, sources, content_key)
+        )
+    except Exception as e:
+        logger.error(f"读取上传文件失败：{str(e)}")
+        memo["dataset_key"], memo["error"] = None, str(e)
+        return {**memo, "facts": pd.DataFrame(), "cube": None}
+    return {**memo, "facts": dataset["facts"], "cube": dataset["cube"],
+            "reports": dataset["reports"], "from_cache": dataset["from_cache"]}
+
+
+def _load_store(version):
+    facts = load_store_facts()
+    logger.info(f"读取增量事实库（版本{version}），有效记录数：{len(facts)}")
+    return {"facts": facts, "cube": build_cube(facts)}
+
+
+def read_store_data(version):
+    # version 为事实库版本号，导入新数据后自动换用新的数据集键
+    dataset = use_dataset(f"store:{version}", partial(_load_store, version))
+    return dataset["facts"], dataset["cube"]
 
 # ===================== 4. 应用标题 =====================
 st.title("🌐 多站点流量-销量桑基图分析")
@@ -244,32 +237,89 @@ st.markdown("---")
 # ===================== 5. 先处理文件上传和数据加载（关键修改：提前加载数据提取日期） =====================
 default_excel_path = "1.5-1.19流量数据统计_数据表 2_表格 (1).xlsx"
 df = pd.DataFrame()
+daily_cube = None
 
 with st.sidebar:
     st.header("⚙️ 控制面板")
     # 文件上传
-    uploaded_file = st.file_uploader("上传Excel文件", type=["xlsx", "xls"])
+    uploaded_files = st.file_uploader(
+        "上传Excel/CSV文件（可多选）",
+        type=["xlsx", "xls", "csv"],
+        accept_multiple_files=True,
+        help="各站点/各月份的导出可一起上传：读取每个工作簿的全部工作表，同一 (日期, 流量类型) 以后上传的文件为准"
+    )
+    streaming_mode = st.checkbox(
+        "流式读取（大文件省内存）",
+        value=False,
+        help=f"分块读取并按日汇总，内存占用与文件大小无关；超过 {STREAMING_THRESHOLD_BYTES // 1024 // 1024} MB 的文件自动启用"
+    )
+
+    incremental_mode = st.checkbox(
+        "增量入库（合并历史数据）",
+        value=False,
+        help="上传文件按日期合并进本地事实库：新日期追加，已有日期以新文件为准覆盖，内容未变的日期不重复处理"
+    )
 
 # 确定Excel文件路径并加载数据
-if uploaded_file is not None:
-    EXCEL_PATH = uploaded_file
-    df = read_excel_generate_data(EXCEL_PATH)
-    st.sidebar.success(f"📂 已上传文件: {uploaded_file.name}")
+upload = parse_uploaded_files(uploaded_files, True if streaming_mode else None, incremental_mode) if uploaded_files else None
+if upload is not None:
+    if upload["error"]:
+        st.error(f"❌ 读取上传文件失败：{upload['error']}")
+    with st.sidebar.expander(f"📄 解析明细（{len(upload['reports'])} 个工作表）"):
+        for report in upload["reports"]:
+            st.caption(_task_line(report))
+
+if incremental_mode:
+    report = upload["store_report"] if upload is not None else None
+    if report is not None:
+        st.sidebar.success(
+            f"📥 {len(uploaded_files)} 个文件：新增 {len(report['added'])} 天，"
+            f"更新 {len(report['replaced'])} 天，未变化 {len(report['unchanged'])} 天"
+        )
+    query_backend = st.sidebar.selectbox(
+        "查询后端",
+        available_backends(),
+        format_func=QUERY_BACKENDS.get,
+        help="内存：全部历史载入内存后按日前缀和聚合；Arrow/DuckDB：日期区间和流量类型条件下推到事实库，只读取所选区间的聚合结果"
+    )
+    if query_backend == "memory":
+        df, daily_cube = read_store_data(store_version())
+    else:
+        # 只读取清单，不载入事实数据
+        daily_cube = store_query_cube(backend=query_backend)
+    stats = store_stats()
+    st.sidebar.info(f"🗃️ 历史事实库：{stats['days']} 天（{stats['first_day']} 至 {stats['last_day']}）")
+    if st.sidebar.button("🗑️ 清空历史数据", type="secondary", use_container_width=True):
+        clear_store()
+        st.cache_data.clear()
+        st.rerun()
+elif upload is not None:
+    df, daily_cube = upload["facts"], upload["cube"]
+    if not upload["error"]:
+        if upload["from_cache"]:
+            st.success(f"✅ 命中本地缓存，有效记录数：{len(df)}")
+        else:
+            st.success(f"✅ 成功读取 {len(uploaded_files)} 个文件，有效记录数：{len(df)}")
+    st.sidebar.success(f"📂 已上传文件: {'、'.join(f.name for f in uploaded_files)}")
 else:
     # 否则使用默认文件（本地测试时）
     try:
-        df = read_excel_generate_data(default_excel_path)
+        df, daily_cube = read_excel_generate_data(default_excel_path, True if streaming_mode else None)
         st.sidebar.info(f"📂 使用默认文件: {default_excel_path}")
     except Exception as e:
         st.sidebar.error(f"❌ 默认文件加载失败: {str(e)}")
 
+# 本会话不再使用的共享数据集解除引用，超出内存预算时可被淘汰
+release_unused_datasets()
+
 # 提取Excel中的实际有效日期范围（关键修改：自动获取日期最值）
 default_start_date = datetime.strptime("2026-01-05", "%Y-%m-%d").date()
 default_end_date = datetime.strptime("2026-01-19", "%Y-%m-%d").date()
 
-if not df.empty and df["date"].notna().any():
-    min_date = df["date"].min()
-    max_date = df["date"].max()
+# 日期索引来自按日立方体（查询后端时来自事实库清单），与数据中的最早/最晚日期一致
+if daily_cube is not None and len(daily_cube["days"]):
+    min_date = daily_cube["days"][0]
+    max_date = daily_cube["days"][-1]
     default_start_date = min_date.date()  # 转换为date类型，适配streamlit date_input
     default_end_date = max_date.date()
     logger.info(f"自动提取Excel日期范围：{default_start_date} 至 {default_end_date}")
@@ -277,348 +327,354 @@ else:
     logger.warning("未提取到有效日期，使用兜底默认值")
 
 # ===================== 6. 继续渲染侧边栏其他控件（使用自动提取的日期作为默认值） =====================
+def clear_search():
+    # 表单提交回调在本次运行之前执行，可以直接重置输入框
+    st.session_state["search_keyword"] = ""
+
+
+VIEW_MODES = ["单区间", "区间对比", "动画", "漏斗"]
+FUNNEL_FREQS = {label: freq for freq, label in ROLLUP_FREQS.items()}
+FUNNEL_DIMENSIONS = {"按流量类型": "traffic_type", "按站点": "site"}
+DETAIL_GRAINS = {"明细": False, "链路": True}
+DETAIL_PAGE_SIZES = [50, 100, 500, 1000]
+EXPORT_TABLE_LABELS = {label: table for table, label in EXPORT_TABLES.items()}
+EXPORT_FORMAT_LABELS = {label: fmt for fmt, (label, _) in EXPORT_FORMATS.items()}
+ANIMATION_FREQS = {"按天": "D", "按周": "W", "按月": "M"}
+
 with st.sidebar:
-    # 搜索区域
-    search_keyword = st.text_input(
-        "🔍 链路搜索（支持站点/流量类型关键词）",
-        placeholder="输入关键词（如US/Shopify/DSP/站内）",
-        help="支持站点、流量类型关键词搜索"
-    )
-    
-    # 清空搜索按钮
-    col1, col2 = st.columns(2)
-    with col1:
-        if st.button("🗑️ 清空搜索", type="secondary", use_container_width=True):
-            search_keyword = ""
-            st.rerun()
-    
-    st.markdown("---")
-    st.subheader("📅 日期范围")
-    
-    # 日期输入（关键修改：使用自动提取的日期作为默认值）
-    col1, col2 = st.columns(2)
-    with col1:
-        start_date = st.date_input(
-            "开始日期",
-            value=default_start_date,  # 自动提取的最小日期
-            help="默认显示Excel中的最早日期"
+    # 视图模式放在表单外：切换后立即显示对应的控件
+    view_mode = st.radio("🎞️ 视图模式", VIEW_MODES, horizontal=True, key="view_mode")
+
+    # 搜索、日期、缩放放在同一个表单中：输入过程中不触发重新运行，点击“应用”后才更新图表
+    with st.form("chart_controls"):
+        # 搜索区域
+        search_keyword = st.text_input(
+            "🔍 链路搜索（支持站点/流量类型关键词）",
+            key="search_keyword",
+            placeholder="输入关键词（如US/Shopify/DSP/站内）",
+            help="支持站点、流量类型关键词搜索"
         )
-    
-    with col2:
-        end_date = st.date_input(
-            "结束日期",
-            value=default_end_date,  # 自动提取的最大日期
-            help="默认显示Excel中的最晚日期"
+
+        st.markdown("---")
+        st.subheader("📅 日期范围")
+
+        # 日期输入（关键修改：使用自动提取的日期作为默认值）
+        col1, col2 = st.columns(2)
+        with col1:
+            start_date = st.date_input(
+                "开始日期",
+                value=default_start_date,  # 自动提取的最小日期
+                help="默认显示Excel中的最早日期"
+            )
+
+        with col2:
+            end_date = st.date_input(
+                "结束日期",
+                value=default_end_date,  # 自动提取的最大日期
+                help="默认显示Excel中的最晚日期"
+            )
+
+        st.markdown("---")
+        st.subheader("📏 缩放控制")
+
+        # 缩放系数
+        col1, col2 = st.columns(2)
+        with col1:
+            exposure_scale = st.number_input(
+                "曝光链路缩放",
+                min_value=0.01,
+                max_value=10.0,
+                value=0.5,
+                step=0.05,
+                help="调整曝光链路的宽度"
+            )
+
+        with col2:
+            later_scale = st.number_input(
+                "后续链路缩放",
+                min_value=0.01,
+                max_value=50.0,
+                value=5.0,
+                step=1.0,
+                help="调整点击和销量链路的宽度"
+            )
+
+        # 细节层级：拓扑很宽时把小链路折叠为每个站点的“其他”节点，限制图表数据量
+        min_share = st.number_input(
+            "小链路折叠阈值（%）",
+            min_value=0.0,
+            max_value=50.0,
+            value=0.0,
+            step=1.0,
+            help="流量类型占所汇入站点节点流入低于该比例时，并入该站点的“其他”节点；0 表示不折叠（对比差值图和动画不折叠）"
         )
-    
+
+        if view_mode == "区间对比":
+            st.markdown("---")
+            st.subheader("🔀 对比设置")
+            compare_style = st.radio("对比方式", ["并排", "差值图"], horizontal=True,
+                                     help="差值图：链路宽度为两期之差，绿色增长、红色下降")
+            base_auto = st.checkbox("对比期取上一个等长区间", value=True)
+            col1, col2 = st.columns(2)
+            with col1:
+                base_start_date = st.date_input("对比期开始", value=default_start_date, disabled=base_auto)
+            with col2:
+                base_end_date = st.date_input("对比期结束", value=default_end_date, disabled=base_auto)
+        elif view_mode == "动画":
+            st.markdown("---")
+            st.subheader("🎬 动画设置")
+            animation_freq = ANIMATION_FREQS[st.selectbox("每帧区间", list(ANIMATION_FREQS))]
+        elif view_mode == "漏斗":
+            st.markdown("---")
+            st.subheader("📈 漏斗设置")
+            funnel_freq = FUNNEL_FREQS[st.radio("时间粒度", list(FUNNEL_FREQS), horizontal=True)]
+            funnel_by = FUNNEL_DIMENSIONS[st.radio("分组", list(FUNNEL_DIMENSIONS), horizontal=True)]
+            funnel_types = st.multiselect(
+                "流量类型", VALID_TRAFFIC_TYPES, default=[],
+                help="留空时取搜索关键词匹配的流量类型（无关键词时为全部）；按站点分组时先合并所选类型再计算比率"
+            )
+
+        col1, col2 = st.columns(2)
+        with col1:
+            st.form_submit_button("✅ 应用", type="primary", use_container_width=True)
+        with col2:
+            # 清空搜索按钮
+            st.form_submit_button("🗑️ 清空搜索", on_click=clear_search, use_container_width=True)
+
     # 日期验证
     if start_date > end_date:
         st.warning("⚠️ 开始日期不能晚于结束日期，已自动交换")
         start_date, end_date = end_date, start_date
-    
+
     st.markdown("---")
-    st.subheader("📏 缩放控制")
-    
-    # 缩放系数
-    col1, col2 = st.columns(2)
-    with col1:
-        exposure_scale = st.number_input(
-            "曝光链路缩放",
-            min_value=0.01,
-            max_value=10.0,
-            value=0.5,
-            step=0.05,
-            help="调整曝光链路的宽度"
-        )
-    
-    with col2:
-        later_scale = st.number_input(
-            "后续链路缩放",
-            min_value=0.01,
-            max_value=50.0,
-            value=5.0,
-            step=1.0,
-            help="调整点击和销量链路的宽度"
-        )
+    st.subheader("🗄️ 本地缓存")
+    stats = cache_stats()
+    st.caption(f"缓存文件：{stats['files']} 个，占用 {stats['bytes'] / 1024 / 1024:.1f} / {stats['max_bytes'] / 1024 / 1024:.0f} MB")
+    if st.button("🧹 清空本地缓存", type="secondary", use_container_width=True):
+        clear_cache()
+        st.cache_data.clear()
+        st.rerun()
     
+    st.markdown("---")
+    st.subheader("🧠 共享数据集")
+    registry = registry_stats()
+    st.caption(
+        f"内存中 {registry['entries']} 个（使用中 {registry['in_use']} 个），"
+        f"占用 {registry['bytes'] / 1024 / 1024:.1f} / {registry['max_bytes'] / 1024 / 1024:.0f} MB；"
+        f"命中 {registry['hits']} 次，读取 {registry['misses']} 次，淘汰 {registry['evictions']} 次"
+    )
+    if registry["items"]:
+        with st.expander("数据集明细"):
+            st.dataframe(
+                pd.DataFrame({
+                    "数据集": [item["key"][:48] for item in registry["items"]],
+                    "占用(MB)": [round(item["bytes"] / 1024 / 1024, 2) for item in registry["items"]],
+                    "使用中会话": [item["holders"] for item in registry["items"]],
+                    "命中次数": [item["hits"] for item in registry["items"]],
+                    "最近使用": [datetime.fromtimestamp(item["last_used"]).strftime("%H:%M:%S") for item in registry["items"]],
+                }),
+                use_container_width=True, hide_index=True
+            )
+
+    st.markdown("---")
+    st.subheader("⏱️ 性能")
+    st.checkbox("跟踪内存峰值（较慢）", key="perf_trace_memory", help="用tracemalloc统计每个阶段的Python内存峰值")
+    st.button("🔬 采集一次性能剖析", key="perf_profile_button", type="secondary", use_container_width=True,
+              help="对本次运行做cProfile剖析（安装pyinstrument时使用pyinstrument），结果可在页面底部“性能”面板下载")
+
     st.markdown("---")
     st.info("💡 提示：点击图表节点可以查看详细信息")
 
 # ===================== 7. 数据验证和后续处理 =====================
-if df.empty:
+if daily_cube is None:
     st.error("❌ 无有效数据可展示，请上传正确的Excel文件")
+    finish_run(perf_run)
     st.stop()
 
 # ===================== 8. 数据筛选和处理 =====================
+# 数据集键：内容指纹 + 记录数，同一数据集的摘要和明细只计算一次
+dataset_key = (daily_cube["fingerprint"] if daily_cube is not None else None, len(df))
+
 # 显示数据摘要
-with st.expander("📊 数据摘要", expanded=True):
-    col1, col2, col3, col4 = st.columns(4)
-    with col1:
-        total_records = len(df)
-        st.metric("总记录数", total_records)
-    
-    with col2:
-        traffic_types = df["traffic_type"].nunique()
-        st.metric("流量类型数", traffic_types)
-    
-    with col3:
-        total_exposure = df[df["source"].str.contains("曝光")]["value"].sum()
-        st.metric("总曝光量", f"{total_exposure:,.0f}")
-    
-    with col4:
-        total_sales = df[df["source"].str.contains("销量")]["value"].sum()
-        st.metric("总销量", f"{total_sales:,.0f}")
+with stage("summary_metrics", rows_in=len(df)):
+    summary = dataset_summary(dataset_key, df, daily_cube)
+    with st.expander("📊 数据摘要", expanded=True):
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("总记录数", summary["records"])
+
+        with col2:
+            st.metric("流量类型数", summary["traffic_types"])
+
+        with col3:
+            st.metric("总曝光量", f"{summary['exposure']:,.0f}")
+
+        with col4:
+            st.metric("总销量", f"{summary['sales']:,.0f}")
 
 # 数据筛选聚合
 start_date_dt = pd.Timestamp(start_date)
 end_date_dt = pd.Timestamp(end_date)
 
-filtered_df = df[(df["date"] >= start_date_dt) & (df["date"] <= end_date_dt)]
-aggregated_df = filtered_df.groupby(["source", "target", "group", "traffic_type"], as_index=False)["value"].sum()
-aggregated_df = aggregated_df[aggregated_df["value"] > 0]
-
-# ===================== 9. 生成节点列表 =====================
-# 拆分流量类型为Amazon组和Shopify组
-Amazon_TRAFFIC = [t for t in TRAFFIC_ORDER if TRAFFIC_MAPPING[t]["site"] == "Amazon-US"]
-Shopify_TRAFFIC = [t for t in TRAFFIC_ORDER if TRAFFIC_MAPPING[t]["site"] == "Shopify"]
-
-# 分别生成Amazon组的节点
-Amazon_flow_sources = Amazon_TRAFFIC
-Amazon_exposure_nodes = [TRAFFIC_MAPPING[t]["nodes"]["exposure"] for t in Amazon_TRAFFIC]
-Amazon_level2_exposure = list(set([TRAFFIC_MAPPING[t]["nodes"]["level2_exposure"] for t in Amazon_TRAFFIC]))
-Amazon_click_nodes = [TRAFFIC_MAPPING[t]["nodes"]["click"] for t in Amazon_TRAFFIC]
-Amazon_level2_click = list(set([TRAFFIC_MAPPING[t]["nodes"]["level2_click"] for t in Amazon_TRAFFIC]))
-Amazon_sales_nodes = [TRAFFIC_MAPPING[t]["nodes"]["sales"] for t in Amazon_TRAFFIC]
-Amazon_level2_sales = list(set([TRAFFIC_MAPPING[t]["nodes"]["level2_sales"] for t in Amazon_TRAFFIC]))
-
-# 分别生成Shopify组的节点
-Shopify_flow_sources = Shopify_TRAFFIC
-Shopify_exposure_nodes = [TRAFFIC_MAPPING[t]["nodes"]["exposure"] for t in Shopify_TRAFFIC]
-Shopify_level2_exposure = list(set([TRAFFIC_MAPPING[t]["nodes"]["level2_exposure"] for t in Shopify_TRAFFIC]))
-Shopify_click_nodes = [TRAFFIC_MAPPING[t]["nodes"]["click"] for t in Shopify_TRAFFIC]
-Shopify_level2_click = list(set([TRAFFIC_MAPPING[t]["nodes"]["level2_click"] for t in Shopify_TRAFFIC]))
-Shopify_sales_nodes = [TRAFFIC_MAPPING[t]["nodes"]["sales"] for t in Shopify_TRAFFIC]
-Shopify_level2_sales = list(set([TRAFFIC_MAPPING[t]["nodes"]["level2_sales"] for t in Shopify_TRAFFIC]))
-
-# 总节点（曝光/点击/销量）
-total_nodes = ["总曝光", "总点击", "总销量"]
-
-# 拼接节点列表：先Amazon组，再Shopify组（确保Shopify在下方）
-all_nodes = (
-    # Amazon组节点
-    Amazon_flow_sources + Amazon_exposure_nodes + Amazon_level2_exposure + 
-    # 总曝光
-    total_nodes[:1] + 
-    # Amazon点击相关节点
-    Amazon_click_nodes + Amazon_level2_click + 
-    # 总点击
-    total_nodes[1:2] + 
-    # Amazon销量相关节点
-    Amazon_sales_nodes + Amazon_level2_sales + 
-    # Shopify组节点（放到Amazon之后，显示在下方）
-    Shopify_flow_sources + Shopify_exposure_nodes + Shopify_level2_exposure + 
-    # Shopify点击相关节点
-    Shopify_click_nodes + Shopify_level2_click + 
-    # Shopify销量相关节点
-    Shopify_sales_nodes + Shopify_level2_sales + 
-    # 总销量
-    total_nodes[2:]
-)
-
-node_ids = {node: idx for idx, node in enumerate(all_nodes)}
-
-# ===================== 10. 节点统计 =====================
-node_stats = {}
-for node in all_nodes:
-    incoming = aggregated_df[aggregated_df["target"] == node]["value"].sum()
-    outgoing = aggregated_df[aggregated_df["source"] == node]["value"].sum()
-    node_stats[node] = (incoming, outgoing)
-
-# 计算总节点的总流入（用于节点占比计算）
-total_node_values = {
-    "总曝光": node_stats.get("总曝光", (0, 0))[0],  # 总曝光的总流入
-    "总点击": node_stats.get("总点击", (0, 0))[0],  # 总点击的总流入
-    "总销量": node_stats.get("总销量", (0, 0))[0]   # 总销量的总流入
-}
-
-# 生成节点的customdata（包含占比）
-node_customdata = []
-for node in all_nodes:
-    incoming = node_stats[node][0]
-    outgoing = node_stats[node][1]
-    ratio = ""
-    
-    # 排除总曝光、总点击、总销量，不显示它们的占比
-    if node in ["总曝光", "总点击", "总销量"]:
-        pass  # 这三个节点的占比设为空
+# ===================== 9. 节点、链路与桑基图 =====================
+if view_mode == "区间对比":
+    # 对比期默认取紧邻本期之前的等长区间
+    if base_auto:
+        base_end_dt = start_date_dt - pd.Timedelta(days=1)
+        base_start_dt = base_end_dt - (end_date_dt - start_date_dt)
     else:
-        # 判断节点类型，计算占对应总节点的比例
-        if "曝光" in node:
-            total = total_node_values["总曝光"]
-            if total > 0:
-                ratio = f"占总曝光：{round((outgoing / total) * 100, 2)}%"
-        elif "点击" in node:
-            total = total_node_values["总点击"]
-            if total > 0:
-                ratio = f"占总点击：{round((outgoing / total) * 100, 2)}%"
-        elif "销量" in node:
-            total = total_node_values["总销量"]
-            if total > 0:
-                ratio = f"占总销量：{round((outgoing / total) * 100, 2)}%"
-    
-    node_customdata.append((incoming, outgoing, ratio))
-
-# ===================== 11. 搜索关键词匹配 =====================
-search_keyword = search_keyword.strip().lower() if isinstance(search_keyword, str) else ""
-matched_traffic_types = []
-
-if not search_keyword:
-    matched_traffic_types = TRAFFIC_ORDER
-else:
-    matched_sites = []
-    for site in SITE_CONFIG:
-        if search_keyword in site.lower() or search_keyword in SITE_CONFIG[site]["cn_name"].lower():
-            matched_sites.append(site)
-    
-    if matched_sites:
-        matched_traffic_types = [t for t in TRAFFIC_ORDER if TRAFFIC_MAPPING[t]["site"] in matched_sites]
+        base_start_dt, base_end_dt = sorted([pd.Timestamp(base_start_date), pd.Timestamp(base_end_date)])
+    base_title = make_title(base_start_dt.date(), base_end_dt.date(), search_keyword)
+    current_title = make_title(start_date, end_date, search_keyword)
+    if compare_style == "并排":
+        sankeys = [
+            compute_sankey(daily_cube, base_start_dt, base_end_dt, search_keyword, exposure_scale, later_scale, min_share),
+            compute_sankey(daily_cube, start_date_dt, end_date_dt, search_keyword, exposure_scale, later_scale, min_share),
+        ]
+        matched_traffic_types = sankeys[1]["matched_traffic_types"]
+        with stage("figure_build", rows_in=sum(len(sankey["links"]["value"]) for sankey in sankeys)):
+            figs = [build_figure(sankeys[0], f"对比期：{base_title}"), build_figure(sankeys[1], f"本期：{current_title}")]
+        with stage("chart_render"):
+            for column, fig in zip(st.columns(2), figs):
+                with column:
+                    st.plotly_chart(fig, use_container_width=True, height=800)
     else:
-        matched_traffic_types = [t for t in TRAFFIC_ORDER if search_keyword in t.lower()]
-
-# 生成匹配节点列表
-matched_nodes = []
-for traffic_type in matched_traffic_types:
-    cfg = TRAFFIC_MAPPING[traffic_type]
-    matched_nodes.extend([
-        traffic_type,
-        cfg["nodes"]["exposure"],
-        cfg["nodes"]["click"],
-        cfg["nodes"]["sales"],
-        cfg["nodes"]["level2_exposure"],
-        cfg["nodes"]["level2_click"],
-        cfg["nodes"]["level2_sales"]
-    ])
-matched_nodes = list(set(matched_nodes))
-
-# ===================== 12. 生成链路 =====================
-total_incoming = aggregated_df.groupby("target")["value"].sum().to_dict()
-exposure_link = [
-    (s, TRAFFIC_MAPPING[s]["nodes"]["exposure"]) for s in TRAFFIC_ORDER
-] + [
-    (TRAFFIC_MAPPING[s]["nodes"]["exposure"], TRAFFIC_MAPPING[s]["nodes"]["level2_exposure"]) for s in TRAFFIC_ORDER
-] + [
-    (TRAFFIC_MAPPING[s]["nodes"]["level2_exposure"], "总曝光") for s in TRAFFIC_ORDER
-]
-
-link_sources = []
-link_targets = []
-link_values = []
-link_customdata = []
-link_colors = []
-
-for _, row in aggregated_df.iterrows():
-    source = row["source"]
-    target = row["target"]
-    original_val = row["value"]
-    group = row["group"]
-    traffic_type = row["traffic_type"]
-    
-    is_matched = traffic_type in matched_traffic_types
-    is_exposure = (source, target) in exposure_link
-    base_scaled_val = original_val * (exposure_scale if is_exposure else later_scale)
-    final_val = base_scaled_val if is_matched else base_scaled_val * 0.05
-    
-    # 核心：百分比计算（保留2位小数）
-    target_total = total_incoming.get(target, 1)
-    ratio = round((original_val / target_total) * 100, 2)
-    
-    final_color = GROUP_COLORS[group] if is_matched else "rgba(200, 200, 200, 0.2)"
-    
-    link_sources.append(node_ids[source])
-    link_targets.append(node_ids[target])
-    link_values.append(final_val)
-    link_colors.append(final_color)
-    link_customdata.append([source, target, original_val, ratio])
-
-# ===================== 13. 节点颜色 =====================
-node_color_list = []
-for node in all_nodes:
-    if node in matched_nodes:
-        if node in NODE_TO_TRAFFIC:
-            traffic_type = NODE_TO_TRAFFIC[node]
-            node_color = GROUP_COLORS[TRAFFIC_MAPPING[traffic_type]["group_id"]]
-        else:
-            node_color = GROUP_COLORS.get(
-                next((site for site in SITE_CONFIG if site in node), "总节点"),
-                "lightgray"
+        sankey = compute_delta_sankey(
+            daily_cube, (base_start_dt, base_end_dt), (start_date_dt, end_date_dt),
+            search_keyword, exposure_scale, later_scale
+        )
+        matched_traffic_types = sankey["matched_traffic_types"]
+        with stage("figure_build", rows_in=len(sankey["links"]["value"])):
+            fig = build_delta_figure(
+                sankey, f"差值：{current_title} 对比 {base_start_dt:%Y-%m-%d} 至 {base_end_dt:%Y-%m-%d}"
             )
-    else:
-        node_color = "rgba(200, 200, 200, 0.2)"
-    node_color_list.append(node_color)
-
-# ===================== 14. 绘制桑基图 =====================
-fig = go.Figure(data=[go.Sankey(
-    node=dict(
-        pad=20,
-        thickness=30,
-        line=dict(color="black", width=1),
-        label=all_nodes,
-        color=node_color_list,
-        hovertemplate="%{label}<br>流入：%{customdata[0]:.0f}<br>流出：%{customdata[1]:.0f}<br>%{customdata[2]}<extra></extra>",
-        customdata=node_customdata
-    ),
-    link=dict(
-        source=link_sources,
-        target=link_targets,
-        value=link_values,
-        color=link_colors,
-        hovertemplate="%{customdata[0]}→%{customdata[1]}<br>原始数值：%{customdata[2]:.0f}<br>占%{customdata[1]}总流入：%{customdata[3]:.2f}%<extra></extra>",
-        customdata=link_customdata
+        with stage("chart_render"):
+            st.plotly_chart(fig, use_container_width=True, height=800)
+elif view_mode == "漏斗":
+    # CTR/CVR 时间序列：直接切片预先计算的天/周/月汇总
+    matched_traffic_types = funnel_types or match_traffic_types(search_keyword)
+    with stage("funnel_build", rows_in=len(matched_traffic_types)):
+        funnel = compute_funnel(
+            compute_rollups(daily_cube), funnel_freq, start_date_dt, end_date_dt, matched_traffic_types, funnel_by
+        )
+        fig = build_funnel_figure(
+            funnel, f"转化漏斗（{start_date} 至 {end_date}，{ROLLUP_FREQS[funnel_freq]}）"
+        )
+    with stage("chart_render"):
+        st.plotly_chart(fig, use_container_width=True, height=700)
+    with st.expander("📈 漏斗数据"):
+        st.dataframe(
+            funnel_frame(funnel).style.format({"CTR": "{:.2%}", "CVR": "{:.2%}", "曝光": "{:,.0f}", "点击": "{:,.0f}", "销量": "{:,.0f}"}),
+            use_container_width=True, hide_index=True
+        )
+elif view_mode == "动画":
+    # 全部帧由一次 (区间 × 链路) 矩阵计算得到
+    periods = split_windows(start_date_dt, end_date_dt, animation_freq)
+    frames_result = compute_sankey_frames(daily_cube, periods, search_keyword, exposure_scale, later_scale)
+    matched_traffic_types = frames_result["matched_traffic_types"]
+    with stage("figure_build", rows_in=len(periods)):
+        fig = build_animated_figure(frames_result, make_title(start_date, end_date, search_keyword))
+    with stage("chart_render"):
+        st.plotly_chart(fig, use_container_width=True, height=850)
+else:
+    sankey = compute_sankey(
+        daily_cube, start_date_dt, end_date_dt, search_keyword, exposure_scale, later_scale, min_share
     )
-)])
-
-# 添加标题
-title_text = f"多站点流量转化路径（{start_date} 至 {end_date}）"
-if search_keyword:
-    title_text += f" | 高亮：{search_keyword}"
-
-fig.update_layout(
-    title_text=title_text,
-    font_size=12,
-    autosize=True,
-    margin=dict(l=20, r=20, t=50, b=20),
-    font=dict(family="Microsoft YaHei"),
-    height=800
-)
-
-# 显示图表
-st.plotly_chart(fig, use_container_width=True, height=800)
-
-# ===================== 15. 数据显示区域 =====================
-with st.expander("📋 查看详细数据"):
-    tab1, tab2, tab3 = st.tabs(["原始数据", "流量类型统计", "站点统计"])
-    
-    with tab1:
-        st.dataframe(filtered_df.head(100))
-    
-    with tab2:
-        # 按流量类型汇总
-        traffic_summary = filtered_df.groupby("traffic_type").agg({
-            "value": ["sum", "count"]
-        }).round(2)
-        traffic_summary.columns = ["总数值", "记录数"]
-        st.dataframe(traffic_summary)
-    
-    with tab3:
-        # 站点统计
-        st.write("**站点配置:**")
-        for site, info in SITE_CONFIG.items():
-            st.write(f"- {site}: {info['cn_name']}")
-        
-        st.write(f"\n**流量类型总数:** {len(TRAFFIC_ORDER)}")
-        st.write(f"**匹配的流量类型:** {len(matched_traffic_types)}")
-
-# ===================== 16. 页脚信息 =====================
+    matched_traffic_types = sankey["matched_traffic_types"]
+    with stage("figure_build", rows_in=len(sankey["links"]["value"])):
+        fig = build_figure(sankey, make_title(start_date, end_date, search_keyword))
+
+    # 显示图表（含plotly序列化）
+    with stage("chart_render"):
+        st.plotly_chart(fig, use_container_width=True, height=800)
+
+# ===================== 10. 数据显示区域 =====================
+with stage("detail_tables", rows_in=len(df)):
+    traffic_summary = traffic_summary_table(dataset_key, start_date_dt, end_date_dt, df, daily_cube)
+    with st.expander("📋 查看详细数据"):
+        tab1, tab2, tab3, tab4 = st.tabs(["原始数据", "流量类型统计", "站点统计", "导出"])
+
+        with tab1:
+            # 服务端分页：每次只切出当前页发送到浏览器
+            grain_col, size_col, page_col = st.columns(3)
+            with grain_col:
+                detail_edges = DETAIL_GRAINS[st.radio("粒度", list(DETAIL_GRAINS), horizontal=True, key="detail_grain")]
+            with size_col:
+                page_rows = st.selectbox("每页行数", DETAIL_PAGE_SIZES, index=1, key="detail_page_rows")
+            with page_col:
+                page = st.number_input("页码", min_value=1, value=1, step=1, key="detail_page")
+            page_df, total_rows = page_frame(df, daily_cube, start_date_dt, end_date_dt, int(page), page_rows, detail_edges)
+            total_pages = max(1, -(-total_rows // page_rows))
+            if page > total_pages:
+                st.warning(f"页码超出范围，共 {total_pages} 页")
+            st.caption(f"共 {total_rows:,} 行，第 {min(int(page), total_pages)}/{total_pages} 页")
+            st.dataframe(page_df, use_container_width=True, hide_index=True)
+
+        with tab2:
+            # 按流量类型汇总
+            st.dataframe(traffic_summary)
+
+        with tab3:
+            # 站点统计
+            st.write("**站点配置:**")
+            for site, info in SITE_CONFIG.items():
+                st.write(f"- {site}: {info['cn_name']}")
+
+            st.write(f"\n**流量类型总数:** {len(TRAFFIC_ORDER)}")
+            st.write(f"**匹配的流量类型:** {len(matched_traffic_types)}")
+
+        with tab4:
+            # 导出当前日期区间：明细按块写出；链路和节点为当前筛选条件下的单区间桑基图数据
+            table_col, format_col = st.columns(2)
+            with table_col:
+                export_table = EXPORT_TABLE_LABELS[st.selectbox("导出内容", list(EXPORT_TABLE_LABELS), key="export_table")]
+            with format_col:
+                export_format = EXPORT_FORMAT_LABELS[st.selectbox("文件格式", list(EXPORT_FORMAT_LABELS), key="export_format")]
+            export_key = (dataset_key, start_date_dt, end_date_dt, search_keyword, exposure_scale, later_scale, min_share,
+                          export_table, export_format)
+            if st.button("📦 生成导出文件", key="export_button"):
+                with stage("export_write"):
+                    if export_table == "facts":
+                        chunks = iter_fact_chunks(df, daily_cube, start_date_dt, end_date_dt)
+                    else:
+                        export_sankey = compute_sankey(
+                            daily_cube, start_date_dt, end_date_dt, search_keyword, exposure_scale, later_scale, min_share
+                        )
+                        chunks = [(links_frame if export_table == "links" else nodes_frame)(export_sankey)]
+                    st.session_state["export_file"] = {
+                        "key": export_key,
+                        "data": export_bytes(chunks, export_format),
+                        "name": f"{export_table}_{start_date_dt:%Y%m%d}_{end_date_dt:%Y%m%d}.{export_format}",
+                    }
+            export_file = st.session_state.get("export_file")
+            if export_file is not None and export_file["key"] == export_key:
+                st.download_button(
+                    f"⬇️ 下载 {export_file['name']}（{len(export_file['data']) / 1024 / 1024:.1f} MB）",
+                    export_file["data"], file_name=export_file["name"], mime=EXPORT_FORMATS[export_format][1],
+                    key="export_download"
+                )
+            else:
+                st.caption("选择导出内容和格式后点击生成；筛选条件变化后需重新生成")
+
+# ===================== 11. 页脚信息 =====================
 st.markdown("---")
 st.caption(f"📅 数据更新时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 st.caption("💡 提示：修改Excel文件后，重新上传即可更新图表和默认日期范围")
+
+# ===================== 12. 性能面板 =====================
+finish_run(perf_run)
+if perf_profile is not None:
+    st.session_state["profile_result"] = stop_profile(perf_profile)
+
+with st.expander("⏱️ 性能"):
+    st.caption(f"本次运行总耗时：{perf_run['seconds'] * 1000:.1f} ms（各阶段同时以JSON格式写入日志）")
+    st.dataframe(pd.DataFrame(stage_table(perf_run)), use_container_width=True, hide_index=True)
+    profile_result = st.session_state.get("profile_result")
+    if profile_result is not None:
+        st.download_button(
+            "📥 下载性能剖析结果",
+            data=profile_result["data"],
+            file_name=profile_result["file_name"],
+            use_container_width=True
+        )
+        st.code(profile_result["text"][:20000])
@@ -0,0 +1,375 @@
+# sankey_api.py
+# 本地HTTP JSON接口：与页面共用同一套聚合代码，供BI门户嵌入，无需为每个查看者启动Streamlit会话
+# 用法：
+#   python sankey_api.py 数据.xlsx [更多文件 ...] --port 8765
+#   python sankey_api.py --store                     # 使用增量事实库，事实库更新后自动重新加载
+# 接口：
+#   GET /sankey?start=2026-01-05&end=2026-01-19&q=DSP&exposure_scale=0.5&later_scale=5&min_share=0
+#   GET /dataset      数据集指纹与日期范围
+#   GET /health
+# 响应按 (数据集指纹, 规范化参数) 缓存在内存中，支持 ETag / If-None-Match（命中返回304）
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import math
+import os
+import select
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import numpy as np
+import pandas as pd
+
+from sankey_cache import read_file_bytes
+from sankey_core import build_daily_cube, compute_sankey, normalize_keyword
+from sankey_io import load_sources
+from sankey_query import QUERY_BACKENDS, store_query_cube
+from sankey_store import load_store_facts, store_version
+
+logger = logging.getLogger(__name__)
+
+API_VERSION = 1
+RESPONSE_CACHE_SIZE = int(os.environ.get("SANKEY_API_CACHE_SIZE", "256"))
+GZIP_MIN_BYTES = 1024
+# 长连接空闲超过该秒数即关闭；有连接排队等待工作线程时立即关闭空闲长连接
+KEEPALIVE_TIMEOUT = float(os.environ.get("SANKEY_API_KEEPALIVE_S", "5"))
+
+
+# ===================== 1. 数据集 =====================
+def load_dataset(sources=None, streaming=None, store_dir=None, backend="memory"):
+    # 返回 {"cube", "fingerprint", "version", ...}；sources 为空时读取增量事实库
+    # 事实库 + arrow/duckdb 后端时不载入事实数据，查询条件下推到事实库（见 sankey_query）
+    begin = time.perf_counter()
+    if sources:
+        facts, _, _ = load_sources(sources, streaming)
+        dataset = dataset_from_facts(facts, sources, streaming)
+    else:
+        version = store_version(store_dir)
+        if backend == "memory":
+            cube = build_daily_cube(load_store_facts(store_dir))
+        else:
+            cube = store_query_cube(store_dir, backend)
+        dataset = _make_dataset(cube, None, streaming, store_dir, version, backend)
+    logger.info(f"数据集已加载（{backend}），指纹 {dataset['fingerprint']}，耗时 {time.perf_counter() - begin:.2f}s")
+    return dataset
+
+
+def dataset_from_facts(facts, sources=None, streaming=None):
+    return _make_dataset(build_daily_cube(facts), sources, streaming)
+
+
+def _make_dataset(cube, sources=None, streaming=None, store_dir=None, version=None, backend=None):
+    # backend 不为 None 表示数据来自事实库，版本号变化时自动重新加载
+    return {
+        "backend": backend,
+        "sources": sources,
+        "streaming": streaming,
+        "store_dir": store_dir,
+        "version": version,
+        "cube": cube,
+        "fingerprint": cube["fingerprint"] if cube is not None else "empty",
+    }
+
+
+_DATASET_LOCK = threading.Lock()
+
+
+def refresh_dataset(dataset):
+    # 事实库模式下版本号变化时原地重新加载；返回 (cube, fingerprint) 快照，避免请求中途数据被替换
+    if dataset["backend"] and store_version(dataset["store_dir"]) != dataset["version"]:
+        with _DATASET_LOCK:
+            if store_version(dataset["store_dir"]) != dataset["version"]:
+                dataset.update(load_dataset(None, dataset["streaming"], dataset["store_dir"], dataset["backend"]))
+    return dataset["cube"], dataset["fingerprint"]
+
+
+# ===================== 2. 参数 =====================
+def parse_params(query, cube):
+    # 规范化查询参数；日期缺省取数据范围，开始晚于结束时交换（与页面一致）
+    def first(name, default):
+        values = query.get(name)
+        return values[0] if values else default
+
+    days = cube["days"] if cube is not None else None
+    try:
+        start = pd.Timestamp(first("start", days[0] if days is not None else "2026-01-01")).normalize()
+        end = pd.Timestamp(first("end", days[-1] if days is not None else "2026-01-01")).normalize()
+        exposure_scale = float(first("exposure_scale", 0.5))
+        later_scale = float(first("later_scale", 5.0))
+        min_share = float(first("min_share", 0.0))
+    except ValueError as e:
+        raise ValueError(f"参数无法解析：{str(e)}")
+    for name, value in [("exposure_scale", exposure_scale), ("later_scale", later_scale), ("min_share", min_share)]:
+        if not math.isfinite(value):
+            raise ValueError(f"参数 {name} 必须为有限数值，收到：{value}")
+    if start > end:
+        start, end = end, start
+    return {
+        "start": start,
+        "end": end,
+        "q": normalize_keyword(first("q", "")),
+        "exposure_scale": exposure_scale,
+        "later_scale": later_scale,
+        "min_share": min_share,
+    }
+
+
+def make_etag(fingerprint, params):
+    # 响应完全由数据集和参数决定：ETag 无需先计算响应即可比较
+    key = json.dumps([API_VERSION, fingerprint, {k: str(v) for k, v in params.items()}], sort_keys=True)
+    return '"' + hashlib.sha1(key.encode("utf-8")).hexdigest()[:20] + '"'
+
+
+# ===================== 3. 响应内容 =====================
+def _floats(values):
+    return np.asarray(values, dtype="float64").round(4).tolist()
+
+
+def sankey_payload(cube, fingerprint, params):
+    # 列式JSON：节点与链路各为一组等长数组，链路通过节点下标引用节点
+    sankey = compute_sankey(
+        cube, params["start"], params["end"], params["q"],
+        params["exposure_scale"], params["later_scale"], params["min_share"]
+    )
+    incoming, outgoing, ratios = zip(*sankey["node_customdata"]) if sankey["node_customdata"] else ((), (), ())
+    links, aggregated_df = sankey["links"], sankey["aggregated_df"]
+    return {
+        "dataset": fingerprint,
+        "start": f"{params['start']:%Y-%m-%d}",
+        "end": f"{params['end']:%Y-%m-%d}",
+        "q": params["q"],
+        "matched_traffic_types": sankey["matched_traffic_types"],
+        "nodes": {
+            "label": sankey["all_nodes"],
+            "color": sankey["node_colors"],
+            "inflow": _floats(incoming),
+            "outflow": _floats(outgoing),
+            "ratio": list(ratios),
+        },
+        "links": {
+            "source": np.asarray(links["source"]).tolist(),
+            "target": np.asarray(links["target"]).tolist(),
+            "value": _floats(aggregated_df["value"]),
+            "share": _floats(links["customdata"][:, 1]) if len(links["customdata"]) else [],
+            "width": _floats(links["value"]),
+            "color": np.asarray(links["color"]).tolist(),
+            "traffic_type": aggregated_df["traffic_type"].tolist(),
+            "group": aggregated_df["group"].tolist(),
+        },
+    }
+
+
+# ===================== 4. 响应缓存 =====================
+# ETag → 序列化后的响应体（及gzip压缩结果），LRU淘汰；同一ETag并发请求时只计算一次
+_RESPONSE_CACHE = OrderedDict()
+_RESPONSE_PENDING = {}
+_RESPONSE_LOCK = threading.Lock()
+_RESPONSE_STATS = {"hits": 0, "misses": 0}
+
+
+def cached_response(etag, build):
+    with _RESPONSE_LOCK:
+        entry = _RESPONSE_CACHE.get(etag)
+        if entry is not None:
+            _RESPONSE_CACHE.move_to_end(etag)
+            _RESPONSE_STATS["hits"] += 1
+            return entry
+        event = _RESPONSE_PENDING.get(etag)
+        owner = event is None
+        if owner:
+            event = _RESPONSE_PENDING[etag] = threading.Event()
+            _RESPONSE_STATS["misses"] += 1
+    if not owner:
+        event.wait()
+        return cached_response(etag, build)
+    try:
+        body = json.dumps(build(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        entry = {"body": body, "gzip": gzip.compress(body, 5) if len(body) >= GZIP_MIN_BYTES else None}
+        with _RESPONSE_LOCK:
+            _RESPONSE_CACHE[etag] = entry
+            while len(_RESPONSE_CACHE) > RESPONSE_CACHE_SIZE:
+                _RESPONSE_CACHE.popitem(last=False)
+        return entry
+    finally:
+        with _RESPONSE_LOCK:
+            _RESPONSE_PENDING.pop(etag).set()
+
+
+def response_cache_stats():
+    with _RESPONSE_LOCK:
+        return {"entries": len(_RESPONSE_CACHE), **_RESPONSE_STATS}
+
+
+def clear_response_cache():
+    with _RESPONSE_LOCK:
+        _RESPONSE_CACHE.clear()
+
+
+# ===================== 5. HTTP服务 =====================
+class SankeyRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "SankeyAPI/1"
+    # 读取请求时的套接字超时，读到一半卡住的客户端不会一直占用工作线程
+    timeout = KEEPALIVE_TIMEOUT
+
+    def handle(self):
+        # 长连接：每个请求处理完后等待下一个请求，等待期间不能无限期占用线程池中的工作线程
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection and self._wait_for_next_request():
+            self.handle_one_request()
+
+    def _wait_for_next_request(self):
+        deadline = time.monotonic() + KEEPALIVE_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.server.queued_connections():
+                return False
+            readable, _, _ = select.select([self.connection], [], [], 0.05)
+            if readable:
+                return True
+        return False
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        try:
+            if url.path == "/sankey":
+                self._sankey(parse_qs(url.query))
+            elif url.path == "/dataset":
+                self._dataset()
+            elif url.path == "/health":
+                self._send_json(200, {"status": "ok", "cache": response_cache_stats()})
+            else:
+                self._send_json(404, {"error": f"未知路径：{url.path}"})
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+        except Exception as e:
+            logger.exception(f"请求处理失败：{self.path}")
+            self._send_json(500, {"error": str(e)})
+
+    def _sankey(self, query):
+        cube, fingerprint = refresh_dataset(self.server.dataset)
+        params = parse_params(query, cube)
+        etag = make_etag(fingerprint, params)
+        if etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+            self._send(304, None, etag)
+            return
+        entry = cached_response(etag, lambda: sankey_payload(cube, fingerprint, params))
+        self._send(200, entry, etag)
+
+    def _dataset(self):
+        cube, fingerprint = refresh_dataset(self.server.dataset)
+        self._send_json(200, {
+            "dataset": fingerprint,
+            "first_day": f"{cube['days'][0]:%Y-%m-%d}" if cube is not None else None,
+            "last_day": f"{cube['days'][-1]:%Y-%m-%d}" if cube is not None else None,
+        })
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self._send(status, {"body": body, "gzip": None})
+
+    def _send(self, status, entry, etag=None):
+        self.send_response(status)
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        if entry is None:
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = entry["body"]
+        if entry["gzip"] is not None and "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = entry["gzip"]
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class PooledHTTPServer(HTTPServer):
+    # 连接交给固定大小的线程池处理（聚合与序列化主要在NumPy/JSON中完成，缓存命中时只是写出字节）
+    request_queue_size = 128
+
+    def __init__(self, address, dataset, workers=8):
+        super().__init__(address, SankeyRequestHandler)
+        self.dataset = dataset
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sankey-api")
+        self._queued = 0
+        self._queued_lock = threading.Lock()
+
+    def queued_connections(self):
+        # 已接受、尚未分配到工作线程的连接数
+        return self._queued
+
+    def process_request(self, request, client_address):
+        with self._queued_lock:
+            self._queued += 1
+        self.pool.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        with self._queued_lock:
+            self._queued -= 1
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=True)
+
+
+def make_server(dataset, host="127.0.0.1", port=8765, workers=8):
+    return PooledHTTPServer((host, port), dataset, workers)
+
+
+# ===================== 6. 命令行入口 =====================
+def build_parser():
+    parser = argparse.ArgumentParser(description="桑基图聚合数据的本地HTTP JSON接口")
+    parser.add_argument("workbook", nargs="*", help="Excel/CSV文件路径，可指定多个；不指定时使用增量事实库")
+    parser.add_argument("--store", action="store_true", help="使用增量事实库（默认目录见 SANKEY_STORE_DIR）")
+    parser.add_argument("--store-dir", help="增量事实库目录")
+    parser.add_argument("--backend", choices=list(QUERY_BACKENDS), default="memory",
+                        help="事实库查询后端：memory=全部载入内存，arrow/duckdb=条件下推到事实库按需读取")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址（默认仅本机）")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=8, help="处理请求的线程数")
+    parser.add_argument("--streaming", action="store_true", default=None,
+                        help="强制流式读取（默认按文件大小自动选择）")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if not args.workbook and not args.store:
+        logger.error("请指定工作簿，或使用 --store 读取增量事实库")
+        return 1
+    sources = [(path, read_file_bytes(path)) for path in args.workbook] if args.workbook else None
+    dataset = load_dataset(sources, args.streaming, args.store_dir, args.backend)
+    server = make_server(dataset, args.host, args.port, args.workers)
+    logger.info(f"接口已启动：http://{args.host}:{server.server_port}/sankey（线程数：{args.workers}）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+# sankey_batch.py
+# 批量渲染：一个或多个工作簿 + 多个日期窗口 → 每个窗口一个独立HTML桑基图，多进程并行
+# 用法示例：
+#   python sankey_batch.py 数据.xlsx --freq W --start 2026-01-01 --end 2026-03-31 --out-dir reports
+#   python sankey_batch.py 数据.xlsx --window 2026-01-05:2026-01-11 --window 2026-01-12:2026-01-18
+import argparse
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from sankey_cache import read_file_bytes
+from sankey_core import build_daily_cube, compute_sankey, build_figure, make_title, split_windows
+from sankey_io import load_sources, EXCEL_ENGINES
+
+logger = logging.getLogger(__name__)
+
+# 子进程共享的只读数据（由进程池initializer写入）
+_WORKER_STATE = {}
+
+
+# ===================== 1. 日期窗口 =====================
+def parse_window(text):
+    start, sep, end = text.partition(":")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"日期窗口格式应为 开始:结束，收到：{text}")
+    try:
+        start_date, end_date = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(f"无法解析日期窗口：{text}（{str(e)}）")
+    if start_date > end_date:
+        start_date, end_date = end_date, start_date
+    return start_date, end_date
+
+
+# ===================== 2. 单窗口渲染 =====================
+def _init_worker(cube, options):
+    _WORKER_STATE["cube"] = cube
+    _WORKER_STATE["options"] = options
+
+
+def render_window(window):
+    cube, options = _WORKER_STATE["cube"], _WORKER_STATE["options"]
+    start_date, end_date = window
+    begin = time.perf_counter()
+    sankey = compute_sankey(
+        cube, start_date, end_date, options["search"], options["exposure_scale"], options["later_scale"],
+        options["min_share"]
+    )
+    fig = build_figure(sankey, make_title(start_date.date(), end_date.date(), options["search"]))
+    path = os.path.join(options["out_dir"], f"sankey_{start_date:%Y%m%d}_{end_date:%Y%m%d}.html")
+    fig.write_html(path, include_plotlyjs=options["plotlyjs"], full_html=True)
+    return path, len(sankey["aggregated_df"]), time.perf_counter() - begin
+
+
+# ===================== 3. 命令行入口 =====================
+def build_parser():
+    parser = argparse.ArgumentParser(description="批量生成多站点流量-销量桑基图（HTML）")
+    parser.add_argument("workbook", nargs="+", help="Excel/CSV文件路径，可指定多个（读取全部工作表并合并）")
+    parser.add_argument("--window", action="append", type=parse_window, default=[],
+                        help="日期窗口 开始:结束，可重复指定")
+    parser.add_argument("--freq", help="按周期自动切分窗口，如 D/W/M/Q")
+    parser.add_argument("--start", help="自动切分的开始日期，默认取数据最早日期")
+    parser.add_argument("--end", help="自动切分的结束日期，默认取数据最晚日期")
+    parser.add_argument("--out-dir", default="sankey_reports", help="输出目录")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="并行进程数")
+    parser.add_argument("--search", default="", help="高亮关键词（站点/流量类型）")
+    parser.add_argument("--exposure-scale", type=float, default=0.5, help="曝光链路缩放")
+    parser.add_argument("--later-scale", type=float, default=5.0, help="后续链路缩放")
+    parser.add_argument("--min-share", type=float, default=0.0,
+                        help="小链路折叠阈值（%%），低于该比例的流量类型并入站点的“其他”节点，0为不折叠")
+    parser.add_argument("--streaming", action="store_true", default=None,
+                        help="强制流式读取（默认按文件大小自动选择）")
+    parser.add_argument("--excel-engine", choices=["auto"] + EXCEL_ENGINES, default=None,
+                        help="xlsx解析引擎，默认取 SANKEY_EXCEL_ENGINE 或 auto")
+    parser.add_argument("--plotlyjs", choices=["inline", "cdn"], default="inline",
+                        help="inline=内嵌plotly.js可离线打开，cdn=文件更小")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    sources = [(path, read_file_bytes(path)) for path in args.workbook]
+    facts, _, _ = load_sources(sources, args.streaming, args.workers, engine=args.excel_engine)
+    if facts.empty:
+        logger.error("工作簿中没有有效数据")
+        return 1
+    cube = build_daily_cube(facts)
+
+    windows = list(args.window)
+    if args.freq:
+        start_date = pd.Timestamp(args.start) if args.start else cube["days"][0]
+        end_date = pd.Timestamp(args.end) if args.end else cube["days"][-1]
+        windows.extend(split_windows(start_date.normalize(), end_date.normalize(), args.freq))
+    if not windows:
+        windows = [(cube["days"][0], cube["days"][-1])]
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    options = {
+        "search": args.search,
+        "exposure_scale": args.exposure_scale,
+        "later_scale": args.later_scale,
+        "min_share": args.min_share,
+        "out_dir": args.out_dir,
+        "plotlyjs": True if args.plotlyjs == "inline" else "cdn",
+    }
+
+    begin = time.perf_counter()
+    workers = max(1, min(args.workers, len(windows)))
+    if workers == 1:
+        _init_worker(cube, options)
+        results = [render_window(window) for window in windows]
+    else:
+        results = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(cube, options)) as pool:
+            futures = [pool.submit(render_window, window) for window in windows]
+            for future in as_completed(futures):
+                results.append(future.result())
+
+    for path, n_links, elapsed in sorted(results):
+        logger.info(f"已生成：{path}（链路数：{n_links}，耗时：{elapsed:.2f}s）")
+    logger.info(f"共生成 {len(results)} 个桑基图，进程数：{workers}，总耗时：{time.perf_counter() - begin:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
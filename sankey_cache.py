@@ -0,0 +1,184 @@
+# sankey_cache.py
+# 解析结果的本地列式缓存（Arrow IPC），按 文件内容哈希 + 映射配置版本 建键
+# 用法：python sankey_cache.py [stats|clear]
+import hashlib
+import json
+import logging
+import os
+import sys
+import uuid
+
+import pyarrow as pa
+
+from sankey_config import SITE_CONFIG, TRAFFIC_ORDER, TRAFFIC_MAPPING, INVALID_TRAFFIC_TYPES
+
+logger = logging.getLogger(__name__)
+
+# ===================== 1. 缓存配置 =====================
+CACHE_DIR = os.environ.get(
+    "SANKEY_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".sankey_cache")
+)
+CACHE_MAX_BYTES = int(float(os.environ.get("SANKEY_CACHE_MAX_MB", "1024")) * 1024 * 1024)
+CACHE_SUFFIX = ".arrow"
+# 缓存文件格式变更时递增，使旧缓存全部失效
+CACHE_FORMAT_VERSION = 2
+
+
+def _schema_version():
+    payload = json.dumps(
+        [CACHE_FORMAT_VERSION, TRAFFIC_ORDER, TRAFFIC_MAPPING, SITE_CONFIG, INVALID_TRAFFIC_TYPES],
+        sort_keys=True, ensure_ascii=False, default=dict  # 配置表为只读映射
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+SCHEMA_VERSION = _schema_version()
+
+
+# ===================== 2. 键与路径 =====================
+def read_file_bytes(source):
+    # 兼容本地路径和Streamlit上传对象
+    if hasattr(source, "getvalue"):
+        return source.getvalue()
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def cache_key(file_bytes, variant=""):
+    # variant 区分同一文件的不同读取方式（如流式汇总）
+    digest = hashlib.sha256(file_bytes).hexdigest()
+    if variant:
+        return f"{digest[:32]}-{variant}-{SCHEMA_VERSION}"
+    return f"{digest[:32]}-{SCHEMA_VERSION}"
+
+
+def _cache_path(key):
+    return os.path.join(CACHE_DIR, key + CACHE_SUFFIX)
+
+
+def _cache_files():
+    if not os.path.isdir(CACHE_DIR):
+        return []
+    files = []
+    for name in os.listdir(CACHE_DIR):
+        if not name.endswith(CACHE_SUFFIX):
+            continue
+        path = os.path.join(CACHE_DIR, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+    return files
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+# ===================== 3. 读写 =====================
+def write_arrow(path, df):
+    # 先写临时文件再原子替换，避免并发读到半个文件
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    try:
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+    except OSError:
+        _remove(tmp_path)
+        raise
+
+
+def read_arrow(path):
+    # 通过内存映射打开，读取Arrow表本身不复制；to_pandas 会把数据完整复制一份到内存，
+    # 返回的DataFrame可写且不再引用映射，映射随即关闭（占用内存与直接读入相同，只少一次读缓冲复制）
+    with pa.memory_map(path, "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+    return table.to_pandas()
+
+
+def load_cached(key):
+    # 命中时读入DataFrame（见 read_arrow），并刷新修改时间作为LRU访问时间
+    path = _cache_path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        df = read_arrow(path)
+        os.utime(path, None)
+    except (OSError, pa.ArrowInvalid) as e:
+        logger.warning(f"缓存文件损坏，已忽略：{path}（{str(e)}）")
+        return None
+    logger.info(f"命中本地缓存：{key}")
+    return df
+
+
+def store_cached(key, df):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = _cache_path(key)
+    try:
+        write_arrow(path, df)
+    except OSError as e:
+        logger.warning(f"写入本地缓存失败：{str(e)}")
+        return
+    evict(keep=path)
+
+
+def evict(max_bytes=None, keep=None):
+    # 按最近访问时间淘汰，直到总大小不超过上限
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    files = sorted(_cache_files())
+    total = sum(size for _, size, _ in files)
+    removed = 0
+    for _, size, path in files:
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        _remove(path)
+        total -= size
+        removed += 1
+    # 单个文件超过上限时不保留
+    if keep and total > max_bytes:
+        _remove(keep)
+        removed += 1
+    if removed:
+        logger.info(f"本地缓存淘汰文件数：{removed}")
+    return removed
+
+
+def clear_cache():
+    files = _cache_files()
+    for _, _, path in files:
+        _remove(path)
+    logger.info(f"已清空本地缓存，文件数：{len(files)}")
+    return len(files)
+
+
+def cache_stats():
+    files = _cache_files()
+    return {
+        "files": len(files),
+        "bytes": sum(size for _, size, _ in files),
+        "max_bytes": CACHE_MAX_BYTES,
+        "dir": CACHE_DIR,
+    }
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    if command == "clear":
+        print(f"已删除缓存文件：{clear_cache()}")
+    elif command == "stats":
+        stats = cache_stats()
+        print(f"缓存目录：{stats['dir']}")
+        print(f"文件数：{stats['files']}，占用：{stats['bytes'] / 1024 / 1024:.1f} MB / {stats['max_bytes'] / 1024 / 1024:.0f} MB")
+    else:
+        print("用法：python sankey_cache.py [stats|clear]")
+        sys.exit(1)
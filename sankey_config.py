@@ -0,0 +1,21 @@
+# sankey_config.py
+# ===================== 全局配置 =====================
+# 站点、流量类型映射及颜色定义在外部配置文件中（默认 traffic_config.json，
+# 可通过环境变量 SANKEY_TOPOLOGY_CONFIG 指定其他JSON/YAML文件），导入时加载并编译为拓扑
+# 本模块每个进程只执行一次（Streamlit每次rerun只重新执行页面脚本），导出的配置表和编译后的拓扑均为只读
+from sankey_topology import load_config, compile_topology, freeze_topology
+
+# 原始配置只在本模块内使用，对外只导出下面的只读表
+_CONFIG = load_config()
+
+SITE_CONFIG = freeze_topology(_CONFIG["sites"])
+
+TRAFFIC_ORDER = freeze_topology(_CONFIG["traffic_order"])
+
+TRAFFIC_MAPPING = freeze_topology(_CONFIG["traffic_mapping"])
+
+# 无效流量类型过滤列表
+INVALID_TRAFFIC_TYPES = freeze_topology(_CONFIG.get("invalid_traffic_types", []))
+
+# 编译后的拓扑：节点编号、链路数组、颜色等只计算一次；节点顺序只由配置决定，各进程一致
+TOPOLOGY = freeze_topology(compile_topology(_CONFIG))
@@ -0,0 +1,903 @@
+# sankey_core.py
+# 不依赖Streamlit的数据处理核心，供页面和脚本复用
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from sankey_config import SITE_CONFIG, TRAFFIC_MAPPING, INVALID_TRAFFIC_TYPES, TOPOLOGY
+from sankey_topology import EDGE_TEMPLATES, LAYER_KEYS
+from sankey_perf import stage
+from sankey_readonly import freeze
+
+logger = logging.getLogger(__name__)
+
+EDGE_COLUMNS = ["source", "target", "value", "date", "group", "traffic_type"]
+
+# ===================== 1. 编译后的拓扑 =====================
+# 每条输入记录对应9条链路，节点/链路均已在 sankey_topology 中编译为整数数组
+# 本模块中由拓扑派生的静态表同样每个进程只构建一次，并设为只读
+MEASURE_COLUMNS = ["曝光", "点击", "销量"]
+VALID_TRAFFIC_TYPES = TOPOLOGY["traffic_types"]
+TYPE_GROUPS = TOPOLOGY["type_groups"]
+EDGE_SOURCES = freeze(TOPOLOGY["node_names"][TOPOLOGY["edge_source"]])
+EDGE_TARGETS = freeze(TOPOLOGY["node_names"][TOPOLOGY["edge_target"]])
+EDGE_MEASURE_INDEX = TOPOLOGY["edge_measure"]
+
+# ===================== 2. 数据预处理 =====================
+# Excel日期序列号的起点（1900日期系统，已包含1900-02-29的历史误差）
+EXCEL_EPOCH = pd.Timestamp("1899-12-30")
+# 只把合理范围内的数值单元格视为日期序列号（36526 = 2000-01-01，73415 = 2100-12-31）；
+# 时间列中误填的小整数等不会变成1900年的日期，把按日立方体拉长到数万天
+EXCEL_SERIAL_MIN = 36526
+EXCEL_SERIAL_MAX = 73415
+
+
+def _parse_date_values(values):
+    # 对去重后的取值解析：日期时间原样保留，Excel序列号按天换算，字符串去掉时分秒、"/"替换为"-"
+    if pd.api.types.is_datetime64_any_dtype(values):
+        values = pd.DatetimeIndex(values)
+        return (values.tz_localize(None) if values.tz is not None else values).normalize()
+    values = pd.Series(values, dtype=object)
+    # 只有数值单元格才可能是序列号，"45000" 之类的文本不按序列号换算
+    is_number = values.map(lambda value: isinstance(value, (int, float, np.number)) and not isinstance(value, bool))
+    serial = pd.to_numeric(values.where(is_number), errors="coerce")
+    is_serial = (serial >= EXCEL_SERIAL_MIN) & (serial <= EXCEL_SERIAL_MAX)
+    text = values.astype(str).str.strip().str.split(" ", n=1).str[0].str.replace("/", "-", regex=False)
+    parsed = pd.to_datetime(text, format="%Y-%m-%d", errors="coerce")
+    # 非常规格式（如 "2026.01.05"、"20260105"）逐一推断，正常导出中很少出现
+    # 范围外的数值单元格直接视为无效日期，不做推断
+    retry = parsed.isna() & ~is_number & ~text.isin(["nan", "NaT", "None", ""])
+    if retry.any():
+        parsed[retry] = pd.to_datetime(text[retry], format="mixed", errors="coerce")
+    parsed[is_serial] = EXCEL_EPOCH + pd.to_timedelta(np.floor(serial[is_serial]), unit="D")
+    return pd.DatetimeIndex(parsed).normalize()
+
+
+def parse_dates(column):
+    # 导出中日期高度重复（每天数百行），先去重只解析每个不同取值，再按编码展开
+    codes, uniques = pd.factorize(column, use_na_sentinel=True)
+    parsed = _parse_date_values(uniques).to_numpy(dtype="datetime64[ns]")
+    dates = np.append(parsed, np.datetime64("NaT", "ns"))[codes]
+    return pd.Series(dates, index=column.index)
+
+
+def prepare_dates(df):
+    # 时间列统一转为日期：兼容日期时间单元格、Excel序列号及 "2026/1/5"、"2026-01-05 00:00" 等混合文本
+    df["date"] = parse_dates(df["时间"])
+    return df
+
+
+def filter_valid_rows(df):
+    # 过滤空日期、无效流量类型、未配置流量类型及非法站点
+    traffic = df["流量类型"]
+    has_date = df["date"].notna()
+    is_invalid = traffic.isin(INVALID_TRAFFIC_TYPES)
+    is_mapped = traffic.isin(TRAFFIC_MAPPING)
+
+    unmapped = traffic[has_date & ~is_invalid & ~is_mapped]
+    for traffic_type, count in unmapped.value_counts(dropna=False).items():
+        logger.warning(f"未配置的流量类型：{traffic_type}（{count}行，已跳过）")
+
+    bad_site = has_date & is_mapped & ~traffic.isin(VALID_TRAFFIC_TYPES)
+    for traffic_type in traffic[bad_site].unique():
+        logger.warning(f"非法站点：{TRAFFIC_MAPPING[traffic_type]['site']}（流量类型：{traffic_type}，已跳过）")
+
+    return df[has_date & ~is_invalid & traffic.isin(VALID_TRAFFIC_TYPES)]
+
+
+# ===================== 3. 紧凑事实表 =====================
+# 每条有效记录一行：日期 + 流量类型编码 + 三个度量；链路在聚合后才按拓扑展开
+FACT_COLUMNS = ["date", "traffic_type", "exposure", "click", "sales"]
+FACT_MEASURES = ["exposure", "click", "sales"]
+TRAFFIC_TYPE_DTYPE = pd.CategoricalDtype(VALID_TRAFFIC_TYPES)
+
+
+def _compact_measure(values):
+    # float32能无损表示时降为float32，否则保留float64
+    values = values.to_numpy(dtype="float64")
+    compact = values.astype("float32")
+    if np.array_equal(compact, values):
+        return compact
+    return values
+
+
+def empty_fact_table():
+    return pd.DataFrame({
+        "date": pd.Series(dtype="datetime64[ns]"),
+        "traffic_type": pd.Series(dtype=TRAFFIC_TYPE_DTYPE),
+        **{col: pd.Series(dtype="float32") for col in FACT_MEASURES},
+    })
+
+
+def build_fact_table(df):
+    valid = filter_valid_rows(df)
+    if valid.empty:
+        return empty_fact_table()
+    facts = pd.DataFrame({
+        "date": valid["date"].dt.normalize().to_numpy(),
+        "traffic_type": pd.Categorical(valid["流量类型"], dtype=TRAFFIC_TYPE_DTYPE),
+    })
+    for col, source_col in zip(FACT_MEASURES, MEASURE_COLUMNS):
+        facts[col] = _compact_measure(pd.to_numeric(valid[source_col], errors="coerce").fillna(0.0))
+    return facts
+
+
+# ===================== 4. 链路展开 =====================
+def expand_fact_edges(facts):
+    # 按流量类型编码查表，事实表每行展开为9条链路（明细/导出用）
+    if facts.empty:
+        return pd.DataFrame(columns=EDGE_COLUMNS)
+    codes = facts["traffic_type"].cat.codes.to_numpy()
+    n_edges = len(EDGE_MEASURE_INDEX)
+    measures = facts[FACT_MEASURES].to_numpy(dtype="float64")
+    return pd.DataFrame({
+        "source": EDGE_SOURCES[codes].ravel(),
+        "target": EDGE_TARGETS[codes].ravel(),
+        "value": measures[:, EDGE_MEASURE_INDEX].ravel(),
+        "date": np.repeat(facts["date"].to_numpy(), n_edges),
+        "group": np.repeat(TYPE_GROUPS[codes], n_edges),
+        "traffic_type": np.repeat(np.asarray(VALID_TRAFFIC_TYPES, dtype=object)[codes], n_edges),
+    })
+
+
+def build_edge_frame(df):
+    return expand_fact_edges(build_fact_table(df))
+
+
+# ===================== 5. 按日前缀和立方体 =====================
+EDGE_KEYS = ["source", "target", "group", "traffic_type"]
+
+
+# 全部 (流量类型, 链路模板) 组合，已按 EDGE_KEYS 排序（与groupby输出顺序一致），附带节点编号
+STATIC_EDGES = TOPOLOGY["edges"]
+LINK_COLUMNS = EDGE_KEYS + ["source_id", "target_id", "type_code", "is_exposure"]
+
+
+def build_daily_cube(facts):
+    # 稠密 (天 × 流量类型 × 度量) 矩阵沿天累加，任意日期区间聚合 = 两行相减
+    if facts.empty:
+        return None
+    first_day = facts["date"].min()
+    days = pd.date_range(first_day, facts["date"].max(), freq="D")
+    day_idx = ((facts["date"] - first_day) // pd.Timedelta(days=1)).to_numpy()
+
+    n_types, n_measures = len(VALID_TRAFFIC_TYPES), len(FACT_MEASURES)
+    flat = (day_idx + 1) * n_types + facts["traffic_type"].cat.codes.to_numpy()
+    daily = np.stack([
+        np.bincount(flat, weights=facts[col].to_numpy(dtype="float64"), minlength=(len(days) + 1) * n_types)
+        for col in FACT_MEASURES
+    ], axis=-1).reshape(len(days) + 1, n_types, n_measures)
+    prefix = np.cumsum(daily, axis=0)
+    # 数据指纹：内容相同的数据（无论来自哪个文件/事实库）共享周/月汇总等整个数据集的缓存
+    fingerprint = hashlib.sha1(prefix.tobytes() + str(days[0]).encode()).hexdigest()
+    return {"days": days, "prefix": prefix, "fingerprint": fingerprint}
+
+
+def range_bounds(cube, start_date, end_date):
+    # 日期区间对应的前缀和行号 [lo, hi)
+    days = cube["days"]
+    lo = days.searchsorted(pd.Timestamp(start_date), side="left")
+    hi = days.searchsorted(pd.Timestamp(end_date), side="right")
+    return int(lo), int(max(lo, hi))
+
+
+def aggregate_type_totals(cube, start_date, end_date):
+    # 日期区间内每个流量类型的 (曝光, 点击, 销量) 合计，形状 (流量类型数, 3)
+    if cube is None:
+        return np.zeros((len(VALID_TRAFFIC_TYPES), len(FACT_MEASURES)))
+    lo, hi = range_bounds(cube, start_date, end_date)
+    if hi <= lo:
+        return np.zeros((len(VALID_TRAFFIC_TYPES), len(FACT_MEASURES)))
+    if "query" in cube:
+        # 查询后端（sankey_query）：条件下推到事实库，只返回聚合后的合计
+        return cube["query"](cube["days"][lo], cube["days"][hi - 1])
+    return cube["prefix"][hi] - cube["prefix"][lo]
+
+
+def edges_from_totals(type_totals):
+    # 按拓扑把流量类型合计展开为链路，仅保留正值
+    aggregated_df = STATIC_EDGES[LINK_COLUMNS].copy()
+    aggregated_df["value"] = type_totals[STATIC_EDGES["type_code"], STATIC_EDGES["measure"]]
+    return aggregated_df[aggregated_df["value"] > 0]
+
+
+def aggregate_range(cube, start_date, end_date):
+    # 返回与 groupby(EDGE_KEYS)["value"].sum() 一致的聚合结果（仅保留正值）
+    return edges_from_totals(aggregate_type_totals(cube, start_date, end_date))
+
+
+# ===================== 6. 节点统计 =====================
+RATIO_PREFIXES = freeze(np.array(["占总曝光：", "占总点击：", "占总销量："], dtype=object))
+# 节点→所属度量（0=曝光，1=点击，2=销量），流量类型节点和总节点为 -1
+NODE_MEASURES = TOPOLOGY["node_measure"]
+
+
+def compute_node_flows(aggregated_df, all_nodes):
+    # 聚合结果自带节点编号，一次bincount得到全部节点的流入/流出
+    n_nodes = len(all_nodes)
+    values = aggregated_df["value"].to_numpy(dtype="float64")
+    incoming = np.bincount(aggregated_df["target_id"].to_numpy(), weights=values, minlength=n_nodes)
+    outgoing = np.bincount(aggregated_df["source_id"].to_numpy(), weights=values, minlength=n_nodes)
+    return incoming, outgoing
+
+
+def build_node_customdata(all_nodes, incoming, outgoing, node_ids=None):
+    # 每个节点的 (流入, 流出, 占对应总节点的比例文本)；all_nodes 为 build_node_list(node_ids) 的结果
+    # node_ids 为折叠小链路后实际保留的节点编号（见第15节），None 表示完整拓扑
+    if node_ids is None:
+        totals = incoming[TOPOLOGY["total_ids"]]
+        measures = NODE_MEASURES
+    else:
+        lod_incoming = np.zeros(len(LOD_NODE_NAMES))
+        lod_incoming[node_ids] = incoming
+        totals = lod_incoming[TOPOLOGY["total_ids"]]
+        measures = LOD_NODE_MEASURES[node_ids]
+
+    has_measure = measures >= 0
+    node_totals = np.where(has_measure, totals[measures], 0.0)
+    show_ratio = has_measure & (node_totals > 0)
+    ratios = np.full(len(all_nodes), "", dtype=object)
+    if show_ratio.any():
+        percent = pd.Series(outgoing[show_ratio] / node_totals[show_ratio] * 100).round(2).astype(str)
+        ratios[show_ratio] = RATIO_PREFIXES[measures[show_ratio]] + percent.to_numpy(dtype=object) + "%"
+    return list(zip(incoming, outgoing, ratios))
+
+
+# ===================== 7. 链路数组 =====================
+# 颜色文本不带空格：每条链路都要序列化一次
+DIM_COLOR = "rgba(200,200,200,0.2)"
+DIM_FACTOR = 0.05
+# 链路宽度只需保留少量小数，减少JSON体积
+LINK_VALUE_DECIMALS = 3
+GROUP_LINK_COLORS = freeze(np.array([TOPOLOGY["group_colors"][group] for group in TYPE_GROUPS], dtype=object))
+
+
+def matched_type_mask(matched_traffic_types):
+    mask = np.zeros(len(VALID_TRAFFIC_TYPES), dtype=bool)
+    codes = [TOPOLOGY["type_index"][t] for t in matched_traffic_types if t in TOPOLOGY["type_index"]]
+    mask[codes] = True
+    return mask
+
+
+def build_link_base(aggregated_df, all_nodes):
+    # 与高亮/缩放无关的链路数组（节点编号、原始值、占比、悬浮数据），可按日期区间缓存复用
+    source_codes = aggregated_df["source_id"].to_numpy(dtype=np.int32)
+    target_codes = aggregated_df["target_id"].to_numpy(dtype=np.int32)
+    values = aggregated_df["value"].to_numpy(dtype="float64")
+
+    # 占目标节点总流入的百分比（保留2位小数）
+    target_totals = np.bincount(target_codes, weights=values, minlength=len(all_nodes))[target_codes]
+    ratios = np.round(np.divide(values, target_totals, out=np.zeros_like(values), where=target_totals > 0) * 100, 2)
+
+    # 悬浮数据只放数值，节点名称由 hovertemplate 按节点编号引用（%{source.label}），不再逐链路重复
+    return {
+        "source": source_codes,
+        "target": target_codes,
+        "values": values,
+        "type_code": aggregated_df["type_code"].to_numpy(),
+        "is_exposure": aggregated_df["is_exposure"].to_numpy(),
+        "fold_group": aggregated_df["fold_group"].to_numpy() if "fold_group" in aggregated_df else None,
+        "customdata": np.column_stack([values, ratios]),
+    }
+
+
+def style_links(link_base, matched_traffic_types, exposure_scale, later_scale):
+    # 高亮与缩放只改变链路宽度和颜色：对缓存的链路数组做逐元素变换
+    type_mask = matched_type_mask(matched_traffic_types)
+    type_code = link_base["type_code"]
+    is_matched = type_mask[type_code]
+    colors = GROUP_LINK_COLORS[type_code]
+    if link_base.get("fold_group") is not None:
+        # 折叠后的“其他”链路（type_code 为 -1）：组内任一流量类型命中即高亮
+        other = type_code < 0
+        is_matched[other] = fold_group_mask(link_base["folded"], type_mask)[link_base["fold_group"][other]]
+        colors[other] = OTHER_LINK_COLOR
+    scaled = link_base["values"] * np.where(link_base["is_exposure"], exposure_scale, later_scale)
+    return {
+        "source": link_base["source"],
+        "target": link_base["target"],
+        "value": np.round(np.where(is_matched, scaled, scaled * DIM_FACTOR), LINK_VALUE_DECIMALS),
+        "color": np.where(is_matched, colors, DIM_COLOR),
+        "customdata": link_base["customdata"],
+    }
+
+
+def build_links(aggregated_df, all_nodes, matched_traffic_types, exposure_scale, later_scale):
+    # 全部链路属性按节点/类型编号一次性计算，直接输出plotly所需的NumPy数组
+    return style_links(build_link_base(aggregated_df, all_nodes), matched_traffic_types, exposure_scale, later_scale)
+
+
+# ===================== 8. 节点列表 =====================
+def build_node_list(node_ids=None):
+    # 编译好的节点布局：站点按配置顺序自上而下，总曝光/总点击位于第一个站点之后，总销量在最后
+    # 折叠小链路后只保留 node_ids 对应的节点，“其他”节点排在最后
+    if node_ids is None:
+        return list(TOPOLOGY["nodes"])
+    return LOD_NODE_NAMES[node_ids].tolist()
+
+
+# ===================== 9. 搜索关键词匹配 =====================
+def normalize_keyword(search_keyword):
+    return search_keyword.strip().lower() if isinstance(search_keyword, str) else ""
+
+
+def match_traffic_types(search_keyword):
+    # 优先按站点匹配，未命中站点时按流量类型名称匹配；结果按关键词缓存
+    return list(_match_traffic_types(normalize_keyword(search_keyword)))
+
+
+@lru_cache(maxsize=256)
+def _match_traffic_types(search_keyword):
+    if not search_keyword:
+        return tuple(VALID_TRAFFIC_TYPES)
+
+    matched_sites = []
+    for site in SITE_CONFIG:
+        if search_keyword in site.lower() or search_keyword in SITE_CONFIG[site]["cn_name"].lower():
+            matched_sites.append(site)
+
+    if matched_sites:
+        ranges = TOPOLOGY["site_type_ranges"]
+        return tuple(t for site in matched_sites if site in ranges for t in VALID_TRAFFIC_TYPES[slice(*ranges[site])])
+    return tuple(t for t in VALID_TRAFFIC_TYPES if search_keyword in t.lower())
+
+
+def matched_node_mask(matched_traffic_types):
+    # 命中流量类型的自身节点（流量类型、曝光、点击、销量及二级节点）
+    mask = np.zeros(len(TOPOLOGY["nodes"]), dtype=bool)
+    mask[TOPOLOGY["type_nodes"][matched_type_mask(matched_traffic_types)].ravel()] = True
+    return mask
+
+
+# ===================== 10. 节点颜色 =====================
+def build_node_colors(matched_traffic_types, node_ids=None, folded=None):
+    mask = matched_node_mask(matched_traffic_types)
+    if node_ids is None:
+        return np.where(mask, TOPOLOGY["node_colors"], DIM_COLOR).tolist()
+    other_mask = fold_group_mask(folded, matched_type_mask(matched_traffic_types))[OTHER_NODE_GROUPS]
+    lod_mask = np.concatenate([mask, other_mask])[node_ids]
+    return np.where(lod_mask, LOD_NODE_COLORS[node_ids], DIM_COLOR).tolist()
+
+
+# ===================== 11. 绘制桑基图 =====================
+def make_title(start_date, end_date, search_keyword=""):
+    title_text = f"多站点流量转化路径（{start_date} 至 {end_date}）"
+    search_keyword = normalize_keyword(search_keyword)
+    if search_keyword:
+        title_text += f" | 高亮：{search_keyword}"
+    return title_text
+
+
+NODE_HOVER = "%{label}<br>流入：%{customdata[0]:.0f}<br>流出：%{customdata[1]:.0f}<br>%{customdata[2]}<extra></extra>"
+LINK_HOVER = "%{source.label}→%{target.label}<br>原始数值：%{customdata[0]:.0f}<br>占%{target.label}总流入：%{customdata[1]:.2f}%<extra></extra>"
+
+
+def sankey_trace_spec(sankey, node_hover=NODE_HOVER, link_hover=LINK_HOVER):
+    return dict(
+        node=dict(
+            pad=20,
+            thickness=30,
+            line=dict(color="black", width=1),
+            label=sankey["all_nodes"],
+            color=sankey["node_colors"],
+            hovertemplate=node_hover,
+            customdata=sankey["node_customdata"]
+        ),
+        link=dict(
+            **sankey["links"],
+            hovertemplate=link_hover
+        )
+    )
+
+
+def build_sankey_trace(sankey, node_hover=NODE_HOVER, link_hover=LINK_HOVER):
+    # plotly 在首次绘图时才导入：只用数据接口的进程（HTTP接口、入库脚本、导出）不加载
+    import plotly.graph_objects as go
+
+    return go.Sankey(**sankey_trace_spec(sankey, node_hover, link_hover))
+
+
+def _update_layout(fig, title_text, height=800):
+    fig.update_layout(
+        title_text=title_text,
+        font_size=12,
+        autosize=True,
+        margin=dict(l=20, r=20, t=50, b=20),
+        font=dict(family="Microsoft YaHei"),
+        height=height
+    )
+    return fig
+
+
+def build_figure(sankey, title_text):
+    import plotly.graph_objects as go
+
+    return _update_layout(go.Figure(data=[build_sankey_trace(sankey)]), title_text)
+
+
+# ===================== 12. 日期区间结果缓存 =====================
+# 聚合、节点统计和链路基础数组只取决于日期区间内的数据，按LRU缓存；搜索和缩放不再重新聚合
+# 缓存键是区间内容的指纹而不是整个数据集的指纹：增量导入只改变部分日期时，未涉及这些日期的区间结果仍然有效
+RANGE_CACHE_SIZE = int(os.environ.get("SANKEY_RANGE_CACHE_SIZE", "64"))
+_RANGE_CACHE = OrderedDict()
+_RANGE_CACHE_LOCK = threading.Lock()
+
+
+def range_fingerprint(cube, start_date, end_date):
+    # 查询立方体：区间内各日分区内容哈希（来自事实库清单）；内存立方体：区间内各流量类型合计（两行前缀和相减）
+    lo, hi = range_bounds(cube, start_date, end_date)
+    if "day_hashes" in cube:
+        content = "".join(cube["day_hashes"][lo:hi]).encode("ascii")
+    else:
+        content = (cube["prefix"][hi] - cube["prefix"][lo]).tobytes()
+    return hashlib.sha1(content).hexdigest()
+
+
+def _build_range(cube, start_date, end_date, min_share=0.0):
+    with stage("filter_aggregate") as record:
+        aggregated_df = aggregate_range(cube, start_date, end_date)
+        record["rows_out"] = len(aggregated_df)
+    node_ids, folded = None, None
+    if min_share > 0:
+        with stage("lod_fold", rows_in=len(aggregated_df)) as record:
+            aggregated_df, node_ids, folded = fold_small_links(aggregated_df, min_share)
+            record["rows_out"] = len(aggregated_df)
+    all_nodes = build_node_list(node_ids)
+    with stage("node_stats", rows_in=len(aggregated_df)) as record:
+        incoming, outgoing = compute_node_flows(aggregated_df, all_nodes)
+        node_customdata = build_node_customdata(all_nodes, incoming, outgoing, node_ids)
+        record["rows_out"] = len(node_customdata)
+    with stage("link_base", rows_in=len(aggregated_df)) as record:
+        link_base = build_link_base(aggregated_df, all_nodes)
+        link_base["folded"] = folded
+        record["rows_out"] = len(link_base["values"])
+    return {
+        "aggregated_df": aggregated_df,
+        "all_nodes": all_nodes,
+        "node_ids": node_ids,
+        "folded": folded,
+        "node_customdata": node_customdata,
+        "link_base": link_base,
+    }
+
+
+def compute_range(cube, start_date, end_date, min_share=0.0):
+    # 缓存结果为共享对象，调用方不应原地修改
+    if cube is None or "fingerprint" not in cube:
+        return _build_range(cube, start_date, end_date, min_share)
+    key = (range_fingerprint(cube, start_date, end_date), float(min_share))
+    with _RANGE_CACHE_LOCK:
+        cached = _RANGE_CACHE.get(key)
+        if cached is not None:
+            _RANGE_CACHE.move_to_end(key)
+    if cached is not None:
+        with stage("range_cache_hit") as record:
+            record["rows_out"] = len(cached["aggregated_df"])
+        return cached
+
+    result = _build_range(cube, start_date, end_date, min_share)
+    with _RANGE_CACHE_LOCK:
+        _RANGE_CACHE[key] = result
+        while len(_RANGE_CACHE) > RANGE_CACHE_SIZE:
+            _RANGE_CACHE.popitem(last=False)
+    return result
+
+
+def clear_range_cache():
+    with _RANGE_CACHE_LOCK:
+        _RANGE_CACHE.clear()
+
+
+# ===================== 13. 完整流程 =====================
+def compute_sankey(cube, start_date, end_date, search_keyword="", exposure_scale=0.5, later_scale=5.0, min_share=0.0):
+    # 日期区间聚合 → 节点统计 → 搜索匹配 → 链路，返回绘图所需的全部数据
+    # 前三步按 (数据指纹, 日期区间, 折叠阈值) 缓存，改变搜索词或缩放系数时只做数组变换
+    # min_share > 0 时把占目标节点流入低于该百分比的小链路折叠到“其他”节点（见第15节）
+    base = compute_range(cube, start_date, end_date, min_share)
+    with stage("search_match") as record:
+        matched_traffic_types = match_traffic_types(search_keyword)
+        node_colors = build_node_colors(matched_traffic_types, base["node_ids"], base["folded"])
+        record["rows_out"] = len(matched_traffic_types)
+    with stage("link_style", rows_in=len(base["link_base"]["values"])) as record:
+        links = style_links(base["link_base"], matched_traffic_types, exposure_scale, later_scale)
+        record["rows_out"] = len(links["value"])
+    return {
+        "aggregated_df": base["aggregated_df"],
+        "all_nodes": base["all_nodes"],
+        "node_customdata": base["node_customdata"],
+        "node_colors": node_colors,
+        "matched_traffic_types": matched_traffic_types,
+        "links": links,
+    }
+
+
+# ===================== 14. 多区间：对比与动画 =====================
+INCREASE_COLOR = "rgba(46, 160, 67, 0.6)"
+DECREASE_COLOR = "rgba(220, 53, 69, 0.6)"
+
+
+def split_windows(start_date, end_date, freq):
+    # 按周期切分 [start_date, end_date]，首尾周期截断到区间内
+    windows = []
+    for period in pd.period_range(start_date, end_date, freq=freq):
+        window_start = max(period.start_time.normalize(), start_date)
+        window_end = min(period.end_time.normalize(), end_date)
+        windows.append((window_start, window_end))
+    return windows
+
+
+def period_edge_matrix(cube, periods):
+    # 一次前缀和相减得到全部区间的链路值，形状 (区间数, 链路数)，列顺序与 STATIC_EDGES 一致
+    if cube is None or not periods:
+        return np.zeros((len(periods), len(STATIC_EDGES)))
+    bounds = np.array([range_bounds(cube, start, end) for start, end in periods])
+    prefix = cube.get("prefix")
+    if "query" in cube:
+        # 查询后端：一次按 (日期, 流量类型) 分组查询覆盖全部区间的按日合计，在本地累加为前缀和
+        first, last = int(bounds[:, 0].min()), int(bounds[:, 1].max())
+        daily = cube["daily"](cube["days"][first:last])
+        prefix = np.concatenate([np.zeros((1,) + daily.shape[1:]), np.cumsum(daily, axis=0)])
+        bounds = bounds - first
+    type_totals = prefix[bounds[:, 1]] - prefix[bounds[:, 0]]
+    return type_totals[:, STATIC_EDGES["type_code"].to_numpy(), STATIC_EDGES["measure"].to_numpy()]
+
+
+def _period_links(matrix):
+    # 任一区间有值的链路，所有区间共用同一组链路（便于动画帧之间对应）
+    keep = (matrix > 0).any(axis=0)
+    return STATIC_EDGES.loc[keep, LINK_COLUMNS].reset_index(drop=True), matrix[:, keep]
+
+
+def compute_sankey_frames(cube, periods, search_keyword="", exposure_scale=0.5, later_scale=5.0):
+    # 每个区间一帧：节点统计和链路都是对 (区间 × 链路) 矩阵的一行做数组运算
+    with stage("period_matrix", rows_in=len(periods)) as record:
+        links_df, values = _period_links(period_edge_matrix(cube, periods))
+        record["rows_out"] = values.size
+    all_nodes = build_node_list()
+    matched_traffic_types = match_traffic_types(search_keyword)
+    frames = []
+    with stage("frame_build", rows_in=len(periods)) as record:
+        for period, row in zip(periods, values):
+            aggregated_df = links_df.assign(value=row)
+            incoming, outgoing = compute_node_flows(aggregated_df, all_nodes)
+            frames.append({
+                "period": period,
+                "aggregated_df": aggregated_df,
+                "node_customdata": build_node_customdata(all_nodes, incoming, outgoing),
+                "links": build_links(aggregated_df, all_nodes, matched_traffic_types, exposure_scale, later_scale),
+            })
+        record["rows_out"] = len(frames)
+    return {
+        "all_nodes": all_nodes,
+        "node_colors": build_node_colors(matched_traffic_types),
+        "matched_traffic_types": matched_traffic_types,
+        "frames": frames,
+    }
+
+
+def period_label(period):
+    start_date, end_date = period
+    if start_date == end_date:
+        return f"{start_date:%Y-%m-%d}"
+    return f"{start_date:%m-%d}~{end_date:%m-%d}"
+
+
+def build_animated_figure(frames_result, title_text, frame_duration=600):
+    # 每个区间一个plotly帧，滑块切换，播放按钮自动轮播
+    # 各帧结构相同，跳过plotly逐帧的属性校验（只校验第一帧），构建耗时约为校验时的1/4
+    import plotly.graph_objects as go
+
+    frames = frames_result["frames"]
+    labels = [period_label(frame["period"]) for frame in frames]
+    traces = [dict(type="sankey", **sankey_trace_spec({**frames_result, **frame})) for frame in frames]
+    fig = go.Figure(
+        dict(
+            data=[build_sankey_trace({**frames_result, **frames[0]})] if frames else [],
+            frames=[dict(data=[trace], name=label) for trace, label in zip(traces, labels)]
+        ),
+        _validate=False
+    )
+    _update_layout(fig, title_text, height=850)
+    step_args = dict(mode="immediate", frame=dict(duration=0, redraw=True), transition=dict(duration=0))
+    fig.update_layout(
+        updatemenus=[dict(
+            type="buttons",
+            direction="left",
+            x=0, y=-0.02, xanchor="left", yanchor="top",
+            buttons=[
+                dict(label="▶ 播放", method="animate", args=[None, dict(
+                    mode="immediate", fromcurrent=True,
+                    frame=dict(duration=frame_duration, redraw=True), transition=dict(duration=0)
+                )]),
+                dict(label="⏸ 暂停", method="animate", args=[[None], step_args]),
+            ]
+        )],
+        sliders=[dict(
+            active=0,
+            x=0.12, len=0.88, y=-0.02, yanchor="top",
+            currentvalue=dict(prefix="区间："),
+            steps=[dict(label=label, method="animate", args=[[label], step_args]) for label in labels]
+        )]
+    )
+    return fig
+
+
+DELTA_NODE_HOVER = "%{label}<br>对比期：%{customdata[0]:.0f}<br>本期：%{customdata[1]:.0f}<br>变化：%{customdata[2]}<extra></extra>"
+DELTA_LINK_HOVER = "%{source.label}→%{target.label}<br>对比期：%{customdata[0]:.0f}<br>本期：%{customdata[1]:.0f}<br>变化：%{customdata[2]}<extra></extra>"
+
+
+def _change_text(before, after):
+    change = np.full(len(before), "新增", dtype=object)
+    has_base = before > 0
+    percent = pd.Series((after[has_base] - before[has_base]) / before[has_base] * 100).round(2)
+    change[has_base] = np.where(percent >= 0, "+", "") + percent.astype(str).to_numpy(dtype=object) + "%"
+    change[(before == 0) & (after == 0)] = "-"
+    return change
+
+
+def compute_delta_sankey(cube, base_period, current_period, search_keyword="", exposure_scale=0.5, later_scale=5.0):
+    # 差值桑基图：链路宽度为两个区间之差的绝对值，绿色为增长、红色为下降
+    links_df, values = _period_links(period_edge_matrix(cube, [base_period, current_period]))
+    before, after = values
+    delta = after - before
+    all_nodes = build_node_list()
+    matched_traffic_types = match_traffic_types(search_keyword)
+
+    source_codes = links_df["source_id"].to_numpy(dtype=np.int64)
+    target_codes = links_df["target_id"].to_numpy(dtype=np.int64)
+    is_matched = matched_type_mask(matched_traffic_types)[links_df["type_code"].to_numpy()]
+    scaled = np.abs(delta) * np.where(links_df["is_exposure"].to_numpy(), exposure_scale, later_scale)
+    colors = np.where(delta >= 0, INCREASE_COLOR, DECREASE_COLOR)
+
+    customdata = np.empty((len(delta), 3), dtype=object)
+    customdata[:, 0] = before
+    customdata[:, 1] = after
+    customdata[:, 2] = _change_text(before, after)
+
+    n_nodes = len(all_nodes)
+    node_before = np.bincount(target_codes, weights=before, minlength=n_nodes)
+    node_after = np.bincount(target_codes, weights=after, minlength=n_nodes)
+    # 流量类型节点没有流入，按流出统计
+    no_inflow = (node_before == 0) & (node_after == 0)
+    node_before[no_inflow] = np.bincount(source_codes, weights=before, minlength=n_nodes)[no_inflow]
+    node_after[no_inflow] = np.bincount(source_codes, weights=after, minlength=n_nodes)[no_inflow]
+    return {
+        "aggregated_df": links_df.assign(before=before, after=after, delta=delta),
+        "all_nodes": all_nodes,
+        "node_customdata": list(zip(node_before, node_after, _change_text(node_before, node_after))),
+        "node_colors": build_node_colors(matched_traffic_types),
+        "matched_traffic_types": matched_traffic_types,
+        "links": {
+            "source": source_codes,
+            "target": target_codes,
+            "value": np.round(np.where(is_matched, scaled, scaled * DIM_FACTOR), LINK_VALUE_DECIMALS),
+            "color": np.where(is_matched, colors, DIM_COLOR),
+            "customdata": customdata,
+        },
+    }
+
+
+def build_delta_figure(sankey, title_text):
+    import plotly.graph_objects as go
+
+    return _update_layout(
+        go.Figure(data=[build_sankey_trace(sankey, DELTA_NODE_HOVER, DELTA_LINK_HOVER)]), title_text
+    )
+
+
+# ===================== 15. 细节层级：小链路折叠为“其他” =====================
+# 每个站点在流量类型/曝光/点击/销量层各有一个“其他”节点，编号接在拓扑节点之后
+FOLD_LAYERS = ["traffic_type", "exposure", "click", "sales"]
+FOLD_LABELS = ["其他流量", "其他曝光", "其他点击", "其他销量"]
+FOLD_LAYER_MEASURES = freeze(np.array([0, 0, 1, 2]))
+OTHER_LINK_COLOR = "rgba(160,160,160,0.6)"
+FOLD_SITES = tuple(TOPOLOGY["site_type_ranges"])
+# 流量类型按站点连续编号，type_code → 站点序号
+TYPE_SITES = freeze(np.repeat(
+    np.arange(len(FOLD_SITES)), [hi - lo for lo, hi in TOPOLOGY["site_type_ranges"].values()]
+))
+N_FOLD_GROUPS = len(FOLD_SITES) * len(FACT_MEASURES)
+# 折叠分组 = 站点序号 × 3 + 度量编号
+TYPE_FOLD_GROUPS = freeze(TYPE_SITES[:, None] * len(FACT_MEASURES) + np.arange(len(FACT_MEASURES)))
+OTHER_NODE_GROUPS = freeze(
+    np.repeat(np.arange(len(FOLD_SITES)), len(FOLD_LAYERS)) * len(FACT_MEASURES)
+    + np.tile(FOLD_LAYER_MEASURES, len(FOLD_SITES))
+)
+LOD_NODE_NAMES = freeze(np.concatenate([
+    TOPOLOGY["node_names"],
+    np.array([f"{site}{label}" for site in FOLD_SITES for label in FOLD_LABELS], dtype=object),
+]))
+LOD_NODE_MEASURES = freeze(np.concatenate([
+    NODE_MEASURES, np.tile([-1, 0, 1, 2], len(FOLD_SITES))
+]))
+LOD_NODE_COLORS = freeze(np.concatenate([
+    TOPOLOGY["node_colors"],
+    np.repeat(np.array([TOPOLOGY["group_colors"][site] for site in FOLD_SITES], dtype=object), len(FOLD_LAYERS)),
+]))
+# 链路模板：源节点层 → 模板编号；模板的源/目标所在折叠层（-1 表示该端不折叠）
+TEMPLATE_BY_SOURCE_LAYER = np.full(len(LAYER_KEYS), -1)
+TEMPLATE_BY_SOURCE_LAYER[[LAYER_KEYS.index(src) for src, _, _ in EDGE_TEMPLATES]] = np.arange(len(EDGE_TEMPLATES))
+TEMPLATE_BY_SOURCE_LAYER = freeze(TEMPLATE_BY_SOURCE_LAYER)
+TEMPLATE_SOURCE_FOLD = freeze(np.array([FOLD_LAYERS.index(src) if src in FOLD_LAYERS else -1 for src, _, _ in EDGE_TEMPLATES]))
+TEMPLATE_TARGET_FOLD = freeze(np.array([FOLD_LAYERS.index(tgt) if tgt in FOLD_LAYERS else -1 for _, tgt, _ in EDGE_TEMPLATES]))
+# 决定是否折叠的链路：流量类型节点汇入二级节点（多对一）
+SHARE_TEMPLATES = freeze(np.array([tgt.startswith("level2_") for _, tgt, _ in EDGE_TEMPLATES]))
+
+
+def fold_group_mask(folded, type_mask):
+    # 每个折叠分组内是否有命中的流量类型
+    return np.bincount(TYPE_FOLD_GROUPS[folded & type_mask[:, None]], minlength=N_FOLD_GROUPS) > 0
+
+
+def fold_small_links(aggregated_df, min_share):
+    # 某流量类型汇入二级节点的链路占该节点流入低于 min_share% 时，该类型在这一度量下的整条路径
+    # （流量类型/曝光/点击/销量节点及其后续链路）并入所在站点的“其他”节点，同一对节点间的链路合并
+    # 返回 (折叠后的聚合结果, 保留的节点编号, 折叠标记[流量类型 × 度量])；结果中的节点编号为保留节点中的位置
+    source = aggregated_df["source_id"].to_numpy(dtype=np.int64)
+    target = aggregated_df["target_id"].to_numpy(dtype=np.int64)
+    type_code = aggregated_df["type_code"].to_numpy(dtype=np.int64)
+    values = aggregated_df["value"].to_numpy(dtype="float64")
+    template = TEMPLATE_BY_SOURCE_LAYER[TOPOLOGY["node_layer"][source]]
+    measure = EDGE_MEASURE_INDEX[template]
+
+    decides = SHARE_TEMPLATES[template]
+    inflow = np.bincount(target[decides], weights=values[decides], minlength=len(TOPOLOGY["nodes"]))
+    folded = np.zeros((len(VALID_TRAFFIC_TYPES), len(FACT_MEASURES)), dtype=bool)
+    folded[type_code[decides], measure[decides]] = values[decides] < inflow[target[decides]] * min_share / 100
+    # 分组内只有一个小类型时保留原样
+    folded &= np.bincount(TYPE_FOLD_GROUPS[folded], minlength=N_FOLD_GROUPS)[TYPE_FOLD_GROUPS] > 1
+
+    is_folded = folded[type_code, measure]
+    other_base = len(TOPOLOGY["nodes"]) + TYPE_SITES[type_code] * len(FOLD_LAYERS)
+    source_fold, target_fold = TEMPLATE_SOURCE_FOLD[template], TEMPLATE_TARGET_FOLD[template]
+    folded_df = pd.DataFrame({
+        "source_id": np.where(is_folded & (source_fold >= 0), other_base + source_fold, source),
+        "target_id": np.where(is_folded & (target_fold >= 0), other_base + target_fold, target),
+        "type_code": np.where(is_folded, -1, type_code),
+        "fold_group": np.where(is_folded, TYPE_FOLD_GROUPS[type_code, measure], -1),
+        "is_exposure": measure == 0,
+        "value": values,
+    }).groupby(["source_id", "target_id", "type_code", "fold_group", "is_exposure"], sort=False, as_index=False)["value"].sum()
+
+    node_ids = np.unique(np.concatenate([folded_df["source_id"].to_numpy(), folded_df["target_id"].to_numpy()]))
+    source_ids, target_ids = folded_df["source_id"].to_numpy(), folded_df["target_id"].to_numpy()
+    codes = folded_df["type_code"].to_numpy()
+    folded_df.insert(0, "source", LOD_NODE_NAMES[source_ids])
+    folded_df.insert(1, "target", LOD_NODE_NAMES[target_ids])
+    folded_df.insert(2, "group", np.where(codes >= 0, TYPE_GROUPS[codes], "其他"))
+    folded_df.insert(3, "traffic_type", np.where(codes >= 0, np.array(VALID_TRAFFIC_TYPES, dtype=object)[codes], "其他"))
+    folded_df["source_id"] = np.searchsorted(node_ids, source_ids)
+    folded_df["target_id"] = np.searchsorted(node_ids, target_ids)
+    return folded_df, node_ids, folded
+
+
+# ===================== 16. 漏斗：按天/周/月汇总与转化率 =====================
+# 天/周/月汇总在载入时由按日立方体一次向量化计算，按数据指纹缓存；切换粒度、流量类型只做数组切片
+ROLLUP_FREQS = {"D": "按天", "W": "按周", "M": "按月"}
+# 比率 = 度量[分子] / 度量[分母]（0=曝光，1=点击，2=销量）
+FUNNEL_RATES = {"CTR": (1, 0), "CVR": (2, 1)}
+FUNNEL_RATE_TITLES = {"CTR": "CTR（点击/曝光）", "CVR": "CVR（销量/点击）"}
+ROLLUP_CACHE_SIZE = 16
+_ROLLUP_CACHE = OrderedDict()
+_ROLLUP_CACHE_LOCK = threading.Lock()
+
+
+def daily_type_totals(cube):
+    # 每天每个流量类型的 (曝光, 点击, 销量)，形状 (天数, 流量类型数, 3)，与 cube["days"] 对齐
+    if "query" in cube:
+        # 查询后端：一次按 (日期, 流量类型) 分组扫描
+        return cube["daily"](cube["days"])
+    return np.diff(cube["prefix"], axis=0)
+
+
+def build_rollups(cube):
+    # 周/月汇总 = 按日矩阵沿连续日期段求和（天已排序，同一周期的天相邻）
+    days = cube["days"]
+    daily = daily_type_totals(cube)
+    rollups = {"D": {"periods": days, "totals": daily}}
+    for freq in ("W", "M"):
+        starts = days.to_period(freq).start_time
+        first = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]])
+        rollups[freq] = {"periods": starts[first], "totals": np.add.reduceat(daily, first, axis=0)}
+    return rollups
+
+
+def compute_rollups(cube):
+    # 缓存结果为共享对象，调用方不应原地修改
+    if cube is None:
+        return None
+    key = cube["fingerprint"]
+    with _ROLLUP_CACHE_LOCK:
+        cached = _ROLLUP_CACHE.get(key)
+        if cached is not None:
+            _ROLLUP_CACHE.move_to_end(key)
+            return cached
+    with stage("rollup_build", rows_in=len(cube["days"])) as record:
+        rollups = build_rollups(cube)
+        record["rows_out"] = sum(len(rollup["periods"]) for rollup in rollups.values())
+    with _ROLLUP_CACHE_LOCK:
+        _ROLLUP_CACHE[key] = rollups
+        while len(_ROLLUP_CACHE) > ROLLUP_CACHE_SIZE:
+            _ROLLUP_CACHE.popitem(last=False)
+    return rollups
+
+
+def _rate(numerator, denominator):
+    # 分母为0的周期比率记为空，不画成0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(denominator > 0, numerator / denominator, np.nan)
+
+
+def compute_funnel(rollups, freq, start_date, end_date, traffic_types=None, by="traffic_type"):
+    # 日期区间内各周期的漏斗指标；by="site" 时所选流量类型按站点合并后再计算比率
+    # 返回 {"periods", "names", "colors", "totals"(周期 × 名称 × 3), "CTR", "CVR"(周期 × 名称)}
+    rollup = rollups[freq]
+    periods = rollup["periods"]
+    # 保留与区间有交集的周期：周期起止按数据首末日截断，区间完全在数据之外时返回空漏斗
+    days = rollups["D"]["periods"]
+    starts = periods.where(periods >= days[0], days[0])
+    ends = periods.to_period(freq).end_time.normalize()
+    ends = ends.where(ends <= days[-1], days[-1])
+    lo = int(ends.searchsorted(pd.Timestamp(start_date), side="left"))
+    hi = max(int(starts.searchsorted(pd.Timestamp(end_date), side="right")), lo)
+    codes = np.arange(len(VALID_TRAFFIC_TYPES)) if traffic_types is None else np.array(
+        [TOPOLOGY["type_index"][t] for t in traffic_types], dtype=np.int64
+    )
+    totals = rollup["totals"][lo:hi][:, codes]
+    if by == "site":
+        sites = np.unique(TYPE_SITES[codes])
+        membership = (TYPE_SITES[codes][:, None] == sites[None, :]).astype("float64")
+        totals = np.einsum("ptm,ts->psm", totals, membership)
+        names = np.array(FOLD_SITES, dtype=object)[sites]
+        colors = np.array([TOPOLOGY["group_colors"][site] for site in names], dtype=object)
+    else:
+        names = np.array(VALID_TRAFFIC_TYPES, dtype=object)[codes]
+        colors = np.array([TOPOLOGY["group_colors"][group] for group in np.asarray(TYPE_GROUPS)[codes]], dtype=object)
+    return {
+        "freq": freq,
+        "periods": periods[lo:hi],
+        "names": names,
+        "colors": colors,
+        "totals": totals,
+        **{rate: _rate(totals[..., num], totals[..., den]) for rate, (num, den) in FUNNEL_RATES.items()},
+    }
+
+
+def funnel_frame(funnel):
+    # 长表：周期 × 名称，供页面表格和导出
+    n_periods, n_names = len(funnel["periods"]), len(funnel["names"])
+    return pd.DataFrame({
+        "周期": np.repeat(funnel["periods"], n_names),
+        "名称": np.tile(funnel["names"], n_periods),
+        **{col: funnel["totals"][..., i].ravel() for i, col in enumerate(MEASURE_COLUMNS)},
+        **{rate: funnel[rate].ravel() for rate in FUNNEL_RATES},
+    })
+
+
+FUNNEL_HOVER = "%{fullData.name}<br>%{x|%Y-%m-%d}<br>%{meta}：%{y:.2%}<br>%{customdata[0]:,.0f} / %{customdata[1]:,.0f}<extra></extra>"
+
+
+def build_funnel_figure(funnel, title_text, height=700):
+    # 上下两张折线图：CTR、CVR；同一名称共用图例，点击图例同时隐藏两条线
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
+    fig = make_subplots(rows=len(FUNNEL_RATES), cols=1, shared_xaxes=True, vertical_spacing=0.08,
+                        subplot_titles=[FUNNEL_RATE_TITLES[rate] for rate in FUNNEL_RATES])
+    for row, (rate, (num, den)) in enumerate(FUNNEL_RATES.items(), start=1):
+        for i, (name, color) in enumerate(zip(funnel["names"], funnel["colors"])):
+            fig.add_trace(go.Scatter(
+                x=funnel["periods"], y=funnel[rate][:, i], name=name, legendgroup=name, showlegend=row == 1,
+                mode="lines+markers", line=dict(color=color), meta=rate,
+                customdata=funnel["totals"][:, i, [num, den]], hovertemplate=FUNNEL_HOVER,
+            ), row=row, col=1)
+        fig.update_yaxes(tickformat=".1%", rangemode="tozero", row=row, col=1)
+    _update_layout(fig, title_text, height)
+    fig.update_layout(hovermode="closest", margin=dict(l=60, t=80))
+    return fig
@@ -0,0 +1,173 @@
+# sankey_export.py
+# 明细分页与导出：按页切片，不把整个筛选结果复制或发送到页面；导出按块写出 CSV / Parquet / xlsx
+import codecs
+import logging
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from sankey_core import (
+    EDGE_COLUMNS, EDGE_MEASURE_INDEX, FACT_COLUMNS, FACT_MEASURES, expand_fact_edges, empty_fact_table
+)
+from sankey_query import is_query_cube, count_window_rows, iter_window_facts, window_facts_slice
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_ROWS = 100_000
+EXPORT_TABLES = {"facts": "筛选后的明细", "links": "聚合链路", "nodes": "节点统计"}
+EXPORT_FORMATS = {
+    "csv": ("CSV", "text/csv"),
+    "parquet": ("Parquet", "application/vnd.apache.parquet"),
+    "xlsx": ("Excel", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+# 每个工作表最多 1048576 行（含表头），超出时续写到下一个工作表
+XLSX_MAX_ROWS = 1_048_575
+FACT_HEADERS = dict(zip(FACT_COLUMNS, ["日期", "流量类型", "曝光", "点击", "销量"]))
+EDGE_HEADERS = {"source": "源节点", "target": "目标节点", "value": "数值", "date": "日期", "group": "分组",
+                "traffic_type": "流量类型"}
+# 每条明细展开的链路数（链路明细第 i 行 = 明细第 i // EDGES_PER_FACT 行的第 i % EDGES_PER_FACT 条链路）
+EDGES_PER_FACT = len(EDGE_MEASURE_INDEX)
+
+
+# ===================== 1. 明细分页 =====================
+def _fact_positions(facts, start_date, end_date):
+    # 区间内明细的行号（每行8字节），不复制明细本身
+    dates = facts["date"].to_numpy()
+    return np.flatnonzero((dates >= np.datetime64(pd.Timestamp(start_date))) & (dates <= np.datetime64(pd.Timestamp(end_date))))
+
+
+def fact_row_count(facts, cube, start_date, end_date):
+    if is_query_cube(cube):
+        return count_window_rows(cube, start_date, end_date)
+    return len(_fact_positions(facts, start_date, end_date))
+
+
+def fact_page(facts, cube, start_date, end_date, lo, hi):
+    # 区间内第 [lo, hi) 行明细
+    if is_query_cube(cube):
+        return window_facts_slice(cube, start_date, end_date, lo, hi)
+    return facts.iloc[_fact_positions(facts, start_date, end_date)[lo:hi]].reset_index(drop=True)
+
+
+def edge_page(facts, cube, start_date, end_date, lo, hi):
+    # 链路明细不物化：只展开覆盖 [lo, hi) 的那几行明细
+    first = lo // EDGES_PER_FACT
+    edges = expand_fact_edges(fact_page(facts, cube, start_date, end_date, first, -(-hi // EDGES_PER_FACT)))
+    return edges.iloc[lo - first * EDGES_PER_FACT:hi - first * EDGES_PER_FACT].reset_index(drop=True)
+
+
+def page_frame(facts, cube, start_date, end_date, page, page_rows, edges=False):
+    # 返回 (当前页数据, 总行数)；page 从1开始
+    total = fact_row_count(facts, cube, start_date, end_date) * (EDGES_PER_FACT if edges else 1)
+    lo = min((page - 1) * page_rows, total)
+    hi = min(lo + page_rows, total)
+    if edges:
+        return edge_page(facts, cube, start_date, end_date, lo, hi)[EDGE_COLUMNS].rename(columns=EDGE_HEADERS), total
+    return fact_page(facts, cube, start_date, end_date, lo, hi)[FACT_COLUMNS].rename(columns=FACT_HEADERS), total
+
+
+# ===================== 2. 导出表 =====================
+def _export_facts(chunk):
+    # 度量统一为float64：各块的列类型一致（Parquet按首块的schema写出）
+    return chunk[FACT_COLUMNS].astype({col: "float64" for col in FACT_MEASURES}).rename(columns=FACT_HEADERS)
+
+
+def iter_fact_chunks(facts, cube, start_date, end_date, chunk_rows=EXPORT_CHUNK_ROWS):
+    # 区间内明细按块输出；至少输出一块（可能为空），保证导出文件带表头
+    empty = True
+    if is_query_cube(cube):
+        for chunk in iter_window_facts(cube, start_date, end_date, chunk_rows):
+            empty = False
+            yield _export_facts(chunk)
+    else:
+        positions = _fact_positions(facts, start_date, end_date)
+        for lo in range(0, len(positions), chunk_rows):
+            empty = False
+            yield _export_facts(facts.iloc[positions[lo:lo + chunk_rows]])
+    if empty:
+        yield _export_facts(empty_fact_table())
+
+
+def links_frame(sankey):
+    # 聚合后的链路（与图中链路一一对应），附占目标节点流入的比例
+    aggregated_df = sankey["aggregated_df"]
+    customdata = np.asarray(sankey["links"]["customdata"], dtype="float64").reshape(-1, 2)
+    return pd.DataFrame({
+        "源节点": aggregated_df["source"].to_numpy(),
+        "目标节点": aggregated_df["target"].to_numpy(),
+        "流量类型": aggregated_df["traffic_type"].to_numpy(),
+        "分组": aggregated_df["group"].to_numpy(),
+        "数值": aggregated_df["value"].to_numpy(dtype="float64"),
+        "占目标节点流入(%)": customdata[:, 1],
+    })
+
+
+def nodes_frame(sankey):
+    incoming, outgoing, ratios = zip(*sankey["node_customdata"]) if sankey["node_customdata"] else ((), (), ())
+    return pd.DataFrame({
+        "节点": list(sankey["all_nodes"]),
+        "流入": np.asarray(incoming, dtype="float64"),
+        "流出": np.asarray(outgoing, dtype="float64"),
+        "占比": list(ratios),
+    })
+
+
+# ===================== 3. 分块写出 =====================
+def write_csv(chunks, handle):
+    # 带BOM的UTF-8，Excel直接打开不乱码
+    handle.write(codecs.BOM_UTF8)
+    for i, chunk in enumerate(chunks):
+        chunk.to_csv(handle, index=False, header=i == 0, encoding="utf-8", date_format="%Y-%m-%d")
+
+
+def write_parquet(chunks, handle):
+    # 每块写为一个行组
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(handle, table.schema)
+            writer.write_table(table.cast(writer.schema))
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def write_xlsx(chunks, handle, sheet_name="数据"):
+    # openpyxl只写模式：行直接写入临时文件，不在内存中保留单元格对象
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    worksheet, rows, part = None, XLSX_MAX_ROWS, 0
+    for chunk in chunks:
+        for row in chunk.itertuples(index=False, name=None):
+            if rows >= XLSX_MAX_ROWS:
+                part += 1
+                worksheet = workbook.create_sheet(sheet_name if part == 1 else f"{sheet_name}{part}")
+                worksheet.append(list(chunk.columns))
+                rows = 0
+            worksheet.append(row)
+            rows += 1
+        if worksheet is None:
+            worksheet = workbook.create_sheet(sheet_name)
+            worksheet.append(list(chunk.columns))
+            part, rows = 1, 0
+    workbook.save(handle)
+
+
+EXPORT_WRITERS = {"csv": write_csv, "parquet": write_parquet, "xlsx": write_xlsx}
+
+
+def export_bytes(chunks, file_format):
+    # 分块写入磁盘临时文件后一次读出：导出过程中内存里只有当前块和最终文件内容
+    with tempfile.TemporaryFile() as handle:
+        EXPORT_WRITERS[file_format](chunks, handle)
+        size = handle.tell()
+        handle.seek(0)
+        logger.info(f"导出 {file_format} 文件：{size / 1024 / 1024:.1f} MB")
+        return handle.read()
@@ -0,0 +1,537 @@
+# sankey_io.py
+# 工作簿/CSV读取：只读取所需五列并指定类型，支持整表读取与分块流式读取（内存占用与文件大小无关）
+import hashlib
+import io
+import logging
+import os
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from sankey_cache import cache_key, load_cached, store_cached
+from sankey_perf import stage
+from sankey_core import (
+    prepare_dates, filter_valid_rows, build_fact_table, empty_fact_table,
+    MEASURE_COLUMNS, FACT_MEASURES, VALID_TRAFFIC_TYPES
+)
+
+logger = logging.getLogger(__name__)
+
+# 应用实际用到的列
+SOURCE_COLUMNS = ["时间", "流量类型"] + MEASURE_COLUMNS
+DAILY_KEYS = ["date", "流量类型"]
+CHUNK_ROWS = 50_000
+# 文件超过该大小时自动使用流式读取
+STREAMING_THRESHOLD_BYTES = int(float(os.environ.get("SANKEY_STREAMING_MB", "20")) * 1024 * 1024)
+CSV_ENCODINGS = ["utf-8-sig", "gbk"]
+# xlsx解析引擎：auto 时优先使用已安装的 calamine（Rust实现），否则使用 openpyxl；xml 需显式指定
+# - openpyxl：只读模式，逐单元格构造对象，兼容性最好
+# - xml：标准库直接解析工作表XML，不解析样式，日期单元格按Excel序列号返回（由 prepare_dates 换算）
+# - calamine：需安装 python-calamine
+EXCEL_ENGINE = os.environ.get("SANKEY_EXCEL_ENGINE", "auto")
+EXCEL_ENGINES = ["openpyxl", "xml", "calamine"]
+XLSX_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+XLSX_REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+# 只读取应用用到的列并指定类型，不做类型推断
+SOURCE_DTYPES = {"时间": "object", "流量类型": "object", **{col: "float64" for col in MEASURE_COLUMNS}}
+# 多文件/多工作表并行解析的进程数
+MAX_WORKERS = int(os.environ.get("SANKEY_WORKERS", "0")) or os.cpu_count() or 1
+
+
+# ===================== 1. 格式识别 =====================
+def detect_format(file_bytes):
+    # 按文件头识别：xlsx为zip包，xls为OLE复合文档，其余按CSV处理
+    if file_bytes[:4] == b"PK\x03\x04":
+        return "xlsx"
+    if file_bytes[:8] == b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1":
+        return "xls"
+    return "csv"
+
+
+def _csv_encoding(file_bytes):
+    for encoding in CSV_ENCODINGS:
+        try:
+            file_bytes[:1024 * 1024].decode(encoding)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return CSV_ENCODINGS[0]
+
+
+# ===================== 2. xlsx解析引擎 =====================
+def available_engines():
+    engines = ["openpyxl", "xml"]
+    try:
+        import python_calamine  # noqa: F401
+    except ImportError:
+        return engines
+    return engines + ["calamine"]
+
+
+def resolve_engine(engine=None):
+    engine = engine or EXCEL_ENGINE
+    available = available_engines()
+    if engine == "auto":
+        return "calamine" if "calamine" in available else "openpyxl"
+    if engine not in EXCEL_ENGINES:
+        raise ValueError(f"未知的Excel解析引擎：{engine}（可选：auto、{'、'.join(EXCEL_ENGINES)}）")
+    if engine not in available:
+        logger.warning(f"Excel解析引擎 {engine} 未安装，改用 openpyxl")
+        return "openpyxl"
+    return engine
+
+
+def _openpyxl_rows(file_bytes, sheet=None):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(io.BytesIO(file_bytes), read_only=True, data_only=True)
+    try:
+        worksheet = workbook.worksheets[0] if sheet is None else workbook[sheet]
+        # 部分导出工具写入的维度信息不可靠（如A1:A1），只读模式下需重置后再遍历
+        worksheet.reset_dimensions()
+        yield from worksheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _xlsx_sheet_paths(archive):
+    # 工作表名 → 工作表XML在压缩包内的路径，保持工作簿中的顺序
+    workbook = ET.fromstring(archive.read("xl/workbook.xml"))
+    rels = ET.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+    targets = {rel.get("Id"): rel.get("Target") for rel in rels}
+    paths = {}
+    for sheet in workbook.iter(f"{XLSX_NS}sheet"):
+        target = targets[sheet.get(f"{XLSX_REL_NS}id")]
+        paths[sheet.get("name")] = target.lstrip("/") if target.startswith("/") else f"xl/{target}"
+    return paths
+
+
+def _is_date1904(archive):
+    workbook_pr = ET.fromstring(archive.read("xl/workbook.xml")).find(f"{XLSX_NS}workbookPr")
+    return workbook_pr is not None and workbook_pr.get("date1904") in ("1", "true")
+
+
+def _rich_text(element):
+    # <si>/<is> 的文本：直接的 <t>，或富文本各段 <r><t>；注音 <rPh><t> 不属于单元格内容（与 openpyxl 一致）
+    text_tag, run_tag = f"{XLSX_NS}t", f"{XLSX_NS}r"
+    parts = []
+    for child in element:
+        if child.tag == text_tag:
+            parts.append(child.text or "")
+        elif child.tag == run_tag:
+            parts.append(child.findtext(text_tag) or "")
+    return "".join(parts)
+
+
+def _shared_strings(archive):
+    if "xl/sharedStrings.xml" not in archive.namelist():
+        return []
+    strings = []
+    for _, element in ET.iterparse(archive.open("xl/sharedStrings.xml")):
+        if element.tag == f"{XLSX_NS}si":
+            strings.append(_rich_text(element))
+            element.clear()
+    return strings
+
+
+def _column_index(ref):
+    # "C12" → 2
+    index = 0
+    for char in ref:
+        if char.isdigit():
+            break
+        index = index * 26 + ord(char) - 64
+    return index - 1
+
+
+def _xml_rows(file_bytes, sheet=None):
+    # 逐行解析工作表XML，解析完即释放；单元格按类型返回文本/浮点数/布尔值
+    with zipfile.ZipFile(io.BytesIO(file_bytes)) as archive:
+        if _is_date1904(archive):
+            # 1904日期系统的序列号起点不同，交给 openpyxl 按样式换算
+            logger.info("工作簿使用1904日期系统，改用 openpyxl 解析")
+            yield from _openpyxl_rows(file_bytes, sheet)
+            return
+        paths = _xlsx_sheet_paths(archive)
+        path = next(iter(paths.values())) if sheet is None else paths[sheet]
+        strings = _shared_strings(archive)
+        row_tag, value_tag, inline_tag = f"{XLSX_NS}row", f"{XLSX_NS}v", f"{XLSX_NS}is"
+        sheet_data = None
+        for event, element in ET.iterparse(archive.open(path), events=("start", "end")):
+            if event == "start":
+                if element.tag == f"{XLSX_NS}sheetData":
+                    sheet_data = element
+                continue
+            if element.tag != row_tag:
+                continue
+            values = {}
+            for pos, cell in enumerate(element):
+                ref = cell.get("r")
+                kind = cell.get("t")
+                if kind == "inlineStr":
+                    inline = cell.find(inline_tag)
+                    value = _rich_text(inline) if inline is not None else ""
+                else:
+                    value = cell.findtext(value_tag)
+                    if value is None:
+                        continue
+                    if kind == "s":
+                        value = strings[int(value)]
+                    elif kind is None or kind == "n":
+                        value = float(value)
+                    elif kind == "b":
+                        value = value == "1"
+                    # str（公式的文本结果）、e（错误值）保持文本
+                values[_column_index(ref) if ref else pos] = value
+            # 已处理的行从树中移除，内存占用与行数无关
+            sheet_data.clear()
+            yield tuple(values.get(i) for i in range(max(values) + 1)) if values else ()
+
+
+def _calamine_rows(file_bytes, sheet=None):
+    # calamine 一次把整张工作表读入内存，流式读取不使用（见 iter_xlsx_chunks）
+    from python_calamine import CalamineWorkbook
+
+    workbook = CalamineWorkbook.from_filelike(io.BytesIO(file_bytes))
+    worksheet = workbook.get_sheet_by_index(0) if sheet is None else workbook.get_sheet_by_name(sheet)
+    yield from worksheet.to_python(skip_empty_area=False)
+
+
+XLSX_ROW_READERS = {"openpyxl": _openpyxl_rows, "xml": _xml_rows, "calamine": _calamine_rows}
+
+
+def iter_xlsx_rows(file_bytes, sheet=None, engine=None):
+    return XLSX_ROW_READERS[resolve_engine(engine)](file_bytes, sheet)
+
+
+# ===================== 3. 整表读取 =====================
+def _header_positions(header):
+    # 表头 → 所需列的位置；表头两侧空白忽略
+    header = [str(name).strip() if name is not None else "" for name in header]
+    missing = [col for col in SOURCE_COLUMNS if col not in header]
+    if missing:
+        raise KeyError(f"缺少列：{missing}")
+    return [header.index(col) for col in SOURCE_COLUMNS]
+
+
+def _project_row(row, positions, width):
+    if len(row) < width:
+        row = tuple(row) + (None,) * (width - len(row))
+    return [row[pos] for pos in positions]
+
+
+def _apply_source_dtypes(df):
+    # 按 SOURCE_DTYPES 逐列定型：度量列非数值单元格（如 "-"）转为NaN，其余列保持原值；已是目标类型的列不复制
+    for col, dtype in SOURCE_DTYPES.items():
+        values = pd.to_numeric(df[col], errors="coerce") if dtype == "float64" else df[col]
+        df[col] = values.astype(dtype, copy=False)
+    return df
+
+
+def typed_frame(records):
+    df = pd.DataFrame.from_records(records, columns=SOURCE_COLUMNS) if records else pd.DataFrame(columns=SOURCE_COLUMNS)
+    return _apply_source_dtypes(df)
+
+
+def read_xlsx_columns(file_bytes, sheet=None, engine=None):
+    # 只取 SOURCE_COLUMNS 五列，返回按 SOURCE_DTYPES 定型的数据框
+    rows = iter_xlsx_rows(file_bytes, sheet, engine)
+    header = next(rows, None)
+    if header is None:
+        return typed_frame([])
+    positions = _header_positions(header)
+    width = max(positions) + 1
+    return typed_frame([_project_row(row, positions, width) for row in rows])
+
+
+def read_table(file_bytes, sheet=None, engine=None):
+    # sheet=None 时读取第一个工作表；只保留 SOURCE_COLUMNS，缺列时抛出KeyError
+    file_format = detect_format(file_bytes)
+    if file_format == "xlsx":
+        return read_xlsx_columns(file_bytes, sheet, engine)
+    if file_format == "csv":
+        encoding = _csv_encoding(file_bytes)
+        names = _csv_header(file_bytes, encoding)
+        df = pd.read_csv(
+            io.BytesIO(file_bytes), encoding=encoding, usecols=list(names), dtype=_csv_text_dtypes(names)
+        ).rename(columns=names)
+    else:
+        df = pd.read_excel(
+            io.BytesIO(file_bytes), sheet_name=0 if sheet is None else sheet,
+            usecols=lambda col: str(col).strip() in SOURCE_COLUMNS, dtype={"流量类型": "object"}
+        )
+        df.columns = [str(col).strip() for col in df.columns]
+    missing = [col for col in SOURCE_COLUMNS if col not in df.columns]
+    if missing:
+        raise KeyError(f"缺少列：{missing}")
+    # pandas已按列解析：直接在列上定型，不再逐行转回Python对象
+    return _apply_source_dtypes(df[SOURCE_COLUMNS].copy())
+
+
+def _csv_header(file_bytes, encoding):
+    # 所需列的表头原名 → 列名；与xlsx/xls一致，表头两侧空白忽略
+    header = pd.read_csv(io.BytesIO(file_bytes), encoding=encoding, nrows=0).columns
+    return {col: str(col).strip() for col in header if str(col).strip() in SOURCE_COLUMNS}
+
+
+def _csv_text_dtypes(names):
+    return {col: "object" for col, name in names.items() if name in ("时间", "流量类型")}
+
+
+def list_sheets(file_bytes):
+    # 工作簿的全部工作表名；CSV只有一个“工作表”，记为None
+    file_format = detect_format(file_bytes)
+    if file_format == "xlsx":
+        with zipfile.ZipFile(io.BytesIO(file_bytes)) as archive:
+            return list(_xlsx_sheet_paths(archive))
+    if file_format == "xls":
+        return pd.ExcelFile(io.BytesIO(file_bytes)).sheet_names
+    return [None]
+
+
+# ===================== 4. 分块读取 =====================
+def iter_xlsx_chunks(file_bytes, chunk_rows=CHUNK_ROWS, sheet=None, engine=None):
+    # 逐行读取指定工作表（默认第一个），只保留需要的列，每 chunk_rows 行输出一块
+    engine = resolve_engine(engine)
+    if engine == "calamine":
+        # calamine 会载入整张工作表，改用逐行解析的 openpyxl，保证内存占用与文件大小无关
+        engine = "openpyxl"
+    rows = iter_xlsx_rows(file_bytes, sheet, engine)
+    header = next(rows, None)
+    if header is None:
+        return
+    positions = _header_positions(header)
+    width = max(positions) + 1
+
+    chunk = []
+    for row in rows:
+        chunk.append(_project_row(row, positions, width))
+        if len(chunk) >= chunk_rows:
+            yield typed_frame(chunk)
+            chunk = []
+    if chunk:
+        yield typed_frame(chunk)
+
+
+def iter_csv_chunks(file_bytes, chunk_rows=CHUNK_ROWS):
+    encoding = _csv_encoding(file_bytes)
+    names = _csv_header(file_bytes, encoding)
+    missing = [col for col in SOURCE_COLUMNS if col not in names.values()]
+    if missing:
+        raise KeyError(f"缺少列：{missing}")
+    reader = pd.read_csv(
+        io.BytesIO(file_bytes), usecols=list(names), chunksize=chunk_rows,
+        encoding=encoding, dtype=_csv_text_dtypes(names)
+    )
+    with reader:
+        for chunk in reader:
+            yield chunk.rename(columns=names)
+
+
+def iter_chunks(file_bytes, chunk_rows=CHUNK_ROWS, sheet=None, engine=None):
+    file_format = detect_format(file_bytes)
+    if file_format == "xlsx":
+        return iter_xlsx_chunks(file_bytes, chunk_rows, sheet, engine)
+    if file_format == "csv":
+        return iter_csv_chunks(file_bytes, chunk_rows)
+    # xls无只读流式接口，退化为整表读取
+    return iter([read_table(file_bytes, sheet)])
+
+
+# ===================== 5. 按日累加 =====================
+def fold_daily(chunks):
+    # 每块过滤后按 (日期, 流量类型) 汇总，并入累计结果；累计结果大小只与 天数×流量类型 有关
+    running = None
+    n_rows = 0
+    for chunk in chunks:
+        n_rows += len(chunk)
+        valid = filter_valid_rows(prepare_dates(chunk))
+        if valid.empty:
+            continue
+        part = valid[DAILY_KEYS].copy()
+        for col in MEASURE_COLUMNS:
+            part[col] = pd.to_numeric(valid[col], errors="coerce").fillna(0.0).astype("float64")
+        part = part.groupby(DAILY_KEYS, as_index=False, sort=False)[MEASURE_COLUMNS].sum()
+        running = part if running is None else (
+            pd.concat([running, part], ignore_index=True)
+            .groupby(DAILY_KEYS, as_index=False, sort=False)[MEASURE_COLUMNS].sum()
+        )
+    logger.info(f"流式读取完成，数据行数：{n_rows}")
+    if running is None:
+        return pd.DataFrame(columns=DAILY_KEYS + MEASURE_COLUMNS)
+    return running.sort_values(DAILY_KEYS, ignore_index=True)
+
+
+def should_stream(file_bytes, streaming=None):
+    if streaming is None:
+        return len(file_bytes) >= STREAMING_THRESHOLD_BYTES
+    return streaming
+
+
+def read_daily_facts(file_bytes, streaming=None, sheet=None, engine=None):
+    # 读取并汇总为 (date, 流量类型, 曝光, 点击, 销量) 日粒度事实表
+    if should_stream(file_bytes, streaming):
+        return fold_daily(iter_chunks(file_bytes, sheet=sheet, engine=engine))
+    return fold_daily([read_table(file_bytes, sheet, engine)])
+
+
+def read_fact_table(file_bytes, streaming=None, sheet=None, engine=None):
+    # 解析单个工作表为紧凑事实表（不经过缓存）；流式模式下每个 (日期, 流量类型) 只保留一行汇总
+    if should_stream(file_bytes, streaming):
+        with stage("stream_parse") as record:
+            df = fold_daily(iter_chunks(file_bytes, sheet=sheet, engine=engine))
+            record["rows_out"] = len(df)
+    else:
+        with stage("excel_parse") as record:
+            df = read_table(file_bytes, sheet, engine)
+            record["rows_out"] = len(df)
+        logger.info(f"成功读取文件，数据行数：{len(df)}")
+        with stage("date_parse", rows_in=len(df)):
+            prepare_dates(df)
+    with stage("fact_build", rows_in=len(df)) as record:
+        facts = build_fact_table(df)
+        record["rows_out"] = len(facts)
+    return facts
+
+
+# ===================== 6. 加载入口 =====================
+def load_fact_table(file_bytes, streaming=None):
+    # 读取为紧凑事实表；命中本地缓存时跳过解析。返回 (事实表, 是否命中缓存)
+    # streaming=None 时按文件大小自动选择；流式模式下每个 (日期, 流量类型) 只保留一行汇总
+    streaming = should_stream(file_bytes, streaming)
+    key = cache_key(file_bytes, "stream" if streaming else "")
+    with stage("cache_load") as record:
+        facts = load_cached(key)
+        record["rows_out"] = None if facts is None else len(facts)
+    if facts is not None:
+        return facts, True
+
+    facts = read_fact_table(file_bytes, streaming)
+    logger.info(f"有效记录数：{len(facts)}")
+    store_cached(key, facts)
+    return facts, False
+
+
+# ===================== 7. 多文件/多工作表并行读取 =====================
+# 每个 (文件, 工作表) 为一个任务，在进程池中解析（openpyxl解析受GIL限制，线程无法并行）
+_WORKER_SOURCES = {}
+
+
+def _init_reader(sources):
+    # fork启动时文件字节直接继承，不必随每个任务重复序列化
+    _WORKER_SOURCES["files"] = sources
+
+
+def _read_task(file_idx, sheet, streaming, engine=None):
+    begin = time.perf_counter()
+    _, file_bytes = _WORKER_SOURCES["files"][file_idx]
+    facts = read_fact_table(file_bytes, streaming, sheet, engine)
+    return facts, time.perf_counter() - begin
+
+
+def prepare_sources(sources, streaming=None):
+    # 内容完全相同的文件只保留第一次出现，并按上传顺序组合建键（顺序影响重叠日期的取舍）
+    # 每个文件只哈希一次；返回 (去重后的来源, 缓存键)
+    digests, unique = {}, []
+    for name, file_bytes in sources:
+        digest = hashlib.sha256(file_bytes).digest()
+        if digest in digests:
+            logger.info(f"跳过重复文件：{name}")
+            continue
+        digests[digest] = name
+        unique.append((name, file_bytes))
+    key = cache_key(b"".join(digests), f"multi{'' if streaming is None else '-stream' if streaming else '-full'}")
+    return unique, key
+
+
+def merge_facts(parts):
+    # 按来源顺序合并；同一 (日期, 流量类型) 出现在多个来源时只保留最后一个来源的记录，重复导出不重复计数
+    parts = [part for part in parts if not part.empty]
+    if not parts:
+        return empty_fact_table()
+    if len(parts) == 1:
+        return parts[0]
+    merged = pd.concat(parts, ignore_index=True)
+    source = np.repeat(np.arange(len(parts)), [len(part) for part in parts])
+    day_key = merged["date"].to_numpy().astype("datetime64[D]").astype(np.int64)
+    key = day_key * len(VALID_TRAFFIC_TYPES) + merged["traffic_type"].cat.codes.to_numpy()
+    keep = source == pd.Series(source).groupby(key).transform("max").to_numpy()
+    if not keep.all():
+        logger.info(f"多个来源存在重叠的 (日期, 流量类型)，以后上传的来源为准，丢弃记录数：{int((~keep).sum())}")
+    return merged[keep].reset_index(drop=True)
+
+
+def facts_to_daily(facts):
+    # 紧凑事实表 → (date, 流量类型, 曝光, 点击, 销量) 日汇总，供增量事实库使用
+    if facts.empty:
+        return pd.DataFrame(columns=DAILY_KEYS + MEASURE_COLUMNS)
+    measures = facts[FACT_MEASURES].astype("float64")
+    measures[["date", "traffic_type"]] = facts[["date", "traffic_type"]]
+    daily = measures.groupby(["date", "traffic_type"], observed=True, as_index=False)[FACT_MEASURES].sum()
+    daily = daily.rename(columns={"traffic_type": "流量类型", **dict(zip(FACT_MEASURES, MEASURE_COLUMNS))})
+    daily["流量类型"] = daily["流量类型"].astype(object)
+    return daily.sort_values(DAILY_KEYS, ignore_index=True)
+
+
+def load_sources(sources, streaming=None, workers=None, progress=None, engine=None, key=None):
+    # sources 为 [(文件名, 字节)]，读取全部文件的全部工作表并合并去重；engine 为xlsx解析引擎（不影响结果，不参与缓存键）
+    # progress(已完成, 总数, 任务报告) 在每个任务完成时回调；返回 (事实表, 任务报告列表, 是否命中缓存)
+    # key 为 prepare_sources 的缓存键时 sources 应已去重，不再重新哈希
+    if key is None:
+        sources, key = prepare_sources(sources, streaming)
+    with stage("cache_load") as record:
+        facts = load_cached(key)
+        record["rows_out"] = None if facts is None else len(facts)
+    if facts is not None:
+        return facts, [{"file": name, "sheet": None, "rows": None, "seconds": 0.0, "status": "缓存"}
+                       for name, _ in sources], True
+
+    tasks = [(file_idx, sheet) for file_idx, (_, file_bytes) in enumerate(sources) for sheet in list_sheets(file_bytes)]
+    reports = [{"file": sources[file_idx][0], "sheet": sheet, "rows": None, "seconds": None, "status": "等待"}
+               for file_idx, sheet in tasks]
+    parts = [None] * len(tasks)
+
+    def finish(task_idx, result=None, error=None):
+        report = reports[task_idx]
+        if error is None:
+            parts[task_idx], report["seconds"] = result
+            report["rows"], report["status"] = len(parts[task_idx]), "完成"
+        else:
+            # 缺少必需列的工作表（如说明页、汇总页）跳过
+            report["status"] = f"跳过：{error.args[0] if error.args else error}"
+            logger.warning(f"{report['file']} / {report['sheet']} 解析失败：{error}")
+        if progress is not None:
+            progress(sum(r["status"] != "等待" for r in reports), len(tasks), report)
+
+    workers = max(1, min(workers or MAX_WORKERS, len(tasks)))
+    with stage("parallel_parse", rows_in=len(tasks)) as record:
+        if workers == 1:
+            _init_reader(sources)
+            for task_idx, (file_idx, sheet) in enumerate(tasks):
+                try:
+                    finish(task_idx, _read_task(file_idx, sheet, streaming, engine))
+                except (KeyError, ValueError) as e:
+                    finish(task_idx, error=e)
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_reader, initargs=(sources,)) as pool:
+                futures = {
+                    pool.submit(_read_task, file_idx, sheet, streaming, engine): task_idx
+                    for task_idx, (file_idx, sheet) in enumerate(tasks)
+                }
+                for future in as_completed(futures):
+                    try:
+                        finish(futures[future], future.result())
+                    except (KeyError, ValueError) as e:
+                        finish(futures[future], error=e)
+        record["rows_out"] = sum(len(part) for part in parts if part is not None)
+
+    if tasks and all(part is None for part in parts):
+        raise ValueError(f"所有工作表均无法解析：{'; '.join(r['status'] for r in reports)}")
+    facts = merge_facts([part for part in parts if part is not None])
+    logger.info(f"共解析 {len(tasks)} 个工作表（进程数：{workers}），合并后有效记录数：{len(facts)}")
+    store_cached(key, facts)
+    return facts, reports, False
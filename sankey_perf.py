@@ -0,0 +1,180 @@
+# sankey_perf.py
+# 分阶段性能记录：每个阶段的耗时、输入/输出行数、内存变化，输出为结构化JSON日志
+# 用法：
+#   run = start_run("rerun")
+#   with stage("aggregate", rows_in=len(df)) as record:
+#       result = ...
+#       record["rows_out"] = len(result)
+#   finish_run(run)
+# 没有进行中的记录时 stage() 不做任何统计，可放心在核心函数中使用
+import contextvars
+import cProfile
+import io
+import json
+import logging
+import marshal
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+# 每行日志就是一条JSON：使用独立的处理器，不经过根日志的 “时间 - 级别 -” 格式
+_LOG_HANDLER = logging.StreamHandler()
+_LOG_HANDLER.setFormatter(logging.Formatter("%(message)s"))
+logger.addHandler(_LOG_HANDLER)
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+_CURRENT_RUN = contextvars.ContextVar("sankey_perf_run", default=None)
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+# tracemalloc 是进程级的：按需要跟踪的运行数引用计数，最后一个运行结束时才停止（且只停止由这里启动的跟踪）
+_TRACE_LOCK = threading.Lock()
+_TRACE_STATE = {"runs": 0, "owned": False}
+
+
+# ===================== 1. 内存 =====================
+def current_rss():
+    # 当前常驻内存（字节）；非Linux平台返回None
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+# ===================== 2. 运行与阶段 =====================
+def start_run(label="rerun", trace_memory=False):
+    # trace_memory=True 时用tracemalloc统计每个阶段的Python内存峰值（开销较大）
+    if trace_memory:
+        _acquire_tracing()
+    run = {
+        "run_id": uuid.uuid4().hex[:12],
+        "label": label,
+        "started": time.time(),
+        "begin": time.perf_counter(),
+        "trace_memory": trace_memory,
+        "stages": [],
+    }
+    _CURRENT_RUN.set(run)
+    return run
+
+
+def _acquire_tracing():
+    with _TRACE_LOCK:
+        if _TRACE_STATE["runs"] == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _TRACE_STATE["owned"] = True
+        _TRACE_STATE["runs"] += 1
+
+
+def _release_tracing():
+    with _TRACE_LOCK:
+        _TRACE_STATE["runs"] = max(_TRACE_STATE["runs"] - 1, 0)
+        if _TRACE_STATE["runs"] == 0 and _TRACE_STATE["owned"]:
+            tracemalloc.stop()
+            _TRACE_STATE["owned"] = False
+
+
+def current_run():
+    return _CURRENT_RUN.get()
+
+
+@contextmanager
+def stage(name, rows_in=None):
+    run = _CURRENT_RUN.get()
+    if run is None:
+        yield {}
+        return
+    record = {"stage": name, "rows_in": rows_in, "rows_out": None}
+    rss_before = current_rss()
+    tracing = run["trace_memory"] and tracemalloc.is_tracing()
+    if tracing:
+        # 峰值同样是进程级的：多个会话同时跟踪时，peak_mb 包含并发阶段的分配
+        traced_before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    begin = time.perf_counter()
+    try:
+        yield record
+    finally:
+        end = time.perf_counter()
+        record["seconds"] = round(end - begin, 6)
+        # 阶段结束时距本次运行开始的秒数（如首张图表渲染完成的时间）
+        record["finished_at"] = round(end - run["begin"], 6)
+        rss_after = current_rss()
+        record["rss_delta_mb"] = (
+            round((rss_after - rss_before) / 1024 / 1024, 3) if rss_before is not None and rss_after is not None else None
+        )
+        record["peak_mb"] = (
+            round((tracemalloc.get_traced_memory()[1] - traced_before) / 1024 / 1024, 3) if tracing else None
+        )
+        run["stages"].append(record)
+
+
+def finish_run(run):
+    # 每个阶段一行JSON日志，最后一行为整次运行的汇总
+    if run is None:
+        return None
+    _CURRENT_RUN.set(None)
+    run["seconds"] = round(time.perf_counter() - run["begin"], 6)
+    if run["trace_memory"]:
+        _release_tracing()
+    for record in run["stages"]:
+        logger.info(json.dumps({"event": "stage", "run_id": run["run_id"], "label": run["label"], **record},
+                               ensure_ascii=False))
+    logger.info(json.dumps({
+        "event": "run", "run_id": run["run_id"], "label": run["label"], "seconds": run["seconds"],
+        "stages": len(run["stages"]), "rss_mb": round((current_rss() or 0) / 1024 / 1024, 1),
+    }, ensure_ascii=False))
+    return run
+
+
+def stage_table(run):
+    # 性能面板用的行列表
+    return [
+        {
+            "阶段": record["stage"],
+            "耗时(ms)": round(record["seconds"] * 1000, 2),
+            "输入行数": record["rows_in"],
+            "输出行数": record["rows_out"],
+            "内存变化(MB)": record["rss_delta_mb"],
+            "峰值(MB)": record["peak_mb"],
+        }
+        for record in run["stages"]
+    ]
+
+
+# ===================== 3. 单次剖析 =====================
+def start_profile():
+    # 优先使用pyinstrument（可选依赖），否则使用cProfile
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return {"kind": "cprofile", "profiler": profiler}
+    profiler = Profiler()
+    profiler.start()
+    return {"kind": "pyinstrument", "profiler": profiler}
+
+
+def stop_profile(profile, top=40):
+    # 返回 {"text": 文本摘要, "data": 可下载的字节, "file_name": 下载文件名}
+    profiler = profile["profiler"]
+    if profile["kind"] == "pyinstrument":
+        profiler.stop()
+        return {
+            "text": profiler.output_text(unicode=True),
+            "data": profiler.output_html().encode("utf-8"),
+            "file_name": "sankey_profile.html",
+        }
+    profiler.disable()
+    stats = pstats.Stats(profiler)
+    buffer = io.StringIO()
+    stats.stream = buffer
+    stats.sort_stats("cumulative").print_stats(top)
+    # 与 pstats.Stats.dump_stats 相同的格式，可用 snakeviz 或 python -m pstats 打开
+    return {"text": buffer.getvalue(), "data": marshal.dumps(stats.stats), "file_name": "sankey_profile.prof"}
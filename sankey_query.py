@@ -0,0 +1,268 @@
+# sankey_query.py
+# 增量事实库的查询后端（out-of-core）：日期区间与流量类型条件下推到存储层，只有聚合结果进入Python
+# - arrow：pyarrow.dataset 按日期只打开对应的日分区文件，扫描时过滤流量类型，逐批聚合（内存与历史长度无关）
+# - duckdb：可选依赖，把同一组分区注册为DuckDB表，用SQL过滤聚合（过滤/投影由DuckDB下推到Arrow扫描）
+# 返回的“查询立方体”与 build_daily_cube 的结果可互换使用：compute_sankey、compute_rollups 等函数无需区分
+import hashlib
+import json
+import logging
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from sankey_core import VALID_TRAFFIC_TYPES, MEASURE_COLUMNS, FACT_MEASURES, build_fact_table, empty_fact_table
+from sankey_config import TOPOLOGY
+from sankey_store import read_manifest, partition_paths
+
+logger = logging.getLogger(__name__)
+
+QUERY_BACKENDS = {
+    "memory": "内存（全部载入）",
+    "arrow": "Arrow数据集（按需读取）",
+    "duckdb": "DuckDB（按需读取）",
+}
+DETAIL_CHUNK_ROWS = 100_000
+
+
+def available_backends():
+    # memory 和 arrow 总是可用（pyarrow为必需依赖），duckdb 需另行安装
+    backends = ["memory", "arrow"]
+    try:
+        import duckdb  # noqa: F401
+    except ImportError:
+        return backends
+    return backends + ["duckdb"]
+
+
+# ===================== 1. 分区扫描 =====================
+def _window_dataset(start_date, end_date, store_dir=None):
+    # 分区裁剪：只打开日期区间内的日分区文件；pyarrow.dataset 在首次查询时才导入（内存模式不加载）
+    import pyarrow.dataset as ds
+
+    days = [f"{day:%Y-%m-%d}" for day in pd.date_range(start_date, end_date, freq="D")]
+    paths = partition_paths(days, store_dir)
+    return ds.dataset(paths, format="ipc") if paths else None
+
+
+def _window_filter(start_date, end_date):
+    # 行级谓词：日期区间 + 当前拓扑中的有效流量类型
+    import pyarrow.dataset as ds
+
+    return (
+        (ds.field("date") >= pa.scalar(pd.Timestamp(start_date), pa.timestamp("ns")))
+        & (ds.field("date") <= pa.scalar(pd.Timestamp(end_date), pa.timestamp("ns")))
+        & ds.field("流量类型").isin(VALID_TRAFFIC_TYPES)
+    )
+
+
+def _arrow_type_totals(dataset, start_date, end_date):
+    # Acero流式执行 扫描 → 过滤 → 分组求和，数据按批流过，不物化整个区间
+    import pyarrow.acero as acero
+
+    window_filter = _window_filter(start_date, end_date)
+    plan = acero.Declaration.from_sequence([
+        acero.Declaration("scan", acero.ScanNodeOptions(dataset, columns=["流量类型"] + MEASURE_COLUMNS, filter=window_filter)),
+        acero.Declaration("filter", acero.FilterNodeOptions(window_filter)),
+        acero.Declaration("aggregate", acero.AggregateNodeOptions(
+            [(col, "hash_sum", None, col) for col in MEASURE_COLUMNS] + [("流量类型", "hash_count", None, "count")],
+            keys=["流量类型"]
+        )),
+    ])
+    grouped = plan.to_table()
+    totals = np.zeros((len(VALID_TRAFFIC_TYPES), len(FACT_MEASURES)))
+    counts = np.zeros(len(VALID_TRAFFIC_TYPES), dtype=np.int64)
+    codes = np.array([TOPOLOGY["type_index"][t] for t in grouped.column("流量类型").to_pylist()], dtype=np.int64)
+    if len(codes):
+        totals[codes] = np.column_stack([grouped.column(col).to_numpy(zero_copy_only=False) for col in MEASURE_COLUMNS])
+        counts[codes] = grouped.column("count").to_numpy(zero_copy_only=False)
+    return totals, counts
+
+
+def _duckdb_type_totals(dataset, start_date, end_date):
+    import duckdb
+
+    type_index = TOPOLOGY["type_index"]
+    totals = np.zeros((len(VALID_TRAFFIC_TYPES), len(FACT_MEASURES)))
+    counts = np.zeros(len(VALID_TRAFFIC_TYPES), dtype=np.int64)
+    measures = ", ".join(f'sum("{col}")' for col in MEASURE_COLUMNS)
+    placeholders = ", ".join("?" for _ in VALID_TRAFFIC_TYPES)
+    # 每次查询使用独立连接，多线程（页面会话/HTTP接口）并发安全
+    with duckdb.connect() as con:
+        con.register("facts", dataset)
+        rows = con.execute(
+            f'SELECT "流量类型", {measures}, count(*) FROM facts '
+            f'WHERE date BETWEEN ? AND ? AND "流量类型" IN ({placeholders}) GROUP BY "流量类型"',
+            [pd.Timestamp(start_date).to_pydatetime(), pd.Timestamp(end_date).to_pydatetime(), *VALID_TRAFFIC_TYPES]
+        ).fetchall()
+    for traffic_type, *values, count in rows:
+        totals[type_index[traffic_type]] = values
+        counts[type_index[traffic_type]] = count
+    return totals, counts
+
+
+def query_window(start_date, end_date, store_dir=None, backend="arrow"):
+    # 返回 (每个流量类型的 (曝光, 点击, 销量) 合计, 每个流量类型的记录数)
+    dataset = _window_dataset(start_date, end_date, store_dir)
+    if dataset is None:
+        return np.zeros((len(VALID_TRAFFIC_TYPES), len(FACT_MEASURES))), np.zeros(len(VALID_TRAFFIC_TYPES), dtype=np.int64)
+    if backend == "duckdb":
+        return _duckdb_type_totals(dataset, start_date, end_date)
+    return _arrow_type_totals(dataset, start_date, end_date)
+
+
+def query_type_totals(start_date, end_date, store_dir=None, backend="arrow"):
+    return query_window(start_date, end_date, store_dir, backend)[0]
+
+
+def _arrow_daily_totals(dataset, start_date, end_date):
+    import pyarrow.acero as acero
+
+    window_filter = _window_filter(start_date, end_date)
+    plan = acero.Declaration.from_sequence([
+        acero.Declaration("scan", acero.ScanNodeOptions(dataset, columns=["date", "流量类型"] + MEASURE_COLUMNS, filter=window_filter)),
+        acero.Declaration("filter", acero.FilterNodeOptions(window_filter)),
+        acero.Declaration("aggregate", acero.AggregateNodeOptions(
+            [(col, "hash_sum", None, col) for col in MEASURE_COLUMNS], keys=["date", "流量类型"]
+        )),
+    ])
+    grouped = plan.to_table()
+    return (
+        pd.DatetimeIndex(grouped.column("date").to_pandas()),
+        grouped.column("流量类型").to_pylist(),
+        np.column_stack([grouped.column(col).to_numpy(zero_copy_only=False) for col in MEASURE_COLUMNS]),
+    )
+
+
+def _duckdb_daily_totals(dataset, start_date, end_date):
+    import duckdb
+
+    measures = ", ".join(f'sum("{col}")' for col in MEASURE_COLUMNS)
+    placeholders = ", ".join("?" for _ in VALID_TRAFFIC_TYPES)
+    with duckdb.connect() as con:
+        con.register("facts", dataset)
+        grouped = con.execute(
+            f'SELECT date, "流量类型", {measures} FROM facts '
+            f'WHERE date BETWEEN ? AND ? AND "流量类型" IN ({placeholders}) GROUP BY date, "流量类型"',
+            [pd.Timestamp(start_date).to_pydatetime(), pd.Timestamp(end_date).to_pydatetime(), *VALID_TRAFFIC_TYPES]
+        ).fetchnumpy()
+    return (
+        pd.DatetimeIndex(grouped["date"]),
+        list(grouped["流量类型"]),
+        np.column_stack([grouped[f'sum("{col}")'] for col in MEASURE_COLUMNS]).astype("float64"),
+    )
+
+
+def query_daily_totals(days, store_dir=None, backend="arrow"):
+    # 一次按 (日期, 流量类型) 分组扫描，返回与 days 对齐的 (天数, 流量类型数, 3) 矩阵
+    totals = np.zeros((len(days), len(VALID_TRAFFIC_TYPES), len(FACT_MEASURES)))
+    if not len(days):
+        return totals
+    dataset = _window_dataset(days[0], days[-1], store_dir)
+    if dataset is None:
+        return totals
+    reader = _duckdb_daily_totals if backend == "duckdb" else _arrow_daily_totals
+    dates, traffic_types, values = reader(dataset, days[0], days[-1])
+    day_idx = days.get_indexer(dates.normalize())
+    type_idx = np.array([TOPOLOGY["type_index"][t] for t in traffic_types], dtype=np.int64)
+    keep = day_idx >= 0
+    totals[day_idx[keep], type_idx[keep]] = values[keep]
+    return totals
+
+
+# ===================== 2. 查询立方体 =====================
+def store_query_cube(store_dir=None, backend="arrow"):
+    # 只读取清单：日期索引 + 数据指纹（各日内容哈希）+ 聚合函数；事实库为空时返回None
+    manifest = read_manifest(store_dir)
+    if not manifest["days"]:
+        return None
+    digest = hashlib.sha1(json.dumps(manifest["days"], sort_keys=True).encode("utf-8")).hexdigest()
+    days = sorted(manifest["days"])
+    return {
+        "days": pd.DatetimeIndex(days),
+        "fingerprint": f"{backend}:{digest}",
+        # 与 days 对齐的各日分区内容哈希：日期区间结果缓存只取决于区间内各天的内容
+        "day_hashes": tuple(manifest["days"][day] for day in days),
+        "backend": backend,
+        "store_dir": store_dir,
+        "query": partial(query_type_totals, store_dir=store_dir, backend=backend),
+        "daily": partial(query_daily_totals, store_dir=store_dir, backend=backend),
+    }
+
+
+def is_query_cube(cube):
+    return cube is not None and "query" in cube
+
+
+# ===================== 3. 摘要 =====================
+def query_summary(cube):
+    # 与页面“数据摘要”相同的指标，只读取聚合结果
+    totals, counts = query_window(cube["days"][0], cube["days"][-1], cube["store_dir"], cube["backend"])
+    return {
+        "records": int(counts.sum()),
+        "traffic_types": int((counts > 0).sum()),
+        "exposure": float(totals[:, 0].sum()),
+        "sales": float(totals[:, 2].sum()),
+    }
+
+
+def query_traffic_summary(cube, start_date, end_date):
+    # 日期区间内按流量类型汇总（只读取聚合结果）
+    totals, counts = query_window(start_date, end_date, cube["store_dir"], cube["backend"])
+    present = counts > 0
+    return pd.DataFrame(
+        {
+            "曝光": totals[present, 0],
+            "点击": totals[present, 1],
+            "销量": totals[present, 2],
+            "记录数": counts[present],
+        },
+        index=pd.CategoricalIndex(
+            np.array(VALID_TRAFFIC_TYPES, dtype=object)[present], categories=VALID_TRAFFIC_TYPES, name="traffic_type"
+        ),
+    ).round(2)
+
+
+# ===================== 4. 明细分页与分块读取 =====================
+# 单线程扫描保证行顺序固定：同一区间的第N行在分页和导出中一致
+def count_window_rows(cube, start_date, end_date):
+    dataset = _window_dataset(start_date, end_date, cube["store_dir"])
+    if dataset is None:
+        return 0
+    return dataset.count_rows(filter=_window_filter(start_date, end_date))
+
+
+def iter_window_facts(cube, start_date, end_date, chunk_rows=DETAIL_CHUNK_ROWS):
+    # 逐批读取区间内的明细，每批转为紧凑事实表；内存占用只与批大小有关
+    dataset = _window_dataset(start_date, end_date, cube["store_dir"])
+    if dataset is None:
+        return
+    # 日分区文件各自成批，攒够 chunk_rows 行再转换
+    scanner = dataset.scanner(filter=_window_filter(start_date, end_date), batch_size=chunk_rows, use_threads=False)
+    pending, n_pending = [], 0
+    for batch in scanner.to_batches():
+        pending.append(batch)
+        n_pending += batch.num_rows
+        if n_pending >= chunk_rows:
+            yield build_fact_table(pa.Table.from_batches(pending).to_pandas())
+            pending, n_pending = [], 0
+    if n_pending:
+        yield build_fact_table(pa.Table.from_batches(pending).to_pandas())
+
+
+def window_facts_slice(cube, start_date, end_date, lo, hi):
+    # 区间内第 [lo, hi) 行明细：跳过之前的批次，只转换覆盖该范围的部分
+    parts, offset = [], 0
+    dataset = _window_dataset(start_date, end_date, cube["store_dir"])
+    if dataset is not None and hi > lo:
+        scanner = dataset.scanner(filter=_window_filter(start_date, end_date), use_threads=False)
+        for batch in scanner.to_batches():
+            if offset + batch.num_rows > lo:
+                parts.append(batch.slice(max(lo - offset, 0), min(hi, offset + batch.num_rows) - max(lo, offset)))
+            offset += batch.num_rows
+            if offset >= hi:
+                break
+    if not parts:
+        return empty_fact_table()
+    return build_fact_table(pa.Table.from_batches(parts).to_pandas())
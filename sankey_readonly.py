@@ -0,0 +1,34 @@
+# sankey_readonly.py
+# 只读化工具：数组转为只读视图、数据框按列重建在只读数组上，均不复制数据
+# 拓扑编译（sankey_topology）、静态表（sankey_core）和数据集登记表（sankey_registry）共用
+import numpy as np
+import pandas as pd
+
+
+def _readonly(array):
+    # 只读视图，不复制数据
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+def freeze_frame(df):
+    # 每列重建在只读数组上：原地写入（如 df.iloc[0, 2] = 0）直接报错，避免一个会话改动所有会话的数据
+    columns = {}
+    for col in df.columns:
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            columns[col] = pd.Categorical.from_codes(_readonly(values.cat.codes.to_numpy()), dtype=values.dtype)
+        else:
+            columns[col] = _readonly(values.to_numpy())
+    return pd.DataFrame(columns, index=df.index, copy=False)
+
+
+def freeze(value):
+    if isinstance(value, pd.DataFrame):
+        return freeze_frame(value)
+    if isinstance(value, np.ndarray):
+        return _readonly(value)
+    if isinstance(value, dict):
+        return {key: freeze(item) for key, item in value.items()}
+    return value
@@ -0,0 +1,147 @@
+# sankey_registry.py
+# 进程内共享的数据集登记表：同一内容（按内容哈希建键）只保留一份只读数据，各会话按引用共享
+# - 总内存预算（SANKEY_REGISTRY_MAX_MB），超出时按最近最少使用淘汰
+# - 每个数据集记录持有者（会话ID）集合作为引用计数，仍被会话使用的数据集不会被淘汰
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from sankey_readonly import freeze
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_MAX_BYTES = int(float(os.environ.get("SANKEY_REGISTRY_MAX_MB", "2048")) * 1024 * 1024)
+
+# 键 → {"value", "bytes", "holders", "loaded_at", "last_used", "hits"}，按最近使用排序
+_REGISTRY = OrderedDict()
+_PENDING = {}
+_REGISTRY_LOCK = threading.Lock()
+_REGISTRY_STATS = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+# ===================== 1. 内存统计 =====================
+def value_bytes(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, (np.ndarray, pd.Index)):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sum(value_bytes(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(value_bytes(item) for item in value)
+    return 0
+
+
+# ===================== 2. 登记与引用 =====================
+def _evict_locked():
+    # 从最久未使用的开始，只淘汰没有持有者的数据集
+    total = sum(entry["bytes"] for entry in _REGISTRY.values())
+    for key in list(_REGISTRY):
+        if total <= REGISTRY_MAX_BYTES:
+            return
+        entry = _REGISTRY[key]
+        if entry["holders"]:
+            continue
+        del _REGISTRY[key]
+        total -= entry["bytes"]
+        _REGISTRY_STATS["evictions"] += 1
+        logger.info(f"共享数据集超出内存预算，淘汰：{key}（{entry['bytes'] / 1024 / 1024:.1f} MB）")
+    if total > REGISTRY_MAX_BYTES:
+        logger.warning(f"使用中的共享数据集共 {total / 1024 / 1024:.1f} MB，超出内存预算 "
+                       f"{REGISTRY_MAX_BYTES / 1024 / 1024:.0f} MB")
+
+
+def acquire(key, load, holder=None):
+    # 命中时直接返回共享的数据；未命中时调用 load() 读取并只读化。同一键并发读取时只读取一次
+    # holder 不为None时登记为持有者，直到 release/release_holder
+    while True:
+        with _REGISTRY_LOCK:
+            entry = _REGISTRY.get(key)
+            if entry is not None:
+                _REGISTRY.move_to_end(key)
+                entry["last_used"] = time.time()
+                entry["hits"] += 1
+                _REGISTRY_STATS["hits"] += 1
+                if holder is not None:
+                    entry["holders"].add(holder)
+                return entry["value"]
+            event = _PENDING.get(key)
+            owner = event is None
+            if owner:
+                event = _PENDING[key] = threading.Event()
+                _REGISTRY_STATS["misses"] += 1
+        if owner:
+            break
+        # 其他会话正在读取同一数据集；读取失败时由本会话重新读取
+        event.wait()
+
+    try:
+        value = freeze(load())
+        now = time.time()
+        entry = {"value": value, "bytes": value_bytes(value), "holders": set() if holder is None else {holder},
+                 "loaded_at": now, "last_used": now, "hits": 0}
+        with _REGISTRY_LOCK:
+            _REGISTRY[key] = entry
+            _evict_locked()
+        logger.info(f"登记共享数据集：{key}（{entry['bytes'] / 1024 / 1024:.1f} MB）")
+        return value
+    finally:
+        with _REGISTRY_LOCK:
+            _PENDING.pop(key).set()
+
+
+def release(key, holder):
+    with _REGISTRY_LOCK:
+        entry = _REGISTRY.get(key)
+        if entry is not None:
+            entry["holders"].discard(holder)
+        _evict_locked()
+
+
+def release_holder(holder, keep=()):
+    # 持有者（会话）切换数据集后，释放 keep 以外的全部数据集
+    with _REGISTRY_LOCK:
+        for key, entry in _REGISTRY.items():
+            if key not in keep:
+                entry["holders"].discard(holder)
+        _evict_locked()
+
+
+def prune_holders(is_alive):
+    # 已结束的会话不会主动释放，按 is_alive(holder) 清理
+    with _REGISTRY_LOCK:
+        for entry in _REGISTRY.values():
+            entry["holders"] = {holder for holder in entry["holders"] if is_alive(holder)}
+        _evict_locked()
+
+
+# ===================== 3. 统计与清理 =====================
+def registry_stats():
+    with _REGISTRY_LOCK:
+        items = [
+            {"key": key, "bytes": entry["bytes"], "holders": len(entry["holders"]), "hits": entry["hits"],
+             "loaded_at": entry["loaded_at"], "last_used": entry["last_used"]}
+            for key, entry in reversed(_REGISTRY.items())
+        ]
+        return {
+            "entries": len(items),
+            "in_use": sum(item["holders"] > 0 for item in items),
+            "bytes": sum(item["bytes"] for item in items),
+            "max_bytes": REGISTRY_MAX_BYTES,
+            **_REGISTRY_STATS,
+            "items": items,
+        }
+
+
+def clear_registry():
+    # 只移除没有持有者的数据集，返回移除个数
+    with _REGISTRY_LOCK:
+        idle = [key for key, entry in _REGISTRY.items() if not entry["holders"]]
+        for key in idle:
+            del _REGISTRY[key]
+        return len(idle)
@@ -0,0 +1,203 @@
+# sankey_store.py
+# 增量事实库：按天分区保存 (date, 流量类型, 曝光, 点击, 销量) 日汇总
+# 新文件按 (日期, 流量类型) 合并进已有分区（其他流量类型保留），只写入内容有变化的日期，重复导入同一文件不产生任何改动
+# 用法：python sankey_store.py ingest 文件1.xlsx [文件2.csv ...] | stats | clear
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import uuid
+
+import pandas as pd
+
+from sankey_cache import write_arrow, read_arrow
+from sankey_core import build_fact_table, MEASURE_COLUMNS
+from sankey_io import load_sources, facts_to_daily, DAILY_KEYS
+
+logger = logging.getLogger(__name__)
+
+STORE_DIR = os.environ.get(
+    "SANKEY_STORE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".sankey_store")
+)
+MANIFEST_NAME = "manifest.json"
+PARTITION_SUFFIX = ".arrow"
+
+_STORE_LOCK = threading.Lock()
+
+
+# ===================== 1. 清单 =====================
+def _manifest_path(store_dir):
+    return os.path.join(store_dir, MANIFEST_NAME)
+
+
+def _partition_path(store_dir, day):
+    return os.path.join(store_dir, f"{day}{PARTITION_SUFFIX}")
+
+
+def read_manifest(store_dir=None):
+    # {"version": 递增版本号, "days": {"YYYY-MM-DD": 内容哈希}}
+    path = _manifest_path(store_dir or STORE_DIR)
+    if not os.path.exists(path):
+        return {"version": 0, "days": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_manifest(store_dir, manifest):
+    path = _manifest_path(store_dir)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def store_version(store_dir=None):
+    return read_manifest(store_dir)["version"]
+
+
+# ===================== 2. 按天哈希 =====================
+def day_hashes(daily):
+    # 每天的内容哈希（与行顺序无关）
+    if daily.empty:
+        return {}
+    daily = daily.sort_values(DAILY_KEYS, ignore_index=True)
+    row_hashes = pd.util.hash_pandas_object(daily[DAILY_KEYS + MEASURE_COLUMNS], index=False).to_numpy()
+    days = daily["date"].dt.strftime("%Y-%m-%d").to_numpy()
+    boundaries = [0] + list((days[1:] != days[:-1]).nonzero()[0] + 1) + [len(days)]
+    return {
+        days[lo]: hashlib.sha1(row_hashes[lo:hi].tobytes()).hexdigest()
+        for lo, hi in zip(boundaries[:-1], boundaries[1:])
+    }
+
+
+# ===================== 3. 增量导入 =====================
+def merge_day(stored, part):
+    # 同一天的已有分区与新数据按 (日期, 流量类型) 合并：重叠的流量类型以新数据为准（与 sankey_io.merge_facts 一致），其余保留
+    merged = pd.concat([stored, part], ignore_index=True)
+    return merged.drop_duplicates(DAILY_KEYS, keep="last").sort_values(DAILY_KEYS, ignore_index=True)
+
+
+def ingest_daily(daily, store_dir=None):
+    # 只写入新增或内容变化的日期分区；返回各类日期列表
+    store_dir = store_dir or STORE_DIR
+    hashes = day_hashes(daily)
+    report = {"added": [], "replaced": [], "unchanged": []}
+    if not hashes:
+        return report
+
+    day_labels = daily["date"].dt.strftime("%Y-%m-%d")
+    with _STORE_LOCK:
+        os.makedirs(store_dir, exist_ok=True)
+        manifest = read_manifest(store_dir)
+        changed = {}
+        for day, part in daily.groupby(day_labels, sort=True):
+            old = manifest["days"].get(day)
+            if old == hashes[day]:
+                report["unchanged"].append(day)
+                continue
+            if old:
+                part = merge_day(read_arrow(_partition_path(store_dir, day)), part)
+                digest = day_hashes(part)[day]
+                if digest == old:
+                    # 新数据是已有分区的子集且数值相同
+                    report["unchanged"].append(day)
+                    continue
+            else:
+                part, digest = part.reset_index(drop=True), hashes[day]
+            report["replaced" if old else "added"].append(day)
+            changed[day] = (part, digest)
+
+        for day, (part, digest) in changed.items():
+            write_arrow(_partition_path(store_dir, day), part)
+            manifest["days"][day] = digest
+        if changed:
+            manifest["version"] += 1
+            _write_manifest(store_dir, manifest)
+
+    logger.info(
+        f"增量导入完成：新增{len(report['added'])}天，更新{len(report['replaced'])}天，"
+        f"未变化{len(report['unchanged'])}天"
+    )
+    return report
+
+
+def ingest_sources(sources, streaming=None, store_dir=None, workers=None, progress=None, key=None):
+    # 多个文件（全部工作表）并行解析、合并去重后一次导入；返回 (导入报告, 各工作表解析报告)
+    # key 见 sankey_io.load_sources
+    facts, task_reports, _ = load_sources(sources, streaming, workers, progress, key=key)
+    return ingest_daily(facts_to_daily(facts), store_dir), task_reports
+
+
+def ingest_file(file_bytes, streaming=None, store_dir=None):
+    return ingest_sources([("", file_bytes)], streaming, store_dir)[0]
+
+
+# ===================== 4. 读取 =====================
+def load_daily_facts(store_dir=None, days=None):
+    store_dir = store_dir or STORE_DIR
+    manifest = read_manifest(store_dir)
+    selected = sorted(manifest["days"]) if days is None else sorted(set(days) & set(manifest["days"]))
+    parts = [read_arrow(_partition_path(store_dir, day)) for day in selected]
+    if not parts:
+        return pd.DataFrame(columns=DAILY_KEYS + MEASURE_COLUMNS)
+    return pd.concat(parts, ignore_index=True)
+
+
+def load_store_facts(store_dir=None):
+    return build_fact_table(load_daily_facts(store_dir))
+
+
+def partition_paths(days, store_dir=None):
+    # 指定日期（YYYY-MM-DD）中事实库已有的分区文件，供查询后端按日期裁剪分区
+    store_dir = store_dir or STORE_DIR
+    stored = read_manifest(store_dir)["days"]
+    return [_partition_path(store_dir, day) for day in sorted(set(days) & set(stored))]
+
+
+def clear_store(store_dir=None):
+    store_dir = store_dir or STORE_DIR
+    with _STORE_LOCK:
+        manifest = read_manifest(store_dir)
+        for day in manifest["days"]:
+            path = _partition_path(store_dir, day)
+            if os.path.exists(path):
+                os.remove(path)
+        if manifest["days"]:
+            _write_manifest(store_dir, {"version": manifest["version"] + 1, "days": {}})
+    logger.info(f"已清空增量事实库，天数：{len(manifest['days'])}")
+    return len(manifest["days"])
+
+
+def store_stats(store_dir=None):
+    manifest = read_manifest(store_dir)
+    days = sorted(manifest["days"])
+    return {
+        "days": len(days),
+        "first_day": days[0] if days else None,
+        "last_day": days[-1] if days else None,
+        "version": manifest["version"],
+    }
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    if command == "ingest" and len(sys.argv) > 2:
+        sources = []
+        for file_path in sys.argv[2:]:
+            with open(file_path, "rb") as f:
+                sources.append((file_path, f.read()))
+        result, _ = ingest_sources(sources)
+        print(f"新增{len(result['added'])}天，更新{len(result['replaced'])}天，未变化{len(result['unchanged'])}天")
+    elif command == "clear":
+        print(f"已清空天数：{clear_store()}")
+    elif command == "stats":
+        stats = store_stats()
+        print(f"事实库目录：{STORE_DIR}")
+        print(f"天数：{stats['days']}（{stats['first_day']} 至 {stats['last_day']}），版本：{stats['version']}")
+    else:
+        print("用法：python sankey_store.py ingest 文件 [文件 ...] | stats | clear")
+        sys.exit(1)
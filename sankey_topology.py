@@ -0,0 +1,205 @@
+# sankey_topology.py
+# 外部映射配置（JSON/YAML）的加载与编译
+# 编译结果为一次性计算好的拓扑：节点整数编号、每个站点的流量类型区间、链路→层/度量数组、曝光链路掩码
+import json
+import logging
+import os
+from types import MappingProxyType
+
+import numpy as np
+import pandas as pd
+
+from sankey_readonly import freeze
+
+logger = logging.getLogger(__name__)
+
+CONFIG_PATH = os.environ.get(
+    "SANKEY_TOPOLOGY_CONFIG",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "traffic_config.json")
+)
+
+# ===================== 1. 拓扑常量 =====================
+TOTAL_NODES = ["总曝光", "总点击", "总销量"]
+TOTAL_COLOR_KEY = "总节点"
+# 层号即节点在桑基图中的列：流量类型 → 曝光 → 二级曝光 → 总曝光 → 点击 → ... → 总销量
+LAYER_KEYS = [
+    "traffic_type", "exposure", "level2_exposure", "总曝光",
+    "click", "level2_click", "总点击",
+    "sales", "level2_sales", "总销量",
+]
+# 每个流量类型的9条链路：(源层, 目标层, 度量编号 0=曝光 1=点击 2=销量)
+EDGE_TEMPLATES = [
+    ("traffic_type", "exposure", 0),
+    ("exposure", "level2_exposure", 0),
+    ("level2_exposure", "总曝光", 0),
+    ("总曝光", "click", 1),
+    ("click", "level2_click", 1),
+    ("level2_click", "总点击", 1),
+    ("总点击", "sales", 2),
+    ("sales", "level2_sales", 2),
+    ("level2_sales", "总销量", 2),
+]
+# 节点所属度量（用于占比），流量类型节点和总节点为 -1
+LAYER_MEASURES = {"exposure": 0, "level2_exposure": 0, "click": 1, "level2_click": 1, "sales": 2, "level2_sales": 2}
+# 每个流量类型"自身"的节点（搜索高亮时一起点亮），不含总节点
+TYPE_NODE_KEYS = ["traffic_type", "exposure", "click", "sales", "level2_exposure", "level2_click", "level2_sales"]
+
+
+# ===================== 2. 配置加载 =====================
+def load_config(path=None):
+    # 按扩展名选择解析器；YAML为可选依赖
+    path = path or CONFIG_PATH
+    with open(path, encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError as e:
+                raise ImportError(f"读取YAML配置需要安装PyYAML：{path}") from e
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+# ===================== 3. 编译 =====================
+def _ordered_types(config):
+    # 先按traffic_order，再补充映射中其余类型；按站点顺序稳定排序，使每个站点的类型编号连续
+    mapping = config["traffic_mapping"]
+    sites = config["sites"]
+    order = list(dict.fromkeys(t for t in config.get("traffic_order", []) if t in mapping))
+    listed = set(order)
+    order += [t for t in mapping if t not in listed]
+    valid = []
+    for traffic_type in order:
+        if mapping[traffic_type]["site"] in sites:
+            valid.append(traffic_type)
+        else:
+            logger.warning(f"非法站点：{mapping[traffic_type]['site']}（流量类型：{traffic_type}，不参与拓扑）")
+    site_rank = {site: rank for rank, site in enumerate(sites)}
+    return sorted(valid, key=lambda t: site_rank[mapping[t]["site"]])
+
+
+def _node_color(node, layer, traffic_type, config, group_colors):
+    # 流量类型自身节点取所属组颜色，二级/总节点取名称中包含的站点颜色
+    if layer in ("traffic_type", "exposure", "click", "sales"):
+        return group_colors[config["traffic_mapping"][traffic_type]["group_id"]]
+    if traffic_type is not None and config["traffic_mapping"][traffic_type]["site"] in node:
+        return group_colors[config["traffic_mapping"][traffic_type]["site"]]
+    site = next((site for site in config["sites"] if site in node), TOTAL_COLOR_KEY)
+    return group_colors.get(site, "lightgray")
+
+
+def compile_topology(config):
+    mapping = config["traffic_mapping"]
+    sites = config["sites"]
+    group_colors = {
+        **config.get("group_colors", {}),
+        **{site: cfg["color"] for site, cfg in sites.items()},
+        TOTAL_COLOR_KEY: config.get("total_color", "lightgray"),
+    }
+    traffic_types = _ordered_types(config)
+    type_index = {t: code for code, t in enumerate(traffic_types)}
+
+    def node_name(traffic_type, key):
+        if key == "traffic_type":
+            return traffic_type
+        return mapping[traffic_type]["nodes"].get(key, key)
+
+    # 节点布局：站点按配置顺序自上而下；第一个站点之后插入总曝光/总点击，总销量放在最后
+    nodes, node_layer, node_type = [], [], []
+    node_index = {}
+
+    def add_node(name, layer, traffic_type):
+        if name not in node_index:
+            node_index[name] = len(nodes)
+            nodes.append(name)
+            node_layer.append(LAYER_KEYS.index(layer))
+            node_type.append(traffic_type)
+
+    # 类型已按站点排序，每个站点对应一段连续的类型编号
+    site_type_ranges = {}
+    for code, traffic_type in enumerate(traffic_types):
+        site = mapping[traffic_type]["site"]
+        lo = site_type_ranges.get(site, (code, code))[0]
+        site_type_ranges[site] = (lo, code + 1)
+    for site, (lo, hi) in site_type_ranges.items():
+        site_types = traffic_types[lo:hi]
+        first_site = lo == 0
+        for layers, total in [
+            (["traffic_type", "exposure", "level2_exposure"], "总曝光"),
+            (["click", "level2_click"], "总点击"),
+            (["sales", "level2_sales"], None),
+        ]:
+            for layer in layers:
+                for traffic_type in site_types:
+                    add_node(node_name(traffic_type, layer), layer, traffic_type)
+            if first_site and total:
+                add_node(total, total, None)
+    for total in TOTAL_NODES:
+        add_node(total, total, None)
+
+    n_types, n_edges = len(traffic_types), len(EDGE_TEMPLATES)
+    edge_source = np.array(
+        [[node_index[node_name(t, src)] for src, _, _ in EDGE_TEMPLATES] for t in traffic_types], dtype=np.int64
+    ).reshape(n_types, n_edges)
+    edge_target = np.array(
+        [[node_index[node_name(t, tgt)] for _, tgt, _ in EDGE_TEMPLATES] for t in traffic_types], dtype=np.int64
+    ).reshape(n_types, n_edges)
+    edge_measure = np.array([measure for _, _, measure in EDGE_TEMPLATES], dtype=np.int64)
+    type_groups = np.array([mapping[t]["group_id"] for t in traffic_types], dtype=object)
+    type_nodes = np.array(
+        [[node_index[node_name(t, key)] for key in TYPE_NODE_KEYS] for t in traffic_types], dtype=np.int64
+    ).reshape(n_types, len(TYPE_NODE_KEYS))
+
+    node_names = np.array(nodes, dtype=object)
+    node_layer = np.array(node_layer, dtype=np.int64)
+    node_measure = np.array(
+        [LAYER_MEASURES.get(LAYER_KEYS[layer], -1) for layer in node_layer], dtype=np.int64
+    )
+    node_colors = np.array(
+        [_node_color(node, LAYER_KEYS[layer], t, config, group_colors)
+         for node, layer, t in zip(nodes, node_layer, node_type)], dtype=object
+    )
+
+    # 全部 (流量类型, 链路模板) 组合，按 (源, 目标, 组, 流量类型) 名称排序，与 groupby 输出顺序一致
+    edges = pd.DataFrame({
+        "source": node_names[edge_source.ravel()],
+        "target": node_names[edge_target.ravel()],
+        "group": np.repeat(type_groups, n_edges),
+        "traffic_type": np.repeat(np.array(traffic_types, dtype=object), n_edges),
+        "source_id": edge_source.ravel(),
+        "target_id": edge_target.ravel(),
+        "type_code": np.repeat(np.arange(n_types), n_edges),
+        "measure": np.tile(edge_measure, n_types),
+        "layer": np.tile(np.arange(n_edges), n_types),
+    })
+    edges["is_exposure"] = edges["measure"].to_numpy() == 0
+    edges = edges.sort_values(["source", "target", "group", "traffic_type"], ignore_index=True)
+
+    return {
+        "traffic_types": traffic_types,
+        "type_index": type_index,
+        "type_groups": type_groups,
+        "type_nodes": type_nodes,
+        "site_type_ranges": site_type_ranges,
+        "nodes": nodes,
+        "node_names": node_names,
+        "node_index": node_index,
+        "node_layer": node_layer,
+        "node_measure": node_measure,
+        "node_colors": node_colors,
+        "total_ids": np.array([node_index[node] for node in TOTAL_NODES], dtype=np.int64),
+        "edge_source": edge_source,
+        "edge_target": edge_target,
+        "edge_measure": edge_measure,
+        "edges": edges,
+        "group_colors": group_colors,
+    }
+
+
+# ===================== 4. 只读化 =====================
+def freeze_topology(value):
+    # 编译结果在进程内只构建一次、被所有会话共享：数组只读，字典/列表转为只读映射/元组，误改直接报错
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze_topology(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze_topology(item) for item in value)
+    return freeze(value)
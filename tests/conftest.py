@@ -0,0 +1,23 @@
+# conftest.py
+# 共用的小数据集：2026-01-05 至 2026-01-18 每天每个流量类型一行，第 i 个类型曝光为 1000·(i+1)²，点击/销量逐级为1/10
+import pandas as pd
+import pytest
+
+from sankey_core import MEASURE_COLUMNS, VALID_TRAFFIC_TYPES, build_daily_cube, build_fact_table, prepare_dates
+
+DAYS = pd.date_range("2026-01-05", "2026-01-18", freq="D")
+
+
+@pytest.fixture(scope="session")
+def facts():
+    rows = []
+    for day in DAYS:
+        for i, traffic_type in enumerate(VALID_TRAFFIC_TYPES):
+            exposure = 1000.0 * (i + 1) ** 2
+            rows.append([f"{day:%Y-%m-%d}", traffic_type, exposure, exposure / 10, exposure / 100])
+    return build_fact_table(prepare_dates(pd.DataFrame(rows, columns=["时间", "流量类型"] + MEASURE_COLUMNS)))
+
+
+@pytest.fixture(scope="session")
+def cube(facts):
+    return build_daily_cube(facts)
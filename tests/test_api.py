@@ -0,0 +1,77 @@
+# test_api.py
+# HTTP接口：ETag/304、参数校验（非有限数值、无法解析的参数返回400）、开始晚于结束时交换
+# 用法：python -m pytest tests
+import json
+import threading
+import urllib.error
+import urllib.request
+from urllib.parse import urlencode
+
+import pytest
+
+from sankey_api import dataset_from_facts, make_server, parse_params
+
+
+@pytest.fixture(scope="module")
+def base_url(facts):
+    server = make_server(dataset_from_facts(facts), port=0, workers=2)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def get(url, **headers):
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers)) as response:
+            return response.status, response.headers, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+def sankey_url(base_url, **params):
+    return f"{base_url}/sankey?{urlencode(params)}"
+
+
+def test_etag_revalidation_returns_304(base_url):
+    url = sankey_url(base_url, start="2026-01-06", end="2026-01-10", q="dsp")
+    status, headers, body = get(url)
+    assert status == 200
+    payload = json.loads(body)
+    assert payload["start"] == "2026-01-06" and payload["end"] == "2026-01-10"
+    assert len(payload["links"]["value"]) > 0
+
+    status, headers_304, body = get(url, **{"If-None-Match": headers["ETag"]})
+    assert status == 304 and body == b""
+    assert headers_304["ETag"] == headers["ETag"]
+
+    status, _, _ = get(sankey_url(base_url, start="2026-01-06", end="2026-01-11", q="dsp"),
+                       **{"If-None-Match": headers["ETag"]})
+    assert status == 200
+
+
+def test_swapped_dates_share_etag(base_url):
+    _, forward, _ = get(sankey_url(base_url, start="2026-01-06", end="2026-01-10"))
+    _, backward, _ = get(sankey_url(base_url, start="2026-01-10", end="2026-01-06"))
+    assert forward["ETag"] == backward["ETag"]
+
+
+@pytest.mark.parametrize("params", [
+    {"min_share": "inf"},
+    {"exposure_scale": "nan"},
+    {"later_scale": "-inf"},
+    {"exposure_scale": "abc"},
+    {"start": "not-a-date"},
+])
+def test_invalid_params_return_400(base_url, params):
+    status, _, body = get(sankey_url(base_url, **params))
+    assert status == 400
+    assert "error" in json.loads(body)
+
+
+def test_parse_params_defaults_to_data_range(cube):
+    params = parse_params({}, cube)
+    assert params["start"] == cube["days"][0] and params["end"] == cube["days"][-1]
+    assert params["min_share"] == 0.0
+    with pytest.raises(ValueError):
+        parse_params({"min_share": ["inf"]}, cube)
@@ -0,0 +1,42 @@
+# test_funnel.py
+# 漏斗时间序列：日期区间与数据无交集时返回空漏斗
+# 用法：python -m pytest tests
+import pandas as pd
+import pytest
+
+from sankey_core import (
+    MEASURE_COLUMNS, VALID_TRAFFIC_TYPES, build_daily_cube, build_fact_table, compute_funnel, compute_rollups,
+    funnel_frame, prepare_dates,
+)
+
+
+@pytest.fixture(scope="module")
+def rollups():
+    # 2026-01-07（周三）至 2026-02-10，每天每个流量类型一行
+    days = pd.date_range("2026-01-07", "2026-02-10", freq="D")
+    df = pd.DataFrame({
+        "时间": [day.strftime("%Y-%m-%d") for day in days for _ in VALID_TRAFFIC_TYPES],
+        "流量类型": list(VALID_TRAFFIC_TYPES) * len(days),
+        **{col: 10.0 for col in MEASURE_COLUMNS},
+    })
+    return compute_rollups(build_daily_cube(build_fact_table(prepare_dates(df))))
+
+
+@pytest.mark.parametrize("freq", ["D", "W", "M"])
+@pytest.mark.parametrize("by", ["traffic_type", "site"])
+@pytest.mark.parametrize("start, end", [
+    ("2026-02-11", "2026-03-31"),  # 开始日晚于数据最后一天
+    ("2025-12-01", "2026-01-06"),  # 结束日早于数据第一天（含数据首日所在的自然周/月）
+])
+def test_window_outside_data_is_empty(rollups, freq, by, start, end):
+    funnel = compute_funnel(rollups, freq, start, end, by=by)
+    assert len(funnel["periods"]) == 0
+    assert funnel["totals"].shape == (0, len(funnel["names"]), len(MEASURE_COLUMNS))
+    assert funnel["CTR"].shape == funnel["CVR"].shape == (0, len(funnel["names"]))
+    assert funnel_frame(funnel).empty
+
+
+@pytest.mark.parametrize("freq", ["D", "W", "M"])
+def test_window_from_last_day_keeps_last_period(rollups, freq):
+    funnel = compute_funnel(rollups, freq, "2026-02-10", "2026-03-31")
+    assert list(funnel["periods"]) == [rollups[freq]["periods"][-1]]
@@ -0,0 +1,48 @@
+# test_io.py
+# 读取：注音文本不并入单元格内容；CSV 表头两侧空白与 xlsx 一样忽略
+# 用法：python -m pytest tests
+import io
+import zipfile
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from sankey_io import SOURCE_COLUMNS, iter_chunks, read_table
+
+HEADER = ["时间", "流量类型", "曝光", "点击", "销量"]
+
+
+def phonetic_workbook():
+    # openpyxl 写入内联字符串；把流量类型改为富文本两段 + 注音 <rPh>
+    workbook = Workbook()
+    workbook.active.append(HEADER)
+    workbook.active.append(["2026-01-05", "Amazon-DSP", 1, 2, 3])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    output = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(buffer.getvalue())) as source, zipfile.ZipFile(output, "w") as target:
+        for item in source.infolist():
+            data = source.read(item.filename)
+            if item.filename == "xl/worksheets/sheet1.xml":
+                data = data.replace(
+                    b"<is><t>Amazon-DSP</t></is>",
+                    b'<is><r><t>Amazon-</t></r><r><t>DSP</t></r><rPh sb="0" eb="1"><t>X</t></rPh></is>',
+                )
+            target.writestr(item, data)
+    return output.getvalue()
+
+
+@pytest.mark.parametrize("engine", ["openpyxl", "xml"])
+def test_phonetic_runs_are_not_cell_text(engine):
+    df = read_table(phonetic_workbook(), engine=engine)
+    assert df["流量类型"].tolist() == ["Amazon-DSP"]
+
+
+def test_csv_header_whitespace_is_ignored():
+    csv = " 时间 ,流量类型 ,曝光,点击,销量,其他\n2026-01-05,Amazon-DSP,1,2,-,x\n".encode("utf-8")
+    df = read_table(csv)
+    chunks = list(iter_chunks(csv))
+    assert list(df.columns) == list(chunks[0].columns) == SOURCE_COLUMNS
+    assert df["流量类型"].tolist() == chunks[0]["流量类型"].tolist() == ["Amazon-DSP"]
+    assert pd.isna(df.loc[0, "销量"])
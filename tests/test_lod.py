@@ -0,0 +1,43 @@
+# test_lod.py
+# 小链路折叠（fold_small_links）：总量守恒，阈值为0时不折叠，分组内只有一个小类型时保留原样
+# 用法：python -m pytest tests
+import numpy as np
+import pytest
+
+from sankey_core import TYPE_FOLD_GROUPS, aggregate_range, fold_small_links
+
+from conftest import DAYS
+
+
+@pytest.fixture(scope="module")
+def aggregated_df(cube):
+    return aggregate_range(cube, DAYS[0], DAYS[-1])
+
+
+def inflow(df, node):
+    return df.loc[df["target"] == node, "value"].sum()
+
+
+def test_zero_share_folds_nothing(aggregated_df):
+    folded_df, node_ids, folded = fold_small_links(aggregated_df, 0)
+    assert not folded.any()
+    assert len(folded_df) == len(aggregated_df)
+    assert "其他" not in set(folded_df["traffic_type"])
+
+
+@pytest.mark.parametrize("min_share", [30, 60])
+def test_folding_keeps_totals(aggregated_df, min_share):
+    folded_df, node_ids, folded = fold_small_links(aggregated_df, min_share)
+    assert folded.any()
+    assert (folded_df["traffic_type"] == "其他").any()
+    assert folded_df["value"].sum() == pytest.approx(aggregated_df["value"].sum())
+    for node in ("总曝光", "总点击", "总销量"):
+        assert inflow(folded_df, node) == pytest.approx(inflow(aggregated_df, node))
+    # 节点编号为保留节点中的位置
+    assert folded_df[["source_id", "target_id"]].to_numpy().max() < len(node_ids)
+
+
+def test_single_small_type_is_not_folded(aggregated_df):
+    _, _, folded = fold_small_links(aggregated_df, 30)
+    counts = np.bincount(TYPE_FOLD_GROUPS[folded])
+    assert (counts[counts > 0] > 1).all()
@@ -0,0 +1,96 @@
+# test_registry.py
+# 共享数据集登记表：超出内存预算按LRU淘汰、有持有者的数据集不淘汰、数据只读、并发读取只加载一次
+# 用法：python -m pytest tests
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import sankey_registry
+from sankey_registry import acquire, registry_stats, release, release_holder
+
+ARRAY_BYTES = 8000  # 1000 个 float64
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    # 每个测试使用空的登记表，预算为两个半数据集
+    monkeypatch.setattr(sankey_registry, "_REGISTRY", OrderedDict())
+    monkeypatch.setattr(sankey_registry, "_PENDING", {})
+    monkeypatch.setattr(sankey_registry, "_REGISTRY_STATS", {"hits": 0, "misses": 0, "evictions": 0})
+    monkeypatch.setattr(sankey_registry, "REGISTRY_MAX_BYTES", int(ARRAY_BYTES * 2.5))
+
+
+def load_array():
+    return np.zeros(1000)
+
+
+def keys():
+    return sorted(item["key"] for item in registry_stats()["items"])
+
+
+def test_over_budget_evicts_least_recently_used():
+    acquire("a", load_array)
+    acquire("b", load_array)
+    acquire("a", load_array)  # a 变为最近使用
+    acquire("c", load_array)
+    assert keys() == ["a", "c"]
+    stats = registry_stats()
+    assert stats["evictions"] == 1 and stats["hits"] == 1 and stats["misses"] == 3
+    assert stats["bytes"] <= stats["max_bytes"]
+
+
+def test_held_dataset_is_not_evicted_until_released():
+    acquire("a", load_array, holder="session-1")
+    acquire("b", load_array)
+    acquire("c", load_array)
+    assert keys() == ["a", "c"]
+
+    release_holder("session-1")
+    assert keys() == ["a", "c"]  # 已在预算内，释放本身不淘汰
+    acquire("d", load_array)
+    assert keys() == ["c", "d"]
+
+
+def test_release_keeps_other_holders():
+    acquire("a", load_array, holder="session-1")
+    acquire("a", load_array, holder="session-2")
+    release("a", "session-1")
+    acquire("b", load_array)
+    acquire("c", load_array)
+    assert "a" in keys()
+
+
+def test_values_are_read_only():
+    frame = acquire("frame", lambda: pd.DataFrame({
+        "value": np.arange(3.0),
+        "traffic_type": pd.Categorical(["x", "y", "x"]),
+    }))
+    array = acquire("array", load_array)
+    with pytest.raises(ValueError):
+        array[0] = 1.0
+    with pytest.raises(ValueError):
+        frame.iloc[0, 0] = 1.0
+    assert not frame["value"].to_numpy().flags.writeable
+    assert not frame["traffic_type"].cat.codes.to_numpy().flags.writeable
+
+
+def test_concurrent_acquire_loads_once():
+    calls = []
+
+    def slow_load():
+        calls.append(1)
+        time.sleep(0.05)
+        return load_array()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(acquire("a", slow_load))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
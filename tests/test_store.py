@@ -0,0 +1,80 @@
+# test_store.py
+# 增量事实库：不同来源覆盖同一批日期时按 (日期, 流量类型) 合并，不丢失已有站点的数据
+# 用法：python -m pytest tests
+import pandas as pd
+import pytest
+
+from sankey_config import TRAFFIC_MAPPING
+from sankey_core import MEASURE_COLUMNS, VALID_TRAFFIC_TYPES, range_fingerprint
+from sankey_io import DAILY_KEYS
+from sankey_query import store_query_cube
+from sankey_store import ingest_daily, load_daily_facts, read_manifest
+
+DAYS = pd.date_range("2026-01-05", "2026-01-09", freq="D")
+
+
+def site_types(site):
+    return [t for t in VALID_TRAFFIC_TYPES if TRAFFIC_MAPPING[t]["site"] == site]
+
+
+def daily_frame(traffic_types, days=DAYS, value=10.0):
+    return pd.DataFrame({
+        "date": [day for day in days for _ in traffic_types],
+        "流量类型": list(traffic_types) * len(days),
+        **{col: value for col in MEASURE_COLUMNS},
+    })
+
+
+def stored(store_dir):
+    return load_daily_facts(store_dir).sort_values(DAILY_KEYS, ignore_index=True)
+
+
+@pytest.fixture
+def store_dir(tmp_path):
+    return str(tmp_path / "store")
+
+
+def test_overlapping_sources_keep_both_sites(store_dir):
+    amazon, shopify = site_types("Amazon-US"), site_types("Shopify")
+    first = ingest_daily(daily_frame(amazon), store_dir)
+    second = ingest_daily(daily_frame(shopify, value=20.0), store_dir)
+    assert len(first["added"]) == len(second["replaced"]) == len(DAYS)
+
+    facts = stored(store_dir)
+    assert set(facts["流量类型"]) == set(amazon) | set(shopify)
+    assert len(facts) == len(DAYS) * (len(amazon) + len(shopify))
+    by_type = facts.groupby("流量类型")["曝光"].sum()
+    assert (by_type[amazon] == 10.0 * len(DAYS)).all()
+    assert (by_type[shopify] == 20.0 * len(DAYS)).all()
+
+
+def test_overlapping_traffic_type_last_source_wins(store_dir):
+    amazon = site_types("Amazon-US")
+    ingest_daily(daily_frame(amazon), store_dir)
+    report = ingest_daily(daily_frame(amazon[:1], days=DAYS[:2], value=99.0), store_dir)
+    assert report["replaced"] == [f"{day:%Y-%m-%d}" for day in DAYS[:2]]
+
+    facts = stored(store_dir).set_index(DAILY_KEYS)["曝光"]
+    assert facts[(DAYS[0], amazon[0])] == 99.0
+    assert facts[(DAYS[2], amazon[0])] == 10.0
+    assert facts[(DAYS[0], amazon[1])] == 10.0
+
+
+def test_reingest_and_subset_leave_store_unchanged(store_dir):
+    both = site_types("Amazon-US") + site_types("Shopify")
+    ingest_daily(daily_frame(both), store_dir)
+    manifest = read_manifest(store_dir)
+    assert len(ingest_daily(daily_frame(both), store_dir)["unchanged"]) == len(DAYS)
+    assert len(ingest_daily(daily_frame(both[:1]), store_dir)["unchanged"]) == len(DAYS)
+    assert read_manifest(store_dir) == manifest
+
+
+def test_range_fingerprint_ignores_other_days(store_dir):
+    amazon = site_types("Amazon-US")
+    ingest_daily(daily_frame(amazon), store_dir)
+    before = store_query_cube(store_dir)
+    ingest_daily(daily_frame(amazon[:1], days=DAYS[-1:], value=99.0), store_dir)
+    after = store_query_cube(store_dir)
+    assert before["fingerprint"] != after["fingerprint"]
+    assert range_fingerprint(before, DAYS[0], DAYS[-2]) == range_fingerprint(after, DAYS[0], DAYS[-2])
+    assert range_fingerprint(before, DAYS[0], DAYS[-1]) != range_fingerprint(after, DAYS[0], DAYS[-1])